@@ -0,0 +1,44 @@
+"""Benchmark converting values passed to and from foreign (Python) functions
+
+Compares copying (to_py_type, the default) with lazy views (to_py_view, used
+with HARK_FOREIGN_VIEWS=1), for a function that returns its argument, and one
+that only looks at part of it.
+
+Usage: python scripts/bench_foreign.py [N...]
+"""
+import sys
+import time
+
+from hark_lang.machine import types as mt
+
+FUNCTIONS = {
+    "identity": lambda x: x,
+    "first": lambda x: x[0],
+}
+
+CONVERSIONS = {
+    "copy": mt.to_py_type,
+    "view": mt.to_py_view,
+}
+
+
+def bench(fn, to_py, value, repeat=5):
+    """Convert VALUE, call FN on it and convert back, returning the mean seconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        mt.to_hark_type(fn(to_py(value)))
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [1000, 10000, 100000]
+    print(f"{'N':>8}  {'function':>8}  {'copy ms':>8}  {'view ms':>8}")
+    for n in sizes:
+        value = mt.to_hark_type(list(range(n)))
+        for fn_name, fn in FUNCTIONS.items():
+            times = [bench(fn, to_py, value) for to_py in CONVERSIONS.values()]
+            print(f"{n:>8}  {fn_name:>8}  {1e3 * times[0]:>8.2f}  {1e3 * times[1]:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
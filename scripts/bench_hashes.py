@@ -0,0 +1,56 @@
+"""Benchmark building a large hash in Hark
+
+Sets N keys, one at a time, which should scale as O(N log N).
+
+Usage: python scripts/bench_hashes.py [N...]
+"""
+import sys
+import time
+
+from hark_lang.controllers.local import DataController
+from hark_lang.executors.thread import Invoker
+from hark_lang.load import compile_text
+from hark_lang.machine import types as mt
+from hark_lang.machine.machine import TlMachine
+
+SRC = """
+fn build(n, acc) {
+  if n == 0 {
+    acc
+  } else {
+    build(n - 1, set(acc, n, n * 2))
+  }
+}
+
+fn main(n) {
+  h = build(parse_float(n), hash());
+  get(h, 1)
+}
+"""
+
+
+def bench(exe, n):
+    """Run main(n) in one machine, returning (result, seconds)"""
+    controller = DataController()
+    controller.set_executable(exe)
+    invoker = Invoker(controller)
+    vmid = controller.toplevel_machine(exe.bindings["main"], [mt.TlString(str(n))])
+    machine = TlMachine(vmid, invoker, probe_level="off")
+    start = time.perf_counter()
+    machine.run()
+    duration = time.perf_counter() - start
+    return controller.result, duration
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [10000, 30000, 100000]
+    exe = compile_text(SRC)
+    print(f"{'N':>8}  {'seconds':>8}  {'us/element':>10}")
+    for n in sizes:
+        result, duration = bench(exe, n)
+        assert int(result) == 2, result
+        print(f"{n:>8}  {duration:>8.2f}  {1e6 * duration / n:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Benchmark list-heavy Hark code on large lists
+
+Builds a list of N elements with append, then maps over it with the usual
+first/rest/append tail-recursive loop. Then appends to an older (shared)
+version of the list N times, and concatenates N small lists onto it. Every loop
+should scale roughly linearly with N.
+
+Usage: python scripts/bench_lists.py [N...]
+"""
+import sys
+import time
+
+from hark_lang.controllers.local import DataController
+from hark_lang.executors.thread import Invoker
+from hark_lang.load import compile_text
+from hark_lang.machine import types as mt
+from hark_lang.machine.machine import TlMachine
+
+SRC = """
+fn build(n, acc) {
+  if n == 0 {
+    acc
+  } else {
+    build(n - 1, append(acc, n))
+  }
+}
+
+fn map_tr(items, acc) {
+  if nullp(items) {
+    acc
+  } else {
+    map_tr(rest(items), append(acc, first(items) * 2))
+  }
+}
+
+fn branch(n, base, acc) {
+  if n == 0 {
+    acc
+  } else {
+    branch(n - 1, base, length(append(base, n)) + acc)
+  }
+}
+
+fn conc_tr(n, acc) {
+  if n == 0 {
+    acc
+  } else {
+    conc_tr(n - 1, conc(acc, [n]))
+  }
+}
+
+fn main(n) {
+  items = build(parse_float(n), []);
+  mapped = length(map_tr(items, []));
+  branched = branch(parse_float(n), items, 0);
+  concd = length(conc_tr(parse_float(n), items));
+  [mapped, branched, concd]
+}
+"""
+
+
+def bench(exe, n):
+    """Run main(n) in one machine, returning (result, seconds)"""
+    controller = DataController()
+    controller.set_executable(exe)
+    invoker = Invoker(controller)
+    vmid = controller.toplevel_machine(exe.bindings["main"], [mt.TlString(str(n))])
+    machine = TlMachine(vmid, invoker, probe_level="off")
+    start = time.perf_counter()
+    machine.run()
+    duration = time.perf_counter() - start
+    return controller.result, duration
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [10000, 30000, 100000]
+    exe = compile_text(SRC)
+    print(f"{'N':>8}  {'seconds':>8}  {'us/element':>10}")
+    for n in sizes:
+        result, duration = bench(exe, n)
+        assert [int(x) for x in result] == [n, n * (n + 1), 2 * n], result
+        print(f"{n:>8}  {duration:>8.2f}  {1e6 * duration / n:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Measure the memory used by Hark programs
+
+Runs a deep (non-tail) recursion, and builds a large list, in one machine, and
+reports the peak memory allocated while doing so (using tracemalloc).
+
+Usage: python scripts/bench_memory.py [N...]
+"""
+import sys
+import time
+import tracemalloc
+
+from hark_lang.controllers.local import DataController
+from hark_lang.executors.thread import Invoker
+from hark_lang.load import compile_text
+from hark_lang.machine import types as mt
+from hark_lang.machine.machine import TlMachine
+
+SRC = """
+fn depth(n) {
+  if n == 0 {
+    0
+  } else {
+    1 + depth(n - 1)
+  }
+}
+
+fn build(n, acc) {
+  if n == 0 {
+    acc
+  } else {
+    build(n - 1, append(acc, n))
+  }
+}
+
+fn recursion(n) {
+  depth(parse_float(n))
+}
+
+fn large_list(n) {
+  length(build(parse_float(n), []))
+}
+"""
+
+
+def bench(exe, fn_name, n):
+    """Run FN_NAME(n) in one machine, returning (result, peak MB, seconds)"""
+    controller = DataController()
+    controller.set_executable(exe)
+    invoker = Invoker(controller)
+    vmid = controller.toplevel_machine(exe.bindings[fn_name], [mt.TlString(str(n))])
+    machine = TlMachine(vmid, invoker, probe_level="off")
+    tracemalloc.start()
+    start = time.perf_counter()
+    machine.run()
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return controller.result, peak / 1e6, duration
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [10000, 100000]
+    exe = compile_text(SRC)
+    print(f"{'workload':>10}  {'N':>8}  {'peak MB':>8}  {'bytes/N':>8}  {'seconds':>8}")
+    for fn_name in ("recursion", "large_list"):
+        for n in sizes:
+            result, peak, duration = bench(exe, fn_name, n)
+            assert int(result) == n, result
+            print(
+                f"{fn_name:>10}  {n:>8}  {peak:>8.1f}  {1e6 * peak / n:>8.0f}  {duration:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
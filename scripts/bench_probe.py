@@ -0,0 +1,52 @@
+"""Benchmark machine steps/sec at each probe level
+
+Usage: python scripts/bench_probe.py [N]
+"""
+import sys
+import time
+
+from hark_lang.controllers.local import DataController
+from hark_lang.executors.thread import Invoker
+from hark_lang.load import compile_text
+from hark_lang.machine import types as mt
+from hark_lang.machine.machine import TlMachine
+from hark_lang.machine.probe import PROBE_LEVELS
+
+SRC = """
+fn loop(n, acc) {
+  if n == 0 {
+    acc
+  } else {
+    loop(n - 1, acc + n)
+  }
+}
+
+fn main(n) {
+  loop(parse_float(n), 0)
+}
+"""
+
+
+def bench(exe, level, n):
+    """Run main(n) in one machine, returning (steps, seconds)"""
+    controller = DataController()
+    controller.set_executable(exe)
+    invoker = Invoker(controller)
+    vmid = controller.toplevel_machine(exe.bindings["main"], [mt.TlString(str(n))])
+    machine = TlMachine(vmid, invoker, probe_level=level)
+    start = time.perf_counter()
+    machine.run()
+    return machine._steps, time.perf_counter() - start
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    exe = compile_text(SRC)
+    print(f"{'level':>8}  {'steps':>8}  {'steps/sec':>10}")
+    for level in PROBE_LEVELS:
+        steps, duration = bench(exe, level, n)
+        print(f"{level:>8}  {steps:>8}  {steps / duration:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
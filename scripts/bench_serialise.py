@@ -0,0 +1,100 @@
+"""Compare the JSON and binary (machine.codec) serialisation formats
+
+Round-trips a machine State (with a large data stack), an ActivationRecord, a
+resolved Future and an Executable, through each format, and reports the time
+taken and the serialised size. The JSON format is timed as the DynamoDB
+controller uses it (serialise + json.dumps, and the reverse).
+
+Usage: python scripts/bench_serialise.py [N]
+"""
+import json
+import sys
+import time
+
+from hark_lang.load import compile_text
+from hark_lang.machine import codec
+from hark_lang.machine import types as mt
+from hark_lang.machine.arec import ActivationRecord
+from hark_lang.machine.future import Future
+from hark_lang.machine.state import State
+
+# Repeat each round-trip this many times
+REPEATS = 200
+
+SRC = """
+fn fib(n) {
+  if n < 2 { n } else { fib(n - 1) + fib(n - 2) }
+}
+
+fn main(x) {
+  items = [1, 2.5, "three", [x, x], {"a": x}];
+  print(items);
+  fib(x)
+}
+"""
+
+
+def make_value(n):
+    """A mix of Hark values, with about N elements"""
+    return mt.TlList(
+        mt.TlHash(
+            {
+                mt.TlString("index"): mt.TlInt(i),
+                mt.TlString("ratio"): mt.TlFloat(i / 7),
+                mt.TlString("tags"): mt.TlList([mt.TlString("x"), mt.TlTrue()]),
+            }
+        )
+        for i in range(n // 3)
+    )
+
+
+def make_objects(n):
+    value = make_value(n)
+    state = State([mt.TlInt(i) for i in range(n)] + [value])
+    state.slots = [value, mt.TlString("slot"), None]
+    arec = ActivationRecord(
+        function=mt.TlFunctionPtr("main", None),
+        vmid=0,
+        slots=[value, mt.TlInt(1), None],
+        ref_count=1,
+        dynamic_chain=0,
+        call_site=12,
+    )
+    future = Future(resolved=True, value=value, continuations=[1, 2])
+    exe = compile_text(SRC)
+    return dict(State=state, ActivationRecord=arec, Future=future, Executable=exe)
+
+
+def json_round_trip(obj):
+    text = json.dumps(obj.serialise())
+    type(obj).deserialise(json.loads(text))
+    return len(text)
+
+
+def binary_round_trip(obj):
+    data = codec.encode(obj)
+    codec.decode(data)
+    return len(data)
+
+
+def bench(round_trip, obj):
+    """Return (size in bytes, microseconds per round-trip)"""
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        size = round_trip(obj)
+    return size, 1e6 * (time.perf_counter() - start) / REPEATS
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    print(f"{'object':>16}  {'JSON bytes':>10}  {'binary':>8}  {'JSON us':>8}  {'binary':>8}")
+    for name, obj in make_objects(n).items():
+        json_size, json_us = bench(json_round_trip, obj)
+        bin_size, bin_us = bench(binary_round_trip, obj)
+        print(
+            f"{name:>16}  {json_size:>10}  {bin_size:>8}  {json_us:>8.0f}  {bin_us:>8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -227,6 +227,9 @@ def print_outputs(success_result: dict):
 def print_events_by_machine(success_result: dict):
     """Print the results of `getevents`, grouped by machine"""
     elist = success_result["events"]
+    if not elist:
+        print("No events (is HARK_PROBE_LEVEL set to `off'?)")
+        return
     for event in elist:
         event["time"] = datetime.datetime.fromisoformat(event["time"])
 
@@ -245,6 +248,9 @@ def print_events_by_machine(success_result: dict):
 def print_events_unified(success_result: dict):
     """Print the results of `getevents`, in one table"""
     elist = success_result["events"]
+    if not elist:
+        print("No events (is HARK_PROBE_LEVEL set to `off'?)")
+        return
     for event in elist:
         event["time"] = datetime.datetime.fromisoformat(event["time"])
 
@@ -286,8 +292,8 @@ def print_traceback(controller, stream=sys.stdout):
         stream.write(str(bad(f"\nError [Thread {failure.thread}]\n")))
         stream.write("Traceback:\n")
         for idx, item in enumerate(failure.stacktrace):
-            instr = controller.executable.code[item.caller_ip]
-            filename, lineno, line, column = instr.source
+            source = controller.executable.link().source(item.caller_ip)
+            filename, lineno, line, column = source
 
             # Indicate call flow direction
             if idx == 0:
@@ -302,6 +308,6 @@ def print_traceback(controller, stream=sys.stdout):
         stream.write("\n")
 
         # Print the code at the last one
-        instr = controller.executable.code[failure.stacktrace[-1].caller_ip]
-        stream.write(format_source_problem(*instr.source))
+        code = controller.executable.link()
+        stream.write(format_source_problem(*code.source(failure.stacktrace[-1].caller_ip)))
         stream.write(str(bad(failure.error_msg.strip())) + "\n\n")
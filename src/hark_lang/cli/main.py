@@ -9,7 +9,7 @@ Usage:
   hark [options] invoke [-f FUNCTION] [--async] [ARG...]
   hark [options] events [--unified | --json] [SESSION_ID]
   hark [options] stdout [--json] [SESSION_ID]
-  hark [options] FILE [-f FUNCTION] [-s MODE] [-c MODE] [ARG...]
+  hark [options] FILE [-f FUNCTION] [-s MODE] [-c MODE] [-p LEVEL] [ARG...]
   hark --version
   hark -h | --help
 
@@ -35,7 +35,8 @@ Options:
 
   -f FUNCTION, --function=FUNCTION  Target function      [default: main]
   -s MODE, --storage=MODE           memory | dynamodb    [default: memory]
-  -c MODE, --concurrency=MODE       processes | threads  [default: threads]
+  -c MODE, --concurrency=MODE       processes | threads | coop  [default: threads]
+  -p LEVEL, --probe=LEVEL           off | calls | sampled | full
 
   -u, --unified  Merge events into one table
   -j, --json     Print as json
@@ -53,6 +54,7 @@ Hark cloud options:
 
 import json
 import logging
+import os
 import subprocess
 import sys
 import time
@@ -118,6 +120,14 @@ def _run(args):
 
     fn_args = args["ARG"]
 
+    if args["--probe"]:
+        from ..machine.probe import get_probe_level
+
+        get_probe_level(args["--probe"])  # check it's valid
+        # Machines read the level from the environment, which also reaches
+        # machines in other processes.
+        os.environ["HARK_PROBE_LEVEL"] = args["--probe"]
+
     LOG.info(f"Running `{fn}` in {filename} ({len(fn_args)} args)...")
 
     # Try to find a timeout for the task. NOTE: we use the "lambda" timeout even
@@ -138,6 +148,14 @@ def _run(args):
             f"Supported types: {supported_storages}",
         )
 
+    supported_concurrency = ["processes", "threads", "coop"]
+
+    if args["--concurrency"] not in supported_concurrency:
+        exit_problem(
+            "Bad concurrency mode: " + str(args["--concurrency"]),
+            f"Supported modes: {supported_concurrency}",
+        )
+
     if args["--storage"] == "memory":
         if args["--concurrency"] == "processes":
             exit_problem(
@@ -147,11 +165,17 @@ def _run(args):
 
         from ..run.local import run_local
 
-        result = run_local(filename, fn, fn_args, timeout)
+        result = run_local(filename, fn, fn_args, timeout, args["--concurrency"])
 
     elif args["--storage"] == "dynamodb":
         from ..run.dynamodb import run_ddb_local, run_ddb_processes
 
+        if args["--concurrency"] == "coop":
+            exit_problem(
+                "Can't use coop with dynamodb storage",
+                "The coop scheduler only supports in-memory storage",
+            )
+
         if args["--concurrency"] == "processes":
             result = run_ddb_processes(filename, fn, fn_args, timeout)
         else:
@@ -166,13 +190,22 @@ def _run(args):
 
 def _asm(args):
     """Compile a file and print the assembly"""
-    from ..load import compile_file
+    from ..load import cache_path, compile_file_cached
 
-    exe = compile_file(Path(args["FILE"]))
+    exe, cached = compile_file_cached(Path(args["FILE"]))
+    # Only used to count the instructions. It's cached separately (see
+    # cache_path), so an unchanged file isn't compiled at all.
+    unoptimised, _ = compile_file_cached(Path(args["FILE"]), optimise=False)
     print(neutral("\nBYTECODE:"))
     exe.listing()
     print(neutral("\nBINDINGS:\n"))
     exe.bindings_table()
+    print(
+        neutral("\nINSTRUCTIONS: ")
+        + f"{len(exe.code)} ({len(unoptimised.code)} before optimisation)"
+    )
+    source = f"cache ({cache_path(args['FILE'])})" if cached else "compiled"
+    print(neutral("LOADED FROM: ") + source)
     print()
 
 
@@ -0,0 +1,105 @@
+"""Blob stores, for data that's too big to keep in the database
+
+Set HARK_BLOB_STORE to enable one:
+
+- s3://bucket/prefix - store blobs in S3 (the Lambda functions need access to
+  the bucket, e.g. with the `s3_access` config)
+- a directory (or file:///directory) - store blobs in local files, e.g. for
+  development and testing
+"""
+
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlparse
+
+from ..exceptions import UnexpectedError
+
+LOG = logging.getLogger(__name__)
+
+
+class BlobNotFound(UnexpectedError):
+    """A blob doesn't exist (e.g. it has been deleted)"""
+
+
+class BlobStore:
+    """Base class - subclasses implement put and get"""
+
+    def put(self, key: str, data: bytes):
+        raise NotImplementedError
+
+    def get(self, key: str) -> bytes:
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs stored in files in a directory"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def __repr__(self):
+        return f"<LocalBlobStore {self.root}>"
+
+    def put(self, key, data):
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / key
+        # Write atomically, so a concurrent reader never sees part of a blob
+        tmp = path.with_name(f".{key}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def get(self, key):
+        try:
+            return (self.root / key).read_bytes()
+        except FileNotFoundError as exc:
+            raise BlobNotFound(f"No blob {key} in {self.root}") from exc
+
+
+class S3BlobStore(BlobStore):
+    """Blobs stored as objects in an S3 bucket"""
+
+    def __init__(self, bucket: str, prefix: str = ""):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self._client = None
+
+    def __repr__(self):
+        return f"<S3BlobStore s3://{self.bucket}/{self.prefix}>"
+
+    @property
+    def client(self):
+        if self._client is None:
+            # Imported here so boto3 is only needed if S3 is used
+            from ..cloud.aws import get_client
+
+            self._client = get_client("s3")
+        return self._client
+
+    def _key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def get(self, key):
+        try:
+            res = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except self.client.exceptions.NoSuchKey as exc:
+            raise BlobNotFound(f"No blob {key} in {self}") from exc
+        return res["Body"].read()
+
+
+def get_blob_store(url: Optional[str]) -> Optional[BlobStore]:
+    """Get the blob store for URL (see module docstring), or None if not set"""
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme == "s3":
+        return S3BlobStore(parsed.netloc, parsed.path)
+    if parsed.scheme == "file":
+        return LocalBlobStore(parsed.path)
+    if parsed.scheme:
+        raise ValueError(f"Bad HARK_BLOB_STORE: {url}")
+    return LocalBlobStore(url)
@@ -6,7 +6,7 @@ session.
 
 Data per session:
 - futures (resolved, value, chain, continuations - machine, offset)
-- machines (probe logs, state - ip, stopped flag, stacks, and bindings)
+- machines (probe logs, state - ip, stopped flag, stacks, and local variables)
 
 Data exchange points:
 - machine forks (State of new machine set to point at the fork IP)
@@ -18,17 +18,21 @@ Data exchange points:
 - machine continues (download the State)
 """
 import functools
+import itertools
 import logging
 import sys
+import threading
 import time
 import warnings
-from typing import List, Tuple
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
 
 from ..machine import future as fut
 from ..machine.controller import Controller, ControllerError
 from . import ddb_model as db
 from .ddb_model import (
     AREC,
+    DELTAS,
     FUTURE,
     META,
     PEVENTS,
@@ -39,9 +43,8 @@ from .ddb_model import (
 )
 
 try:
-    from ..machine.executable import Executable
     from ..machine.probe import ProbeEvent, ProbeLog
-    from ..machine.state import State
+    from ..machine.state import State, apply_delta, state_delta
     from ..machine.stdout_item import StdoutItem
 except ModuleNotFoundError:
     warnings.warn(
@@ -52,6 +55,15 @@ except ModuleNotFoundError:
 LOG = logging.getLogger(__name__)
 
 
+@dataclass
+class _SavedState:
+    """The last state of a thread that was loaded or saved by this controller"""
+
+    state: "State"  # a copy
+    seq: int  # number of the last delta included
+    num_deltas: Optional[int]  # deltas since it was saved in full (None: can't)
+
+
 class DataController(Controller):
     supports_plugins = True
 
@@ -76,14 +88,16 @@ class DataController(Controller):
     def __init__(self, this_session, base_session, db_cls=db.SessionItem):
         self.SI = db_cls
         self.session_id = this_session.session_id
-        if base_session.meta.exe:
-            self.executable = Executable.deserialise(base_session.meta.exe)
-        elif this_session.meta.exe:
-            self.executable = Executable.deserialise(this_session.meta.exe)
-        else:
-            self.executable = None
-            # It's allowed to initialise a controller with no executable, as
-            # long as the user calls set_executable before creating a machine.
+        # Set when a machine in this process sees that all machines have stopped
+        self._all_stopped = threading.Event()
+        # States of the threads running in this process, by vmid, for saving
+        # deltas (see set_state). Dropped when the thread stops.
+        self._saved_states = {}
+        self.executable = db.get_meta_exe(base_session.meta)
+        if self.executable is None:
+            self.executable = db.get_meta_exe(this_session.meta)
+        # It's allowed to initialise a controller with no executable, as long as
+        # the user calls set_executable before creating a machine.
 
     def _qry(self, group, item_id=None):
         """Retrieve the specified group:item_id"""
@@ -104,7 +118,7 @@ class DataController(Controller):
     def set_executable(self, exe):
         self.executable = exe
         s = self._qry(META)
-        s.meta.exe = exe.serialise()
+        db.set_meta_exe(s.meta, exe)
         s.save()
         LOG.info("Updated session code")
 
@@ -125,6 +139,10 @@ class DataController(Controller):
             s.save()
 
         db.new_session_item(self.session_id, f"{STATE}:{vmid}", state=State([])).save()
+        if db.STATE_COMPACT_EVERY:
+            db.new_session_item(
+                self.session_id, f"{STATE}:{vmid}:{DELTAS}", state_deltas=[]
+            ).save()
         db.new_session_item(
             self.session_id, f"{FUTURE}:{vmid}", future=fut.Future()
         ).save()
@@ -146,19 +164,97 @@ class DataController(Controller):
         return all(s.meta.stopped)
 
     def set_stopped(self, vmid, stopped: bool):
+        if stopped:
+            # It's loaded again (by get_state) if the thread continues, so don't
+            # keep it. Otherwise a long-lived controller would keep every state.
+            self._saved_states.pop(vmid, None)
         with self._lock_item(META):
             s = self._qry(META)
             s.meta.stopped[vmid] = stopped
             s.save()
+            if all(s.meta.stopped):
+                self._all_stopped.set()
+            else:
+                self._all_stopped.clear()
+
+    def wait_until_stopped(self, timeout: float) -> bool:
+        # Machines in other processes (e.g. other Lambda invocations) can't
+        # signal the event, so check META too.
+        self._all_stopped.wait(timeout)
+        return self.all_stopped()
+
+    def check_periods(self, max_period: float):
+        # Each check is a strongly consistent read of META, so don't check more
+        # often than asked. Machines in this process end the wait early anyway.
+        return itertools.repeat(max_period)
+
+    # Thread states are saved as a full state (STATE:vmid), and a list of
+    # numbered deltas since then (STATE:vmid:DELTAS), so that a thread which
+    # stops and continues many times doesn't rewrite the whole state each time.
+    # Every STATE_COMPACT_EVERY saves, the full state is rewritten, recording
+    # the number of the last delta included in it, and the deltas are cleared.
+    # Deltas up to that number are ignored when loading, in case clearing them
+    # failed.
+
+    def _get_deltas(self, vmid) -> Optional[list]:
+        try:
+            return self._qry(STATE, f"{vmid}:{DELTAS}").state_deltas or []
+        except ControllerError:
+            return None  # Thread created by an older version
 
     def set_state(self, vmid, state):
         # NOTE: no locking required, no inter-thread state access allowed
+        saved = self._saved_states.get(vmid)
+        if (
+            saved is not None
+            and saved.num_deltas is not None
+            and saved.num_deltas < db.STATE_COMPACT_EVERY
+        ):
+            seq = saved.seq + 1
+            delta = db.dumps_delta(state_delta(saved.state, state))
+            item = self.SI(self.session_id, f"{STATE}:{vmid}:{DELTAS}")
+            item.update(
+                actions=[
+                    self.SI.state_deltas.set(
+                        self.SI.state_deltas.append([[seq, delta]])
+                    )
+                ]
+            )
+            self._saved_states[vmid] = _SavedState(
+                state.copy(), seq, saved.num_deltas + 1
+            )
+            return
+
+        if saved is not None:
+            seq, deltas_exist = saved.seq, saved.num_deltas is not None
+        else:
+            deltas = self._get_deltas(vmid)
+            seq = max((n for n, _ in deltas), default=0) if deltas else 0
+            deltas_exist = deltas is not None
+
         s = self._qry(STATE, vmid)
         s.state = state
+        s.state_seq = seq
         s.save()
+        if deltas_exist:
+            s = self.SI(self.session_id, f"{STATE}:{vmid}:{DELTAS}")
+            s.update(actions=[self.SI.state_deltas.set([])])
+        self._saved_states[vmid] = _SavedState(
+            state.copy(), seq, 0 if deltas_exist else None
+        )
 
     def get_state(self, vmid):
-        return self._qry(STATE, vmid).state
+        s = self._qry(STATE, vmid)
+        state, seq = db.loaded(s.state), s.state_seq or 0
+        deltas = self._get_deltas(vmid)
+        num_deltas = None if deltas is None else 0
+        for delta_seq, data in deltas or []:
+            if delta_seq > seq:
+                apply_delta(state, db.loads_delta(data))
+                seq = delta_seq
+                num_deltas += 1
+        self._saved_states[vmid] = _SavedState(state.copy(), seq, num_deltas)
+        return state
 
     ## controller properties
 
@@ -217,7 +313,7 @@ class DataController(Controller):
         s.save()
 
     def get_arec(self, ptr):
-        return self._qry(AREC, ptr).arec
+        return db.loaded(self._qry(AREC, ptr).arec)
 
     def increment_ref(self, ptr):
         s = self._qry(AREC, ptr)
@@ -226,11 +322,11 @@ class DataController(Controller):
     def decrement_ref(self, ptr):
         s = self._qry(AREC, ptr)
         s.update(actions=[self.SI.arec.ref_count.set(self.SI.arec.ref_count - 1)])
-        return s.arec
+        return db.loaded(s.arec)
 
     def delete_arec(self, ptr):
         s = self._qry(AREC, ptr)
-        s.arec.deleted = True
+        db.loaded(s.arec).deleted = True
 
     def lock_arec(self, ptr):
         return self._lock_item(AREC, ptr)
@@ -240,6 +336,8 @@ class DataController(Controller):
     def set_probe_data(self, vmid, probe):
         # FIXME - 400k limit on item size is quite easy to break with events and
         # logs.
+        if not probe.events and not probe.logs:
+            return  # e.g. probes are off - don't bother writing anything
         events = [item.serialise() for item in probe.events]
         s = self._qry(PEVENTS)
         s.update(actions=[self.SI.pevents.set(self.SI.pevents.append(events))])
@@ -260,7 +358,7 @@ class DataController(Controller):
 
     def get_future(self, vmid):
         s = self._qry(FUTURE, vmid)
-        return s.future
+        return db.loaded(s.future)
 
     def set_future(self, vmid, future: fut.Future):
         s = self._qry(FUTURE, vmid)
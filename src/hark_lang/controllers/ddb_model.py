@@ -2,11 +2,14 @@
 
 import base64
 import dataclasses
+import hashlib
+import json
 import logging
 import os
 import threading
 import time
 import uuid
+from collections import OrderedDict
 from contextlib import AbstractContextManager
 from datetime import datetime
 from typing import List
@@ -25,9 +28,13 @@ from pynamodb.exceptions import UpdateError, TableDoesNotExist
 from pynamodb.models import Model
 
 from ..exceptions import HarkError
+from ..machine import codec
 from ..machine.arec import ActivationRecord
+from ..machine.executable import Executable
 from ..machine.future import Future
-from ..machine.state import State
+from ..machine.state import State, deserialise_delta, serialise_delta
+from ..machine.value_store import ValueStore
+from .blob_store import BlobNotFound, get_blob_store
 
 LOG = logging.getLogger(__name__)
 
@@ -39,12 +46,35 @@ if "DYNAMODB_ENDPOINT" not in os.environ and "USE_LIVE_AWS" not in os.environ:
 # Get the session item time-to-live
 ITEM_TTL = int(os.getenv("HARK_SESSION_TTL", 0))  # TTL=0 means don't expire
 
+# How to store machine data: "binary" (see machine.codec) or "json". Data
+# stored in either format can always be loaded.
+SERIALISATION = os.getenv("HARK_SERIALISATION", "binary")
+if SERIALISATION not in ("binary", "json"):
+    raise ValueError(f"Bad HARK_SERIALISATION: {SERIALISATION}")
+BINARY = SERIALISATION == "binary"
+
+# How many deserialised executables to keep, per process
+EXE_CACHE_SIZE = int(os.getenv("HARK_EXE_CACHE_SIZE", 8))
+
+# Thread states are saved as deltas (changes since the previous save), and
+# rewritten in full after this many. Set to 0 to always save them in full.
+STATE_COMPACT_EVERY = int(os.getenv("HARK_STATE_COMPACT_EVERY", 16))
+
+# Where to offload data that's too big for an item (see blob_store)
+BLOB_STORE = get_blob_store(os.getenv("HARK_BLOB_STORE"))
+
+# Text attributes longer than this are offloaded to the blob store, if there is
+# one (DynamoDB items can't be bigger than 400KB)
+MAX_DATA_SIZE = int(os.getenv("HARK_MAX_ITEM_DATA", 300_000))
+BLOB_PREFIX = "hkblob:"
+
 # Default Hark sessions table name
 DEFAULT_TABLE_NAME = "HarkSessions"
 
 # pseudo-sessions
 BASE_SESSION_HASH_KEY = "base"
 PLUGINS_HASH_KEY = "plugins"
+VALUES_HASH_KEY = "values"  # see DdbValueStore
 
 # DDB item type prefix constants
 FUTURE = "future"
@@ -54,6 +84,45 @@ STATE = "state"
 PLOGS = "plogs"
 PEVENTS = "pevents"
 STDOUT = "stdout"
+DELTAS = "deltas"
+
+
+class LazyData:
+    """Item data that was offloaded to the blob store, and isn't loaded yet
+
+    Like future.LazyValue - items are often loaded just to check or update some
+    other field, so the blob is only fetched (once) when load() is called.
+    """
+
+    __slots__ = ("ref", "_decode", "_value")
+
+    def __init__(self, ref: str, decode):
+        self.ref = ref
+        self._decode = decode
+        self._value = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._decode is None
+
+    def load(self):
+        if self._decode is not None:
+            self._value = self._decode(reload(self.ref))
+            self._decode = None
+        return self._value
+
+    def __repr__(self):
+        return f"<LazyData {self.ref}>"
+
+
+def loaded(value):
+    """VALUE, or what it refers to if it's LazyData"""
+    return value.load() if isinstance(value, LazyData) else value
+
+
+def is_blob_ref(text) -> bool:
+    """Whether TEXT was returned by offload (and refers to a blob)"""
+    return isinstance(text, str) and text.startswith(BLOB_PREFIX)
 
 
 class FutureAttribute(MapAttribute):
@@ -61,12 +130,44 @@ class FutureAttribute(MapAttribute):
     continuations = ListAttribute(default=list)
     chain = NumberAttribute(null=True)
     value = JSONAttribute(null=True)
+    gathers = ListAttribute(default=list)
+    parts = JSONAttribute(null=True)
+    pending = NumberAttribute(null=True)
+    splice = BooleanAttribute(default=False)
+    error = ListAttribute(null=True)
+    # The whole future, in binary. The other fields (but not value or parts)
+    # are still set, as some are updated in-place (see ddb.DataController).
+    data = UnicodeAttribute(null=True)
 
     def serialize(self, value):
+        value = loaded(value)
+        if BINARY:
+            return super().serialize(
+                dict(
+                    continuations=value.continuations,
+                    chain=value.chain,
+                    resolved=value.resolved,
+                    gathers=value.gathers,
+                    pending=value.pending,
+                    splice=value.splice,
+                    data=offload(codec.dumps(value, write_store())),
+                )
+            )
         return super().serialize(value.serialise())
 
     def deserialize(self, value):
-        return Future.deserialise(super().deserialize(value).as_dict())
+        d = super().deserialize(value).as_dict()
+        data = d.pop("data", None)
+        if data:
+
+            def decode(text):
+                future = codec.loads(text, VALUE_STORE)
+                future.continuations = d.get("continuations", [])
+                future.chain = d.get("chain")
+                return future
+
+            return LazyData(data, decode) if is_blob_ref(data) else decode(data)
+        return Future.deserialise(d)
 
 
 class ARecAttribute(MapAttribute):
@@ -75,14 +176,38 @@ class ARecAttribute(MapAttribute):
     dynamic_chain = NumberAttribute(null=True)
     vmid = NumberAttribute(null=True)
     call_site = NumberAttribute(null=True)
-    bindings = MapAttribute(default=dict)
     deleted = BooleanAttribute(default=False)
+    # The whole record, in binary. The other fields (but not function)
+    # are still set, as some are updated in-place (see ddb.DataController).
+    data = UnicodeAttribute(null=True)
 
     def serialize(self, value):
+        value = loaded(value)
+        if BINARY:
+            return super().serialize(
+                dict(
+                    ref_count=value.ref_count,
+                    dynamic_chain=value.dynamic_chain,
+                    vmid=value.vmid,
+                    call_site=value.call_site,
+                    deleted=value.deleted,
+                    data=offload(codec.dumps(value, write_store())),
+                )
+            )
         return super().serialize(value.serialise())
 
     def deserialize(self, value):
-        return ActivationRecord.deserialise(super().deserialize(value).as_dict())
+        d = super().deserialize(value).as_dict()
+        data = d.pop("data", None)
+        if data:
+
+            def decode(text):
+                rec = codec.loads(text, VALUE_STORE)
+                rec.ref_count = d["ref_count"]
+                return rec
+
+            return LazyData(data, decode) if is_blob_ref(data) else decode(data)
+        return ActivationRecord.deserialise(d)
 
 
 class MetaAttribute(MapAttribute):
@@ -91,20 +216,35 @@ class MetaAttribute(MapAttribute):
     entrypoint = UnicodeAttribute(null=True)
     stopped = ListAttribute(default=list)
     exe = MapAttribute(null=True)
+    exe_data = UnicodeAttribute(null=True)  # exe, in binary
+    exe_hash = UnicodeAttribute(null=True)  # see set_meta_exe
     result = JSONAttribute(null=True)
     broken = BooleanAttribute(default=False)
 
 
 class HarkDataAttribute(JSONAttribute):
-    """General purpose JSON-able Hark type"""
+    """General purpose JSON-able (or binary) Hark type"""
 
     value_cls = None
 
     def serialize(self, value):
-        return super().serialize(value.serialise())
+        if isinstance(value, LazyData):
+            if not value.is_loaded:
+                return value.ref  # unchanged, and still in the blob store
+            value = value.load()
+        if BINARY:
+            return offload(codec.dumps(value, write_store()))
+        return offload(super().serialize(value.serialise()))
 
     def deserialize(self, value):
-        return self.value_cls.deserialise(super().deserialize(value))
+        if is_blob_ref(value):
+            return LazyData(value, self._decode)
+        return self._decode(value)
+
+    def _decode(self, text):
+        if codec.is_encoded(text):
+            return codec.loads(text, VALUE_STORE)
+        return self.value_cls.deserialise(super().deserialize(text))
 
 
 class StateAttribute(HarkDataAttribute):
@@ -135,6 +275,91 @@ class SessionItem(Model):
     arec = ARecAttribute(null=True)
     future = FutureAttribute(null=True)
     state = StateAttribute(null=True)
+    # The number of the last delta included in state (see ddb.DataController)
+    state_seq = NumberAttribute(null=True)
+    # [number, delta] pairs, in the state:<vmid>:deltas item
+    state_deltas = ListAttribute(null=True)
+    value_data = UnicodeAttribute(null=True)  # see DdbValueStore
+
+
+class DdbValueStore(ValueStore):
+    """Large values, stored once in the "values" pseudo-session
+
+    Values are shared by all sessions. They're refreshed when they're referred
+    to (at most every rewrite_after seconds, per process), and expire
+    rewrite_after seconds later than an item written at the same time would -
+    so they outlive any item that refers to them.
+    """
+
+    rewrite_after = ITEM_TTL / 2 if ITEM_TTL else None
+
+    def _expires_on(self) -> int:
+        return int(ITEM_TTL + self.rewrite_after + time.time()) if ITEM_TTL else 0
+
+    def put_data(self, key, data):
+        value_data = offload(base64.b64encode(data).decode())
+        item = new_session_item(VALUES_HASH_KEY, key, value_data=value_data)
+        item.expires_on = self._expires_on()
+        item.save()
+
+    def refresh_data(self, key):
+        item = SessionItem(VALUES_HASH_KEY, key)
+        try:
+            item.update(
+                [
+                    SessionItem.expires_on.set(self._expires_on()),
+                    SessionItem.updated_at.set(datetime.now()),
+                ],
+                condition=SessionItem.value_data.exists(),
+            )
+        except UpdateError as exc:
+            if (
+                isinstance(exc.cause, ClientError)
+                and exc.cause.response["Error"].get("Code")
+                == "ConditionalCheckFailedException"
+            ):
+                raise codec.CodecError(f"Stored value {key} does not exist") from exc
+            raise
+
+    def get_data(self, key):
+        try:
+            item = SessionItem.get(VALUES_HASH_KEY, key, consistent_read=True)
+        except SessionItem.DoesNotExist as exc:
+            raise codec.CodecError(f"Stored value {key} does not exist") from exc
+        return base64.b64decode(reload(item.value_data))
+
+
+VALUE_STORE = DdbValueStore()
+
+
+def offload(text: str) -> str:
+    """TEXT, or a reference to it in the blob store if it's too big
+
+    Blobs are keyed by a hash of their content, and don't expire with the
+    session (e.g. use an S3 lifecycle rule to delete old ones).
+    """
+    if BLOB_STORE is None or len(text) <= MAX_DATA_SIZE:
+        return text
+    data = text.encode()
+    key = hashlib.sha256(data).hexdigest()
+    BLOB_STORE.put(key, data)
+    LOG.info("Offloaded %d bytes to blob %s", len(data), key)
+    return BLOB_PREFIX + key
+
+
+def reload(text):
+    """The original text, if TEXT was returned by offload"""
+    if not is_blob_ref(text):
+        return text
+    key = text[len(BLOB_PREFIX) :]
+    if BLOB_STORE is None:
+        raise BlobNotFound(f"Can't load blob {key}: HARK_BLOB_STORE isn't set")
+    return BLOB_STORE.get(key).decode()
+
+
+def write_store():
+    """The value store to use for new data (None if it's disabled)"""
+    return VALUE_STORE if BINARY and VALUE_STORE.threshold else None
 
 
 ###
@@ -159,9 +384,77 @@ def init_base_session() -> SessionItem:
     return s
 
 
+# Deserialised executables, by content hash, least recently used first. Every
+# controller created in this process (e.g. on each Lambda resume) needs the
+# executable, and the same one is usually stored in many sessions.
+_EXE_CACHE = OrderedDict()
+_EXE_CACHE_LOCK = threading.Lock()
+
+
+def _cache_exe(exe_hash: str, exe):
+    with _EXE_CACHE_LOCK:
+        _EXE_CACHE[exe_hash] = exe
+        _EXE_CACHE.move_to_end(exe_hash)
+        while len(_EXE_CACHE) > EXE_CACHE_SIZE:
+            _EXE_CACHE.popitem(last=False)
+
+
+def _cached_exe(exe_hash: str):
+    with _EXE_CACHE_LOCK:
+        exe = _EXE_CACHE.get(exe_hash)
+        if exe is not None:
+            _EXE_CACHE.move_to_end(exe_hash)
+        return exe
+
+
+def dumps_delta(delta: dict) -> str:
+    """Serialise a State delta (see machine.state.state_delta)"""
+    if BINARY:
+        return offload(codec.dumps(delta, write_store()))
+    return offload(json.dumps(serialise_delta(delta)))
+
+
+def loads_delta(text: str) -> dict:
+    text = reload(text)
+    if codec.is_encoded(text):
+        return codec.loads(text, VALUE_STORE)
+    return deserialise_delta(json.loads(text))
+
+
+def set_meta_exe(meta: MetaAttribute, exe):
+    """Store EXE in META, with a hash of its content"""
+    if BINARY:
+        content = codec.dumps(exe)
+        meta.exe, meta.exe_data = None, offload(content)
+    else:
+        serialised = exe.serialise()
+        meta.exe, meta.exe_data = serialised, None
+        content = json.dumps(serialised, sort_keys=True)
+    meta.exe_hash = hashlib.sha256(content.encode()).hexdigest()
+    _cache_exe(meta.exe_hash, exe)
+
+
+def get_meta_exe(meta: MetaAttribute):
+    """Get the executable stored in META, or None"""
+    if meta.exe_hash:
+        exe = _cached_exe(meta.exe_hash)
+        if exe is not None:
+            LOG.info("Using cached executable %s", meta.exe_hash)
+            return exe
+    if meta.exe_data:
+        exe = codec.loads(reload(meta.exe_data))
+    elif meta.exe:
+        exe = Executable.deserialise(meta.exe)
+    else:
+        return None
+    if meta.exe_hash:
+        _cache_exe(meta.exe_hash, exe)
+    return exe
+
+
 def set_base_exe(exe):
     base_session = SessionItem.get(BASE_SESSION_HASH_KEY, META)
-    base_session.meta.exe = exe.serialise()
+    set_meta_exe(base_session.meta, exe)
     base_session.save()
 
 
@@ -25,6 +25,10 @@ class DataController(Controller):
         self._probe_events = []
         self._arecs = {}
         self._lock = threading.RLock()
+        self._num_running = 0
+        self._continued = set()  # continued while still running
+        self._thread_locks = {}
+        self._all_stopped = threading.Condition(self._lock)
         self.session_id = 0  # constant for local
         self.executable = None
         self.stdout = []  # shared standard output
@@ -54,10 +58,32 @@ class DataController(Controller):
         return vmid == 0
 
     def all_stopped(self):
-        return all(self._machine_stopped.values())
+        return self._num_running == 0
 
     def set_stopped(self, vmid, stopped: bool):
-        self._machine_stopped[vmid] = stopped
+        with self._all_stopped:
+            was_stopped = self._machine_stopped.get(vmid, True)
+            if not stopped and not was_stopped:
+                # A future it was waiting on resolved before it stopped. It
+                # will run again, so it doesn't count as stopped until then.
+                self._continued.add(vmid)
+                return
+            if stopped and vmid in self._continued:
+                self._continued.discard(vmid)
+                return
+            self._machine_stopped[vmid] = stopped
+            self._num_running += was_stopped - stopped
+            if self._num_running == 0:
+                self._all_stopped.notify_all()
+
+    def lock_thread(self, vmid):
+        # Machines share the State object, so only one may run a thread at once
+        with self._lock:
+            return self._thread_locks.setdefault(vmid, threading.Lock())
+
+    def wait_until_stopped(self, timeout: float) -> bool:
+        with self._all_stopped:
+            return self._all_stopped.wait_for(self.all_stopped, timeout)
 
     def get_state(self, vmid):
         return self._machine_state[vmid]
@@ -9,6 +9,10 @@ import botocore
 # Hark "resume" lambda handler name. Should be set by the Hark deployment scripts.
 RESUME_FN_NAME = os.environ["RESUME_FN_NAME"]
 
+# Only run a continuation in the current Lambda (instead of invoking a new one)
+# if there's at least this much time left.
+INLINE_MIN_REMAINING_MS = int(os.getenv("HARK_INLINE_MIN_REMAINING_MS", 60000))
+
 
 LOG = logging.getLogger(__name__)
 
@@ -20,10 +24,20 @@ def get_lambda_client():
 
 
 class Invoker:
-    def __init__(self, data_controller):
+    # Lambda invocations end when their machine stops
+    persistent = False
+
+    def __init__(self, data_controller, context=None):
         self.data_controller = data_controller
         self.resume_fn_name = RESUME_FN_NAME
         self.exception = None
+        self.context = context  # The Lambda context, if running in Lambda
+
+    def can_run_inline(self):
+        """Whether there's enough time left to run a continuation here"""
+        if self.context is None:
+            return False
+        return self.context.get_remaining_time_in_millis() >= INLINE_MIN_REMAINING_MS
 
     def invoke(self, vmid, run_async=True):
         client = get_lambda_client()
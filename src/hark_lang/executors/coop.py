@@ -0,0 +1,83 @@
+"""Run all machines in this process, cooperatively
+
+Instead of starting a new OS thread for every machine (see executors.thread),
+machines are put on a run queue and run one at a time, each for a limited number
+of steps before yielding to the next one. A machine that stops to Wait for a
+future leaves the queue, and is put back on it (by the machine that resolves the
+future) when it can continue.
+
+NOTE: Blocking operations (sleep, and foreign Python calls) block every machine,
+unless foreign calls are made in a process pool (see HARK_FOREIGN_PROCESSES).
+"""
+import logging
+import threading
+from collections import deque
+
+from ..machine.machine import TlMachine
+
+LOG = logging.getLogger(__name__)
+
+# The number of steps each machine runs for before yielding
+DEFAULT_STEP_BUDGET = 1000
+
+# How often to check whether background work has finished, if no machines are
+# queued
+IDLE_CHECK_PERIOD = 0.1
+
+
+class Invoker:
+    # See executors.thread.Invoker
+    persistent = True
+
+    def __init__(self, data_controller, step_budget=DEFAULT_STEP_BUDGET):
+        self.data_controller = data_controller
+        self.step_budget = step_budget
+        self.exception = None
+        self._queue = deque()
+        # Notified when a machine is queued (possibly from another thread)
+        self._queued = threading.Condition()
+        self._running = False
+
+    def can_run_inline(self):
+        return True
+
+    def invoke(self, vmid, run_async=True):
+        LOG.info(f"Invoking {vmid} (queued: {len(self._queue)})")
+        machine = TlMachine(vmid, self)
+        with self._queued:
+            self._queue.append(machine)
+            self._queued.notify()
+        if not run_async:
+            self.run()
+
+    def _next_machine(self):
+        """Get the next machine to run, or None if they have all stopped"""
+        with self._queued:
+            # If nothing is queued, but some machines haven't stopped, they're
+            # waiting for background work (e.g. a foreign call) which will
+            # queue them when it finishes.
+            while not self._queue:
+                if self.data_controller.all_stopped():
+                    return None
+                self._queued.wait(IDLE_CHECK_PERIOD)
+            return self._queue.popleft()
+
+    def run(self):
+        """Run queued machines until they have all stopped"""
+        if self._running:
+            # Called from a machine - it'll be run by the existing loop
+            return
+        self._running = True
+        try:
+            while True:
+                machine = self._next_machine()
+                if machine is None:
+                    break
+                # It may continue as another machine (see TlMachine.run)
+                machine = machine.run(max_steps=self.step_budget)
+                if not machine.stopped:
+                    # Out of steps - go to the back of the queue
+                    with self._queued:
+                        self._queue.append(machine)
+        finally:
+            self._running = False
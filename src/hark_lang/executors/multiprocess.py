@@ -6,10 +6,16 @@ from ..machine.machine import TlMachine
 
 
 class Invoker:
+    # Each machine runs in its own, short-lived, process
+    persistent = False
+
     def __init__(self, data_controller):
         self.data_controller = data_controller
         self.exception = None
 
+    def can_run_inline(self):
+        return True
+
     def invoke(self, vmid, run_async=True):
         event = dict(
             # --
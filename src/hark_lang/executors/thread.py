@@ -1,15 +1,26 @@
 import logging
+import os
+import queue
+import sys
 import threading
 import time
 import traceback
 import warnings
+from dataclasses import dataclass
 
 from ..machine.machine import TlMachine
 
 LOG = logging.getLogger(__name__)
 
+# Maximum number of worker threads in a PoolInvoker
+DEFAULT_MAX_WORKERS = 32
+
 
 class Invoker:
+    # Machines are continued in this process, which outlives them - so it can
+    # handle work finished in the background (see TlMachine._foreign_in_pool)
+    persistent = True
+
     def __init__(self, data_controller):
         self.data_controller = data_controller
         self.exception = None
@@ -18,6 +29,10 @@ class Invoker:
     def _threading_excepthook(self, args):
         self.exception = args
 
+    def can_run_inline(self):
+        """Whether a machine can run a continuation itself (see Return)"""
+        return True
+
     def invoke(self, vmid, run_async=True):
         LOG.info(f"Invoking {vmid} (new thread? {run_async})")
         m = TlMachine(vmid, self)
@@ -27,3 +42,101 @@ class Invoker:
             thread.start()
         else:
             m.run()
+
+
+@dataclass
+class PoolMetrics:
+    """Statistics about a PoolInvoker's queue"""
+
+    invocations: int = 0
+    max_queue_depth: int = 0
+    total_wait_s: float = 0.0
+    max_wait_s: float = 0.0
+
+    @property
+    def mean_wait_s(self) -> float:
+        return self.total_wait_s / self.invocations if self.invocations else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.invocations} invocations, max queue depth "
+            f"{self.max_queue_depth}, wait time mean {self.mean_wait_s:.4f}s "
+            f"max {self.max_wait_s:.4f}s"
+        )
+
+
+class PoolInvoker(Invoker):
+    """Run machines on a bounded pool of worker threads
+
+    Invocations are queued, and run by the next free worker. Workers are
+    started as needed, up to MAX_WORKERS (default: $HARK_MAX_WORKERS, or
+    DEFAULT_MAX_WORKERS).
+    """
+
+    def __init__(self, data_controller, max_workers=None):
+        super().__init__(data_controller)
+        self.max_workers = max_workers or int(
+            os.getenv("HARK_MAX_WORKERS", DEFAULT_MAX_WORKERS)
+        )
+        self.metrics = PoolMetrics()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._idle = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def invoke(self, vmid, run_async=True):
+        if not run_async:
+            return super().invoke(vmid, run_async)
+        LOG.info(f"Queueing {vmid}")
+        self._queue.put((vmid, time.monotonic()))
+        with self._lock:
+            depth = self._queue.qsize()
+            self.metrics.max_queue_depth = max(self.metrics.max_queue_depth, depth)
+            if depth > self._idle and len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work, daemon=True)
+                self._workers.append(worker)
+                worker.start()
+
+    def shutdown(self, timeout=None):
+        """Stop the workers once the queue is empty, waiting up to TIMEOUT"""
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._queue.put(None)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in workers:
+            if deadline is None:
+                worker.join()
+            else:
+                worker.join(max(0, deadline - time.monotonic()))
+
+    def _work(self):
+        while True:
+            with self._lock:
+                self._idle += 1
+            item = self._queue.get()
+            if item is None:
+                # Sent by shutdown
+                with self._lock:
+                    self._idle -= 1
+                self._queue.task_done()
+                return
+            vmid, queued_at = item
+            waited = time.monotonic() - queued_at
+            with self._lock:
+                self._idle -= 1
+                self.metrics.invocations += 1
+                self.metrics.total_wait_s += waited
+                self.metrics.max_wait_s = max(self.metrics.max_wait_s, waited)
+            try:
+                TlMachine(vmid, self).run()
+            except Exception:
+                # Same as an unhandled exception in a thread (see Invoker)
+                info = sys.exc_info() + (threading.current_thread(),)
+                self.exception = threading.ExceptHookArgs(info)
+            finally:
+                self._queue.task_done()
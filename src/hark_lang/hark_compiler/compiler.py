@@ -1,4 +1,5 @@
 """Optimise and compile an AST into executable code"""
+import dataclasses
 import itertools
 import logging
 from functools import singledispatch, singledispatchmethod, wraps
@@ -10,7 +11,9 @@ from ..machine import instructionset as mi
 from ..machine import types as mt
 from ..machine.executable import Executable
 from ..hark_parser import nodes
+from ..hark_parser.parser import tl_parse
 from .attributes import parse_attribute
+from .optimise import fold_constants
 
 LOG = logging.getLogger(__name__)
 
@@ -19,6 +22,30 @@ LOG = logging.getLogger(__name__)
 # that it is automatically created:
 START_LABEL = "!start"
 
+# Boolean operators, and the jump that skips evaluating their right-hand side
+SHORT_CIRCUIT = {
+    mi.OpAnd: mi.AndJump,
+    mi.OpOr: mi.OrJump,
+}
+
+# Hark functions that builtin instructions rely on, by instruction, and the name
+# to bind each one to. They're compiled into executables that use the builtin.
+HELPERS = {
+    mi.PMap: (
+        mi.PMAP_CHUNK,
+        """
+fn pmap_chunk(f, items, acc) {
+  if nullp(items) {
+    acc
+  } else {
+    pmap_chunk(f, rest(items), append(acc, f(first(items))))
+  }
+}
+""",
+    ),
+}
+
+
 
 def flatten(list_of_lists: list) -> list:
     "Flatten one level of nesting"
@@ -92,6 +119,47 @@ def replace_gotos(code: list):
     return code
 
 
+def assigned_names(node) -> dict:
+    """Find the names bound by assignment in NODE (excluding nested lambdas)
+
+    Returns an ordered set (dict with None values) of names, in the order that
+    they're first assigned.
+    """
+    names = {}
+    if isinstance(node, list):
+        for n in node:
+            names.update(assigned_names(n))
+        return names
+    if not isinstance(node, nodes.Node) or isinstance(node, nodes.N_Lambda):
+        return names
+    if isinstance(node, nodes.N_Binop) and node.op == "=":
+        if isinstance(node.lhs, nodes.N_Id):
+            names[node.lhs.name] = None
+    for f in dataclasses.fields(node):
+        names.update(assigned_names(getattr(node, f.name)))
+    return names
+
+
+def toplevel_names(exprs) -> set:
+    """Find the names bound at the top level (definitions and imports)"""
+    names = {e.name for e in exprs if isinstance(e, nodes.N_Definition)}
+    return names | imported_names(exprs)
+
+
+def imported_names(exprs) -> set:
+    """Find the names bound by imports at the top level"""
+    names = set()
+    for e in exprs:
+        if isinstance(e, nodes.N_Call) and isinstance(e.fn, nodes.N_Id):
+            # import(name, source, num_args, [qualifier]) - see compile_toplevel
+            names |= {
+                a.value.name
+                for a in e.args[:1] + e.args[3:4]
+                if isinstance(a, nodes.N_Argument) and isinstance(a.value, nodes.N_Id)
+            }
+    return names
+
+
 class CompileToplevel:
     def __init__(self, exprs):
         """Compile a toplevel list of expressions"""
@@ -100,15 +168,48 @@ class CompileToplevel:
         self.bindings = {}
         self.labels = {}
         self.instruction_idx = 0
+        # Names that may shadow builtins. Global names are collected up-front
+        # because functions can refer to definitions that come later.
+        self.global_names = toplevel_names(exprs)
+        self.foreign_names = imported_names(exprs)
+        # Slot indices of the locals (parameters and assigned names) in the
+        # function currently being compiled
+        self.local_slots = {}
+        # Parameters of that function, which are always bound
+        self.local_params = set()
+        # Builtin instructions that need a helper function (see HELPERS)
+        self.helpers_needed = set()
         for e in exprs:
             self.compile_toplevel(e)
+        for instr in self.helpers_needed:
+            self.compile_helper(instr)
+
+    def compile_helper(self, instr):
+        """Compile the helper function of builtin INSTR, and bind it"""
+        name, src = HELPERS[instr]
+        (n,) = tl_parse(f"<{name}>", src)
+        # User definitions don't shadow builtins used by the helper
+        global_names, self.global_names = self.global_names, set()
+        try:
+            identifier = self.make_function(n, n.name)
+        finally:
+            self.global_names = global_names
+        self.bindings[name] = mt.TlFunctionPtr(identifier, None)
 
     def make_function(self, n: nodes.N_Definition, name="lambda") -> str:
         """Make a new executable function object with a unique name, and save it"""
         count = len(self.functions)
         identifier = f"#{count}:{name}"
         start_label = nodes.N_Label.from_node(n, START_LABEL)
-        code = self.compile_function(optimise_tailcall(n))
+        outer_slots, outer_params = self.local_slots, self.local_params
+        local_names = {name: None for name in n.paramlist}
+        local_names.update(assigned_names(n.body))
+        self.local_slots = {name: idx for idx, name in enumerate(local_names)}
+        self.local_params = set(n.paramlist)
+        try:
+            code = self.compile_function(optimise_tailcall(n))
+        finally:
+            self.local_slots, self.local_params = outer_slots, outer_params
         fn_code = replace_gotos([start_label] + code)
         self.functions[identifier] = fn_code
         # self.attributes[identifier] = parse_attribute(n.attribute)
@@ -118,25 +219,60 @@ class CompileToplevel:
         """Compile a function into executable code"""
         bindings = flatten(
             [
-                [mi.Bind.from_node(n, mt.TlSymbol(arg)), mi.Pop.from_node(n)]
+                [self.bind_local(n, arg), mi.Pop.from_node(n)]
                 for arg in reversed(n.paramlist)
             ]
         )
         body = self.compile_expr(n.body)
         return bindings + body + [mi.Return.from_node(n)]
 
+    def bind_local(self, n: nodes.Node, name: str):
+        """Make the instruction to bind the top of the stack to local NAME"""
+        return mi.BindSlot.from_node(n, mt.TlInt(self.local_slots[name]))
+
+    def shadows_global(self, name: str) -> bool:
+        """Whether local NAME refers to a global (or builtin) until it's assigned
+
+        Parameters are always bound, so they never do.
+        """
+        return (
+            name in self.local_slots
+            and name not in self.local_params
+            and (name in self.global_names or name in mi.BUILTINS)
+        )
+
     def wrap_foreign_function(self, n, qualified_name, num_args):
         """Wrap a foreign function in a Hark function"""
         fn_code = [
             # args will already be on the stack, ready
             mi.PushB.from_node(n, mt.TlSymbol(qualified_name)),
             mi.Call.from_node(n, mt.TlInt(num_args)),
+            mi.Wait.from_node(n, mt.TlInt(0)),  # See _compile_call
             mi.Return.from_node(n),
         ]
         count = len(self.functions)
         identifier = f"#F:{qualified_name}"
         self.functions[identifier] = fn_code
 
+    def builtin_instruction(self, name: str):
+        """Get the instruction that builtin NAME compiles to, if any
+
+        Returns None if NAME isn't a builtin, or it might be shadowed by a local
+        or global binding (and so must be looked up at run time).
+        """
+        instr = mi.BUILTINS.get(name)
+        if (
+            instr is None
+            # Future takes operands that can't be known here
+            or instr.num_ops not in (None, 1)
+            or name in self.local_slots
+            or name in self.global_names
+        ):
+            return None
+        if instr in HELPERS:
+            self.helpers_needed.add(instr)
+        return instr
+
     ## At the toplevel, no executable code is created - only bindings
 
     @singledispatchmethod
@@ -218,6 +354,14 @@ class CompileToplevel:
 
     @compile_expr.register
     def _(self, n: nodes.N_Id):
+        if self.shadows_global(n.name):
+            slot = mt.TlInt(self.local_slots[n.name])
+            return [mi.PushSlotOrB.from_node(n, slot, mt.TlSymbol(n.name))]
+        if n.name in self.local_slots:
+            return [mi.PushSlot.from_node(n, mt.TlInt(self.local_slots[n.name]))]
+        # Global or builtin. If it's a builtin, it might be called later (so
+        # make sure that its helper is compiled).
+        self.builtin_instruction(n.name)
         return [mi.PushB.from_node(n, mt.TlSymbol(n.name))]
 
     @compile_expr.register
@@ -237,12 +381,28 @@ class CompileToplevel:
         # NOTE: parser only allows direct, named function calls atm, not
         # arbitrary expressions, so no need to check the type of n.fn
         arg_code = flatten(self.compile_expr(arg) for arg in n.args)
-        instr = mi.ACall if is_async else mi.Call
-        return (
-            arg_code
-            + self.compile_expr(n.fn)
-            + [instr.from_node(n, mt.TlInt(len(n.args)))]
+        num_args = mt.TlInt(len(n.args))
+        builtin = (
+            self.builtin_instruction(n.fn.name)
+            if not is_async and isinstance(n.fn, nodes.N_Id)
+            else None
         )
+        if builtin:
+            # No need to look the builtin up and Call it - just evaluate it
+            return arg_code + [builtin.from_node(n, num_args)]
+        instr = mi.ACall if is_async else mi.Call
+        code = arg_code + self.compile_expr(n.fn) + [instr.from_node(n, num_args)]
+        if (
+            not is_async
+            and isinstance(n.fn, nodes.N_Id)
+            and n.fn.name in self.foreign_names
+            and (n.fn.name not in self.local_slots or self.shadows_global(n.fn.name))
+        ):
+            # Foreign calls may be made in the background, returning a future
+            # (see TlMachine._call_foreign_in_pool). If the result is a value,
+            # Wait does nothing.
+            code.append(mi.Wait.from_node(n, mt.TlInt(0)))
+        return code
 
     @compile_expr.register
     def _(self, n: nodes.N_Call):
@@ -274,10 +434,22 @@ class CompileToplevel:
         if n.op == "=":
             if not isinstance(n.lhs, nodes.N_Id):
                 raise ValueError(f"Can't assign to non-identifier {n.lhs}")
-            return rhs + [mi.Bind.from_node(n, mt.TlSymbol(str(n.lhs.name)))]
+            return rhs + [self.bind_local(n, str(n.lhs.name))]
 
         else:
             lhs = self.compile_expr(n.lhs)
+            builtin = self.builtin_instruction(n.op)
+            if builtin in SHORT_CIRCUIT:
+                # Evaluate lhs first, and skip rhs if lhs decides the result
+                jump = SHORT_CIRCUIT[builtin]
+                return [
+                    *lhs,
+                    jump.from_node(n, mt.TlInt(len(rhs) + 1)),  # to after builtin
+                    *rhs,
+                    builtin.from_node(n, mt.TlInt(2)),
+                ]
+            if builtin:
+                return rhs + lhs + [builtin.from_node(n, mt.TlInt(2))]
             # TODO check arg order. Reverse?
             return (
                 rhs
@@ -325,8 +497,13 @@ class CompileToplevel:
 ###
 
 
-def tl_compile(top_nodes: list) -> Executable:
-    """Compile top-level nodes into an executable"""
+def tl_compile(top_nodes: list, optimise=True) -> Executable:
+    """Compile top-level nodes into an executable
+
+    If OPTIMISE is set, constant expressions are simplified first.
+    """
+    if optimise:
+        top_nodes = fold_constants(top_nodes)
     collection = CompileToplevel(top_nodes)
 
     location_offset = 0
@@ -0,0 +1,179 @@
+"""Compile-time simplification of the AST
+
+Constant expressions are folded into literals, and if-branches that can never be
+taken are removed. Folding follows the run time semantics of the corresponding
+instructions exactly (see machine.TlMachine), and anything that might behave
+differently (or raise an error) at run time is left alone.
+"""
+
+import dataclasses
+import operator
+from functools import singledispatch
+
+from ..hark_parser import nodes
+
+# Python types that literals are folded over
+NUMBERS = (int, float)
+
+
+def is_number(value) -> bool:
+    # NOTE: bool is a subclass of int in Python, but not a Hark number
+    return type(value) in NUMBERS
+
+
+def is_bool(value) -> bool:
+    return type(value) is bool
+
+
+def divide(a, b):
+    # Integer division truncates, as TlInt(a / b) does
+    return int(a / b) if type(a) is type(b) is int else a / b
+
+
+# Arithmetic binops, valid for (non-bool) numbers
+ARITHMETIC = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": divide,
+}
+
+# Comparison binops, valid for two numbers or two strings
+COMPARISONS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+# Boolean binops, valid for two bools
+BOOLEAN = {
+    "&&": lambda a, b: a and b,
+    "||": lambda a, b: a or b,
+}
+
+# Left-hand side values that decide the result of a boolean binop
+SHORT_CIRCUIT = {
+    "&&": False,
+    "||": True,
+}
+
+
+def fold_binop(op: str, a, b):
+    """Evaluate A OP B, or raise ValueError if it can't be done at compile time"""
+    if op in ARITHMETIC and is_number(a) and is_number(b):
+        if op == "/" and b == 0:
+            raise ValueError("Division by zero")  # Leave it for run time
+        return ARITHMETIC[op](a, b)
+    if op == "%" and type(a) is type(b) is int and b != 0:
+        return a % b
+    if op in COMPARISONS and (
+        (is_number(a) and is_number(b)) or (type(a) is type(b) is str)
+    ):
+        return COMPARISONS[op](a, b)
+    if op in BOOLEAN and is_bool(a) and is_bool(b):
+        return BOOLEAN[op](a, b)
+    raise ValueError(f"Can't fold {op}")
+
+
+def is_truthy(value) -> bool:
+    """Whether a literal value makes JumpIf jump"""
+    # "true" means anything that's not False or Null
+    return value is not None and value is not False
+
+
+def replace(n: nodes.Node, **changes) -> nodes.Node:
+    """Copy N with some fields changed, keeping source information"""
+    return dataclasses.replace(n, **changes)
+
+
+@singledispatch
+def fold(n):
+    """Fold constant expressions in N, returning the new node"""
+    # Other nodes (identifiers, literals, labels, ...) can't be simplified
+    return n
+
+
+@fold.register
+def _(n: nodes.N_Definition):
+    return replace(n, body=fold(n.body))
+
+
+@fold.register
+def _(n: nodes.N_Lambda):
+    return replace(n, body=fold(n.body))
+
+
+@fold.register
+def _(n: nodes.N_Progn):
+    exprs = []
+    for e in map(fold, n.exprs):
+        # Nested progns (e.g. from pruned if-branches) can be spliced in, which
+        # also keeps tail calls visible to optimise_tailcall.
+        if isinstance(e, nodes.N_Progn):
+            exprs += e.exprs
+        else:
+            exprs.append(e)
+    return replace(n, exprs=exprs)
+
+
+@fold.register
+def _(n: nodes.N_MultipleValues):
+    return replace(n, exprs=[fold(e) for e in n.exprs])
+
+
+@fold.register
+def _(n: nodes.N_Call):
+    return replace(n, args=[fold(a) for a in n.args])
+
+
+@fold.register
+def _(n: nodes.N_Argument):
+    return replace(n, value=fold(n.value))
+
+
+@fold.register
+def _(n: nodes.N_If):
+    cond = fold(n.cond)
+    if isinstance(cond, nodes.N_Literal):
+        return fold(n.then if is_truthy(cond.value) else n.els)
+    return replace(n, cond=cond, then=fold(n.then), els=fold(n.els))
+
+
+@fold.register
+def _(n: nodes.N_Binop):
+    rhs = fold(n.rhs)
+    if n.op == "=":
+        return replace(n, rhs=rhs)
+    lhs = fold(n.lhs)
+    if (
+        n.op in SHORT_CIRCUIT
+        and isinstance(lhs, nodes.N_Literal)
+        and lhs.value is SHORT_CIRCUIT[n.op]
+    ):
+        # The right-hand side would never be evaluated
+        return lhs
+    if isinstance(lhs, nodes.N_Literal) and isinstance(rhs, nodes.N_Literal):
+        try:
+            return nodes.N_Literal.from_node(n, fold_binop(n.op, lhs.value, rhs.value))
+        except (ValueError, ArithmeticError, TypeError):
+            pass
+    return replace(n, lhs=lhs, rhs=rhs)
+
+
+@fold.register
+def _(n: nodes.N_UnaryOp):
+    rhs = fold(n.rhs)
+    if isinstance(rhs, nodes.N_Literal):
+        if n.op == "-" and is_number(rhs.value):
+            return nodes.N_Literal.from_node(n, -rhs.value)
+        if n.op == "!":
+            return nodes.N_Literal.from_node(n, not rhs.value)
+    return replace(n, rhs=rhs)
+
+
+def fold_constants(top_nodes: list) -> list:
+    """Fold constant expressions in a list of top-level nodes"""
+    return [fold(n) for n in top_nodes]
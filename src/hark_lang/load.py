@@ -1,32 +1,115 @@
 """Top-level utilities for loading Hark code"""
+import functools
+import hashlib
+import logging
 import os
 import sys
 from pathlib import Path
+from typing import Tuple
 
+from . import __version__
 from .hark_compiler.compiler import HarkCompileError
 from .cli.interface import bad, neutral
+from .machine import codec
 from .machine.executable import Executable
 from .hark_compiler import tl_compile
 from .hark_parser.parser import HarkParseError, tl_parse
 
+LOG = logging.getLogger(__name__)
 
-def compile_text(text: str) -> Executable:
+# Compiled files are cached in this directory, next to the source (like
+# __pycache__). Set HARK_BYTECODE_CACHE=0 to disable it.
+CACHE_DIR = "__harkcache__"
+USE_CACHE = os.getenv("HARK_BYTECODE_CACHE", "1") != "0"
+
+
+def compile_text(text: str, optimise=True) -> Executable:
     "Parse and compile a Hark program"
     return tl_compile(
-        tl_parse("<unknown>", text, debug_lex=os.getenv("DEBUG_LEX", False))
+        tl_parse("<unknown>", text, debug_lex=os.getenv("DEBUG_LEX", False)),
+        optimise=optimise,
     )
 
 
-def compile_file(filename: Path) -> Executable:
+def compile_file(filename: Path, optimise=True) -> Executable:
     "Compile a Hark file, creating an Executable ready to be used"
+    return compile_file_cached(filename, optimise=optimise)[0]
+
+
+def cache_path(filename: Path, optimise=True) -> Path:
+    """Get the path of the bytecode cache file for FILENAME"""
+    filename = Path(filename)
+    kind = "" if optimise else ".noopt"
+    name = f"{filename.stem}.hark-{__version__}{kind}.hkc"
+    return filename.parent / CACHE_DIR / name
+
+
+@functools.lru_cache(maxsize=None)
+def _compiler_fingerprint() -> str:
+    """Identify the compiler, so that changing it invalidates the cache
+
+    The Hark version isn't enough, e.g. for an editable install.
+    """
+    root = Path(__file__).parent
+    files = []
+    for package in ("hark_parser", "hark_compiler", "machine"):
+        for source in sorted((root / package).glob("*.py")):
+            stat = source.stat()
+            files.append(f"{source.name}:{stat.st_mtime_ns}:{stat.st_size}")
+    return f"{__version__}:{codec.VERSION}:" + ",".join(files)
+
+
+def _source_key(filename: Path, text: str) -> bytes:
+    # The filename is included in the instruction source information
+    content = f"{_compiler_fingerprint()}\0{filename}\0{text}"
+    return hashlib.sha256(content.encode()).hexdigest().encode()
+
+
+def compile_file_cached(filename: Path, optimise=True) -> Tuple[Executable, bool]:
+    """Compile a Hark file, or load it from the bytecode cache
+
+    Returns the Executable, and whether it was loaded from the cache.
+
+    The cache file starts with a hash of the source, and is used if that
+    matches. Problems reading or writing it are ignored (the file is compiled
+    as usual).
+    """
     with open(filename, "r") as f:
         text = f.read()
 
-    return tl_compile(tl_parse(filename, text, debug_lex=os.getenv("DEBUG_LEX", False)))
+    path = cache_path(filename, optimise)
+    key = _source_key(filename, text)
+
+    if USE_CACHE:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            if data.startswith(key + b"\n"):
+                return codec.decode(data[len(key) + 1 :]), True
+        except FileNotFoundError:
+            pass
+        except (OSError, codec.CodecError) as exc:
+            LOG.warning("Can't use bytecode cache %s: %s", path, exc)
+
+    exe = tl_compile(
+        tl_parse(filename, text, debug_lex=os.getenv("DEBUG_LEX", False)),
+        optimise=optimise,
+    )
+
+    if USE_CACHE:
+        tmp = path.with_name(f"{path.name}.{os.getpid()}")
+        try:
+            path.parent.mkdir(exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(key + b"\n" + codec.encode(exe))
+            os.replace(tmp, path)
+        except OSError as exc:
+            LOG.info("Can't write bytecode cache %s: %s", path, exc)
+
+    return exe, False
 
 
 if __name__ == "__main__":
-    import sys
     import pprint
 
     filename = sys.argv[1]
@@ -1,44 +1,72 @@
 """Activation Records"""
 
-from dataclasses import dataclass
-from typing import Dict, Union
+from typing import Union
 
 from ..machine import types as mt
-from .hark_serialisable import HarkSerialisable
+from .hark_serialisable import check_slots
 
 ARecPtr = int
 
 
-@dataclass
-class ActivationRecord(HarkSerialisable):
+class ActivationRecord:
     """Like a stack frame, but more general.
 
     NOTE static_chain: ARecPtr: Not needed - we don't have nested lexical scopes
 
+    NOTE: Local variables aren't here - they're in the thread State, which has
+    the slots of the calling frames too.
+
+    NOTE: This isn't a dataclass, so that it can use __slots__ (one is created
+    for every function call).
     """
 
-    function: mt.TlFunctionPtr  # ....... Owner function
-    vmid: int  # ......................
-    # parameters: List[mt.TlType]  # ...... Function parameters
-    bindings: Dict[str, mt.TlType]  # ... Local bindings
-    # result: mt.TlType  # ................ Function return value
-    ref_count: int  # ................ Number of places this AR is used
-    dynamic_chain: Union[ARecPtr, None] = None  # caller activation record
-    call_site: Union[int, None] = None
-    deleted: bool = False
+    __slots__ = (
+        "function",  # ........ Owner function (TlFunctionPtr)
+        "vmid",
+        "ref_count",  # ....... Number of places this AR is used
+        "dynamic_chain",  # ... Caller activation record (ARecPtr)
+        "call_site",
+        "deleted",
+    )
+
+    def __init__(
+        self,
+        function: mt.TlFunctionPtr,
+        vmid: int,
+        ref_count: int,
+        dynamic_chain: Union[ARecPtr, None] = None,
+        call_site: Union[int, None] = None,
+        deleted: bool = False,
+    ):
+        self.function = function
+        self.vmid = vmid
+        self.ref_count = ref_count
+        self.dynamic_chain = dynamic_chain
+        self.call_site = call_site
+        self.deleted = deleted
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.serialise() == other.serialise()
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"ActivationRecord({fields})"
 
     def serialise(self):
-        d = super().serialise()
-        d["function"] = d["function"].serialise()
-        d["bindings"] = {
-            name: value.serialise() for name, value in d["bindings"].items()
-        }
-        return d
+        return dict(
+            function=self.function.serialise(),
+            vmid=self.vmid,
+            ref_count=self.ref_count,
+            dynamic_chain=self.dynamic_chain,
+            call_site=self.call_site,
+            deleted=self.deleted,
+        )
 
     @classmethod
     def deserialise(cls, d):
+        check_slots(d, "activation record")
+        d = dict(d)
         d["function"] = mt.TlType.deserialise(d["function"])
-        d["bindings"] = {
-            name: mt.TlType.deserialise(value) for name, value in d["bindings"].items()
-        }
-        return super().deserialise(d)
+        return cls(**d)
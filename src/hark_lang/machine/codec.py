@@ -0,0 +1,498 @@
+"""Binary serialisation of machine data
+
+A compact alternative to the nested-list JSON made by the serialise methods, for
+Hark values (TlType), State, ActivationRecord, Future and Executable.
+
+An encoded blob is MAGIC, a format version byte, and one value. Each value is a
+one-byte type tag followed by its data:
+
+- integers are zigzag-encoded varints (any size)
+- floats are 8-byte little-endian doubles
+- strings are a varint header and UTF-8 bytes. Repeated strings refer back to
+  the first occurrence in the same blob, so e.g. instruction names and source
+  filenames are only stored once.
+- lists, hashes and dicts are a varint count followed by their elements
+- records (State, ...) are their fields, in a fixed order
+
+Given a value store (see value_store), large lists, hashes and strings are
+stored in it separately, and replaced by a reference (their content hash).
+
+Blobs can be stored as text (see dumps/loads), which is distinguishable from the
+JSON format, so data in either format can be loaded.
+"""
+
+import base64
+import struct
+
+from ..exceptions import UnexpectedError
+from . import instructionset
+from . import types as mt
+from .arec import ActivationRecord
+from .executable import Executable
+from .future import Future, LazyValue
+from .state import State
+
+MAGIC = b"HK"
+
+# Increment when the format changes
+VERSION = 1
+
+# Prefix of the text (base64) form - JSON never starts with this
+TEXT_PREFIX = "hkb:"
+
+# Type tags
+NONE = 0
+FALSE = 1
+TRUE = 2
+INT = 3
+FLOAT = 4
+STR = 5
+LIST = 6
+DICT = 7
+REF = 8  # a value in the value store
+EMBED = 9  # a self-contained blob, without the header
+
+TL_NULL = 16
+TL_TRUE = 17
+TL_FALSE = 18
+TL_INT = 19
+TL_FLOAT = 20
+TL_STRING = 21
+TL_SYMBOL = 22
+TL_INSTRUCTION = 23
+TL_FUTURE_PTR = 24
+TL_QUOTE = 25
+TL_LIST = 26
+TL_HASH = 27
+TL_FUNCTION_PTR = 28
+TL_FOREIGN_PTR = 29
+
+STATE = 48
+AREC = 49
+FUTURE = 50
+EXECUTABLE = 51
+
+_DOUBLE = struct.Struct("<d")
+
+_HEADER = MAGIC + bytes([VERSION])
+
+# Lists and hashes with fewer items than this are never put in a value store
+# (and so aren't embedded, which costs a few bytes).
+MIN_STORED_ITEMS = 8
+
+# Embedded values' lengths are written after them, in this many bytes (a varint
+# padded with zero groups, which decodes the same)
+_EMBED_LENGTH_SIZE = 5
+
+
+class CodecError(UnexpectedError):
+    """Can't encode or decode binary data"""
+
+
+class _Encoder:
+    def __init__(self):
+        self.out = bytearray(_HEADER)
+        self.strings = {}
+
+    def varint(self, n: int):
+        out = self.out
+        while n >= 0x80:
+            out.append((n & 0x7F) | 0x80)
+            n >>= 7
+        out.append(n)
+
+    def int(self, n: int):
+        self.varint(n << 1 if n >= 0 else ((-n) << 1) - 1)
+
+    def str(self, s: str):
+        # Header: (index << 1) | 1 for a repeated string, or length << 1
+        idx = self.strings.get(s)
+        if idx is not None:
+            self.varint((idx << 1) | 1)
+            return
+        self.strings[s] = len(self.strings)
+        data = s.encode()
+        self.varint(len(data) << 1)
+        self.out += data
+
+    def items(self, items):
+        self.varint(len(items))
+        for item in items:
+            self.value(item)
+
+    def value(self, obj):
+        try:
+            write = _WRITERS[type(obj)]
+        except KeyError:
+            raise CodecError(f"Can't encode {type(obj).__name__}: {obj!r}") from None
+        write(self, obj)
+
+
+class _StoreEncoder(_Encoder):
+    """An encoder that puts large values in a value store"""
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
+    def value(self, obj):
+        kind = type(obj)
+        if kind is mt.TlString:
+            storable = len(obj) >= self.store.threshold
+        else:
+            storable = kind in _CONTAINERS and len(obj) >= MIN_STORED_ITEMS
+        if not storable:
+            super().value(obj)
+            return
+        # Embed it (self-contained, with its own string table), so that it can
+        # be stored on its own if it turns out to be big enough. It's encoded in
+        # place, and the length filled in afterwards.
+        out = self.out
+        tag_pos = len(out)
+        out.append(EMBED)
+        out += bytes(_EMBED_LENGTH_SIZE)
+        start = len(out)
+        strings, self.strings = self.strings, {}
+        super().value(obj)
+        self.strings = strings
+        length = len(out) - start
+        if length >= self.store.threshold:
+            data = _HEADER + out[start:]
+            del out[tag_pos:]
+            out.append(REF)
+            self.str(self.store.put(data, obj))
+        else:
+            out[tag_pos + 1 : start] = _padded_varint(length)
+
+
+def _padded_varint(n: int) -> bytes:
+    groups = [(n >> (7 * i)) & 0x7F for i in range(_EMBED_LENGTH_SIZE)]
+    if n >> (7 * _EMBED_LENGTH_SIZE):
+        raise CodecError(f"Embedded value too big ({n} bytes)")
+    return bytes(g | 0x80 for g in groups[:-1]) + bytes(groups[-1:])
+
+
+_CONTAINERS = (mt.TlList, mt.TlHash)
+
+
+def _tagged(tag, write=None):
+    """Make a writer that writes TAG, and then the object with WRITE"""
+
+    def writer(enc, obj):
+        enc.out.append(tag)
+        if write:
+            write(enc, obj)
+
+    return writer
+
+
+def _write_pairs(enc, pairs):
+    enc.varint(len(pairs))
+    for key, value in pairs:
+        enc.value(key)
+        enc.value(value)
+
+
+def _write_state(enc, state):
+    enc.int(state.ip)
+    enc.value(state.stopped)
+    enc.items(state._ds)
+    enc.items(state.slots)
+    enc.varint(len(state.frames))
+    for slots in state.frames:
+        enc.items(slots)
+    enc.value(state.error_msg)
+    enc.value(state.current_arec_ptr)
+
+
+def _write_arec(enc, rec):
+    enc.value(rec.function)
+    enc.value(rec.vmid)
+    enc.int(rec.ref_count)
+    enc.value(rec.dynamic_chain)
+    enc.value(rec.call_site)
+    enc.value(rec.deleted)
+
+
+def _write_future(enc, future):
+    enc.value(future.continuations)
+    enc.value(future.chain)
+    enc.value(future.resolved)
+    enc.value(future._value)  # not loading it if it's lazy
+    enc.value(future.gathers)
+    enc.value(future.parts)
+    enc.value(future.pending)
+    enc.value(future.splice)
+    enc.value(future.error)
+
+
+def _write_lazy(enc, lazy):
+    if getattr(enc, "store", None) is lazy.store:
+        # Already stored - just refer to it again
+        lazy.store.reference(lazy.key)
+        enc.out.append(REF)
+        enc.str(lazy.key)
+    else:
+        enc.value(lazy.load())
+
+
+def _write_instruction(enc, instr):
+    enc.str(instr.name)
+    enc.items(instr.operands)
+    enc.items(instr.source)
+
+
+def _write_executable(enc, exe):
+    _write_pairs(enc, exe.bindings.items())
+    _write_pairs(enc, exe.locations.items())
+    enc.varint(len(exe.code))
+    for instr in exe.code:
+        _write_instruction(enc, instr)
+
+
+_WRITERS = {
+    type(None): _tagged(NONE),
+    bool: lambda enc, obj: enc.out.append(TRUE if obj else FALSE),
+    int: _tagged(INT, _Encoder.int),
+    float: _tagged(FLOAT, lambda enc, obj: enc.out.extend(_DOUBLE.pack(obj))),
+    str: _tagged(STR, _Encoder.str),
+    list: _tagged(LIST, _Encoder.items),
+    tuple: _tagged(LIST, _Encoder.items),
+    dict: _tagged(DICT, lambda enc, obj: _write_pairs(enc, obj.items())),
+    mt.TlNull: _tagged(TL_NULL),
+    mt.TlTrue: _tagged(TL_TRUE),
+    mt.TlFalse: _tagged(TL_FALSE),
+    mt.TlInt: _tagged(TL_INT, _Encoder.int),
+    mt.TlFloat: _tagged(TL_FLOAT, lambda enc, obj: enc.out.extend(_DOUBLE.pack(obj))),
+    mt.TlString: _tagged(TL_STRING, _Encoder.str),
+    mt.TlSymbol: _tagged(TL_SYMBOL, _Encoder.str),
+    mt.TlInstruction: _tagged(TL_INSTRUCTION, _Encoder.str),
+    mt.TlFuturePtr: _tagged(TL_FUTURE_PTR, lambda enc, obj: enc.value(obj.value)),
+    mt.TlQuote: _tagged(TL_QUOTE, lambda enc, obj: enc.value(obj.data)),
+    mt.TlList: _tagged(TL_LIST, _Encoder.items),
+    mt.TlHash: _tagged(TL_HASH, lambda enc, obj: _write_pairs(enc, obj.items())),
+    mt.TlFunctionPtr: _tagged(
+        TL_FUNCTION_PTR, lambda enc, obj: enc.items([obj.identifier, obj.stack_ptr])
+    ),
+    mt.TlForeignPtr: _tagged(
+        TL_FOREIGN_PTR,
+        lambda enc, obj: enc.items([obj.identifier, obj.module, obj.qualified_name]),
+    ),
+    State: _tagged(STATE, _write_state),
+    ActivationRecord: _tagged(AREC, _write_arec),
+    Future: _tagged(FUTURE, _write_future),
+    LazyValue: _write_lazy,
+    Executable: _tagged(EXECUTABLE, _write_executable),
+}
+
+
+class _Decoder:
+    def __init__(self, data: bytes, store=None, pos=None):
+        self.data = data
+        self.store = store
+        self.strings = []
+        if pos is not None:
+            # Embedded (at POS) - no header
+            self.pos = pos
+            return
+        if data[: len(MAGIC)] != MAGIC:
+            raise CodecError("Not Hark binary data")
+        version = data[len(MAGIC)]
+        if version != VERSION:
+            raise CodecError(f"Data format version {version} isn't {VERSION}")
+        self.pos = len(MAGIC) + 1
+
+    def varint(self) -> int:
+        data = self.data
+        byte = data[self.pos]
+        self.pos += 1
+        if byte < 0x80:
+            return byte  # Most are small
+        n = byte & 0x7F
+        shift = 7
+        while True:
+            byte = data[self.pos]
+            self.pos += 1
+            n |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return n
+            shift += 7
+
+    def int(self) -> int:
+        z = self.varint()
+        return -((z + 1) >> 1) if z & 1 else z >> 1
+
+    def float(self) -> float:
+        (value,) = _DOUBLE.unpack_from(self.data, self.pos)
+        self.pos += _DOUBLE.size
+        return value
+
+    def str(self) -> str:
+        header = self.varint()
+        if header & 1:
+            return self.strings[header >> 1]
+        end = self.pos + (header >> 1)
+        if end > len(self.data):
+            raise IndexError("string past end of data")
+        s = self.data[self.pos : end].decode()
+        self.pos = end
+        self.strings.append(s)
+        return s
+
+    def items(self) -> list:
+        return [self.value() for _ in range(self.varint())]
+
+    def pairs(self):
+        return [(self.value(), self.value()) for _ in range(self.varint())]
+
+    def value(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        try:
+            read = _READERS[tag]
+        except KeyError:
+            raise CodecError(f"Unknown type tag {tag} at {self.pos - 1}") from None
+        return read(self)
+
+
+def _read_ref(dec):
+    key = dec.str()
+    if dec.store is None:
+        raise CodecError(f"Can't get stored value {key} without a value store")
+    return dec.store.get(key)
+
+
+def _read_embedded(dec):
+    length = dec.varint()
+    sub = _Decoder(dec.data, dec.store, dec.pos)
+    value = sub.value()
+    dec.pos += length
+    if sub.pos != dec.pos:
+        raise CodecError("Bad embedded value length")
+    return value
+
+
+def _read_state(dec):
+    state = State([])
+    state.ip = dec.int()
+    state.stopped = dec.value()
+    state._ds = dec.items()
+    state.slots = dec.items()
+    state.frames = [dec.items() for _ in range(dec.varint())]
+    state.error_msg = dec.value()
+    state.current_arec_ptr = dec.value()
+    return state
+
+
+def _read_arec(dec):
+    function = dec.value()
+    vmid = dec.value()
+    ref_count = dec.int()
+    return ActivationRecord(
+        function, vmid, ref_count, dec.value(), dec.value(), dec.value()
+    )
+
+
+def _read_future(dec):
+    names = (
+        "continuations",
+        "chain",
+        "resolved",
+        "value",
+        "gathers",
+        "parts",
+        "pending",
+        "splice",
+        "error",
+    )
+    fields = {}
+    for name in names:
+        if name == "value" and dec.store is not None and dec.data[dec.pos] == REF:
+            # Load stored values lazily (see future.LazyValue)
+            dec.pos += 1
+            fields[name] = dec.store.lazy(dec.str())
+        else:
+            fields[name] = dec.value()
+    return Future(**fields)
+
+
+def _read_instruction(dec):
+    name = dec.str()
+    operands = dec.items()
+    source = dec.items()
+    return getattr(instructionset, name)(*operands, source=source)
+
+
+def _read_executable(dec):
+    bindings = dict(dec.pairs())
+    locations = dict(dec.pairs())
+    code = [_read_instruction(dec) for _ in range(dec.varint())]
+    # Like Executable.deserialise, attributes aren't stored
+    return Executable(bindings=bindings, locations=locations, code=code, attributes=None)
+
+
+_READERS = {
+    NONE: lambda dec: None,
+    FALSE: lambda dec: False,
+    TRUE: lambda dec: True,
+    INT: _Decoder.int,
+    FLOAT: _Decoder.float,
+    STR: _Decoder.str,
+    LIST: _Decoder.items,
+    DICT: lambda dec: dict(dec.pairs()),
+    REF: _read_ref,
+    EMBED: _read_embedded,
+    TL_NULL: lambda dec: mt.TlNull(),
+    TL_TRUE: lambda dec: mt.TlTrue(),
+    TL_FALSE: lambda dec: mt.TlFalse(),
+    TL_INT: lambda dec: mt.TlInt(dec.int()),
+    TL_FLOAT: lambda dec: mt.TlFloat(dec.float()),
+    TL_STRING: lambda dec: mt.TlString(dec.str()),
+    TL_SYMBOL: lambda dec: mt.TlSymbol(dec.str()),
+    TL_INSTRUCTION: lambda dec: mt.TlInstruction(dec.str()),
+    TL_FUTURE_PTR: lambda dec: mt.TlFuturePtr(dec.value()),
+    TL_QUOTE: lambda dec: mt.TlQuote(dec.value()),
+    TL_LIST: lambda dec: mt.TlList(dec.items()),
+    TL_HASH: lambda dec: mt.TlHash(dec.pairs()),
+    TL_FUNCTION_PTR: lambda dec: mt.TlFunctionPtr(*dec.items()),
+    TL_FOREIGN_PTR: lambda dec: mt.TlForeignPtr(*dec.items()),
+    STATE: _read_state,
+    AREC: _read_arec,
+    FUTURE: _read_future,
+    EXECUTABLE: _read_executable,
+}
+
+
+def encode(obj, store=None) -> bytes:
+    """Encode OBJ (a Hark value, State, ActivationRecord, Future or Executable)
+
+    If STORE (a value_store.ValueStore) is given, large values are put in it.
+    """
+    enc = _Encoder() if store is None else _StoreEncoder(store)
+    enc.value(obj)
+    return bytes(enc.out)
+
+
+def decode(data: bytes, store=None):
+    """Decode the bytes made by encode (with the same STORE)"""
+    try:
+        return _Decoder(data, store).value()
+    except (IndexError, UnicodeDecodeError, struct.error) as exc:
+        raise CodecError(f"Truncated or corrupt data ({exc})") from exc
+
+
+def dumps(obj, store=None) -> str:
+    """Encode OBJ as text (e.g. for a string database attribute)"""
+    return TEXT_PREFIX + base64.b64encode(encode(obj, store)).decode()
+
+
+def loads(text: str, store=None):
+    """Decode the text made by dumps"""
+    if not is_encoded(text):
+        raise CodecError("Not Hark binary text")
+    return decode(base64.b64decode(text[len(TEXT_PREFIX) :]), store)
+
+
+def is_encoded(text) -> bool:
+    """Whether TEXT was made by dumps (rather than being e.g. JSON)"""
+    return isinstance(text, str) and text.startswith(TEXT_PREFIX)
@@ -1,6 +1,8 @@
 """Placeholder for the controller class"""
 
+import contextlib
 import logging
+import time
 from typing import List
 
 from ..exceptions import UnexpectedError
@@ -13,6 +15,9 @@ from .thread_failure import StackTraceItem, ThreadFailure
 
 LOG = logging.getLogger(__name__)
 
+# Shortest time to wait for machines to stop before checking again
+MIN_CHECK_PERIOD = 0.005
+
 
 class ControllerError(UnexpectedError):
     """A general controller error"""
@@ -33,7 +38,6 @@ class Controller:
             dynamic_chain=None,
             vmid=vmid,
             call_site=None,
-            bindings={},
             ref_count=1,
         )
         self.set_entrypoint(fn_ptr.identifier)
@@ -48,7 +52,6 @@ class Controller:
             dynamic_chain=caller_arec_ptr,
             vmid=vmid,
             call_site=caller_ip - 1,
-            bindings={},
             ref_count=1,
         )
         self._init_thread(vmid, fn_ptr, args, arec)
@@ -111,8 +114,12 @@ class Controller:
 
     ##
 
-    def resolve_future(self, vmid, value):
-        """Resolve a machine future, and any dependent futures"""
+    def resolve_future(self, vmid, value, error=None):
+        """Resolve a machine future, and any dependent futures
+
+        If ERROR ([message, traceback]) is given, the future has failed, and
+        machines waiting on it will raise the error.
+        """
         if isinstance(value, mt.TlFuturePtr):
             raise TypeError(value)
 
@@ -120,11 +127,15 @@ class Controller:
             future = self.get_future(vmid)
             future.resolved = True
             future.value = value
+            future.error = error
             self.set_future(vmid, future)
 
-            continuations = future.continuations
+            continuations = list(future.continuations)
             if future.chain:
-                continuations += self.resolve_future(future.chain, value)
+                continuations += self.resolve_future(future.chain, value, error)
+
+        for gather_id, idx in future.gathers:
+            continuations += self._gather_part(gather_id, idx, value)
 
         if self.is_top_level(vmid):
             self.result = mt.to_py_type(value)
@@ -132,6 +143,69 @@ class Controller:
         LOG.info("Resolved %d to %s. Continuations: %s", vmid, value, continuations)
         return continuations
 
+    def new_future(self, stopped=True) -> int:
+        """Make a future that isn't resolved by a machine, returning its ID
+
+        It belongs to a new thread that never runs. Unless STOPPED is set, the
+        thread counts as running (see all_stopped) until set_stopped is called,
+        e.g. once something outside of the VM has resolved the future.
+        """
+        vmid = self.new_thread()
+        self.set_state(vmid, State([]))
+        self.set_future(vmid, Future())
+        self.set_stopped(vmid, stopped)
+        return vmid
+
+    def gather(self, futures: list, splice=False) -> int:
+        """Make a future that resolves when all FUTURES have resolved
+
+        Its value is the list of their values (in order), or if SPLICE is set,
+        their values (which must be lists) concatenated. Each future keeps a
+        reference to the gather future, so waiting on it only costs one
+        continuation, however many futures there are.
+
+        Elements of FUTURES that aren't futures are taken as they are.
+
+        Returns the ID of the new future.
+        """
+        vmid = self.new_future()
+        self.set_future(
+            vmid, Future(parts=[None] * len(futures), pending=len(futures), splice=splice)
+        )
+
+        if not futures:
+            self.resolve_future(vmid, mt.TlList([]))
+
+        for idx, ptr in enumerate(futures):
+            if not isinstance(ptr, mt.TlFuturePtr):
+                self._gather_part(vmid, idx, ptr)
+                continue
+            with self.lock_future(ptr.vmid):
+                future = self.get_future(ptr.vmid)
+                if not future.resolved:
+                    future.gathers.append([vmid, idx])
+                    self.set_future(ptr.vmid, future)
+                    continue
+            # Already resolved. Nothing can be waiting on the new future yet, so
+            # there are no continuations to worry about.
+            self._gather_part(vmid, idx, future.value)
+
+        return vmid
+
+    def _gather_part(self, gather_id, idx, value) -> list:
+        """Set a part of a gather future, resolving it if it's the last one
+
+        Returns machines to invoke (see resolve_future).
+        """
+        with self.lock_future(gather_id):
+            gather = self.get_future(gather_id)
+            gather.parts[idx] = value
+            gather.pending -= 1
+            self.set_future(gather_id, gather)
+            if gather.pending > 0:
+                return []
+        return self.resolve_future(gather_id, gather.gathered_value())
+
     def finish(self, vmid, value) -> list:
         """Finish a machine, resolving its future
 
@@ -163,6 +237,7 @@ class Controller:
         Return tuple:
         - resolved (bool): whether the future has resolved
         - value: The data value, or None if not resolved
+        - error: The future's error (see Future), or None
         """
         if not isinstance(future_ptr, mt.TlFuturePtr):
             raise TypeError(future_ptr)
@@ -172,19 +247,52 @@ class Controller:
 
         with self.lock_future(future_ptr.vmid):
             future = self.get_future(future_ptr.vmid)
-            if future.resolved:
+            # Read everything while locked - the future can resolve (and the
+            # local controller's future object change) as soon as it's released
+            resolved, error = future.resolved, future.error
+            if resolved:
                 value = future.value
                 LOG.info("%s has resolved: %s", future_ptr, value)
             else:
                 value = None
                 self.add_continuation(future_ptr.vmid, vmid)
                 LOG.info("%d waiting on %s", vmid, future_ptr)
-                future = self.get_future(future_ptr.vmid)
 
-        return future.resolved, value
+        return resolved, value, error
 
     ##
 
+    def wait_until_stopped(self, timeout: float) -> bool:
+        """Wait up to TIMEOUT seconds for all machines to stop
+
+        Return whether they have all stopped. Controllers should override this
+        to return as soon as the last machine stops - by default, it only checks
+        before and after the timeout.
+        """
+        if self.all_stopped():
+            return True
+        time.sleep(timeout)
+        return self.all_stopped()
+
+    def check_periods(self, max_period: float):
+        """Generate timeouts for wait_until_stopped, doubling up to MAX_PERIOD
+
+        Short programs are noticed quickly, and long ones aren't checked too often.
+        """
+        period = min(MIN_CHECK_PERIOD, max_period)
+        while True:
+            yield period
+            period = min(period * 2, max_period)
+
+    def lock_thread(self, vmid):
+        """Get a context manager that is held while a machine runs thread VMID
+
+        A machine can be continued as soon as it has started waiting for a
+        future, before it has finished stopping. This stops the continuation
+        from running until then. By default, it does nothing.
+        """
+        return contextlib.nullcontext()
+
     def stop(self, vmid, finished_ok):
         """Signal that a machine has stopped running"""
         if not finished_ok:
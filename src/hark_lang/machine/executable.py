@@ -1,22 +1,43 @@
 """The Hark Machine Executable class"""
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any, Dict, List
 
 from ..cli import interface as ui
 from . import instructionset
+from .hark_serialisable import IncompatibleDataError
 from .instruction import Instruction
+from .linker import LinkedCode, link
 from .types import TlType
 
 
 @dataclass
 class Executable:
-    """Hark executable"""
+    """Hark executable
+
+    Once it's linked, the instructions in code aren't kept, as the linked code
+    has the same information in less memory. They're rebuilt when code is used
+    (e.g. to serialise it).
+    """
 
     bindings: Dict[str, TlType]
     locations: Dict[str, int]
     code: List[Instruction]
     attributes: dict
+    _linked: LinkedCode = field(default=None, init=False, repr=False, compare=False)
+
+    def link(self) -> LinkedCode:
+        """Get the linked (pre-decoded) code, linking it the first time"""
+        if self._linked is None:
+            self._linked = link(self)
+            del self.code
+        return self._linked
+
+    def __getattr__(self, name):
+        # Only called when normal lookup fails - i.e. for code, once linked
+        if name == "code" and self._linked is not None:
+            return self._linked.instructions()
+        raise AttributeError(name)
 
     def listing(self) -> str:
         """Get a pretty assembly listing string"""
@@ -49,6 +70,9 @@ class Executable:
     @classmethod
     def deserialise(cls, obj: dict):
         """Deserialise the dict created by serialise"""
+        # Bind was replaced by BindSlot when locals moved into slots
+        if any(i[0] == "Bind" for i in obj["code"]):
+            raise IncompatibleDataError("executable")
         code = [Instruction.deserialise(i, instructionset) for i in obj["code"]]
         bindings = {
             name: TlType.deserialise(val) for name, val in obj["bindings"].items()
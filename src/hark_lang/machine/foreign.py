@@ -5,13 +5,30 @@ import importlib
 import logging
 import os
 import sys
+import threading
 import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from functools import lru_cache
+from io import StringIO
 
 from ..exceptions import UserResolvableError
 
 LOG = logging.getLogger(__name__)
 
+# Number of worker processes to make foreign calls in. If 0, foreign calls are
+# made by the machine itself, blocking it (and, through the GIL, other machines
+# in the same process).
+FOREIGN_PROCESSES = int(os.getenv("HARK_FOREIGN_PROCESSES", 0))
+
+# Whether to pass lists and hashes to foreign functions as read-only views,
+# which convert elements on access, instead of copying them (see
+# types.ListView). Only for calls made in this process.
+FOREIGN_VIEWS = bool(os.getenv("HARK_FOREIGN_VIEWS", ""))
+
+_pool = None
+_pool_lock = threading.Lock()
+
 
 class ImportPyError(UserResolvableError):
     """Error importing some code from Python"""
@@ -58,3 +75,87 @@ def import_python_function(fnname, modname):
 
     LOG.info(f"Imported {modname}.{fnname}")
     return fn
+
+
+class ThreadStdout:
+    """A replacement for sys.stdout that can capture output per thread
+
+    Output from threads that are capturing (see captured_stdout) goes to their
+    capture buffer, and output from other threads goes to the original stream.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    @property
+    def capture(self):
+        return getattr(self._local, "capture", None)
+
+    @capture.setter
+    def capture(self, buf):
+        self._local.capture = buf
+
+    def _target(self):
+        return self.capture or self.stream
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+    def __getattr__(self, name):
+        # Everything else (encoding, isatty, ...) is the target's
+        return getattr(self._target(), name)
+
+
+_install_lock = threading.Lock()
+
+
+def _thread_stdout() -> ThreadStdout:
+    """Get the installed ThreadStdout, installing it if necessary"""
+    with _install_lock:
+        if not isinstance(sys.stdout, ThreadStdout):
+            sys.stdout = ThreadStdout(sys.stdout)
+        return sys.stdout
+
+
+@contextmanager
+def captured_stdout():
+    """Capture standard output written by the current thread
+
+    Yields the StringIO that output is written to. Other threads are not
+    affected, so this is safe to use in concurrent machines.
+    """
+    redirector = _thread_stdout()
+    outer = redirector.capture
+    redirector.capture = buf = StringIO()
+    try:
+        yield buf
+    finally:
+        redirector.capture = outer
+
+
+def get_foreign_pool() -> ProcessPoolExecutor:
+    """Get the process pool for foreign calls, starting it if necessary"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            LOG.info(f"Starting {FOREIGN_PROCESSES} processes for foreign calls")
+            _pool = ProcessPoolExecutor(max_workers=FOREIGN_PROCESSES)
+        return _pool
+
+
+def call_foreign(fnname, modname, args):
+    """Call a function in a pool process, returning (result, standard output)
+
+    If it raises, the output is attached to the exception as hark_stdout.
+    """
+    fn = import_python_function(fnname, modname)
+    with captured_stdout() as out:
+        try:
+            return fn(*args), out.getvalue()
+        except Exception as exc:
+            exc.hark_stdout = out.getvalue()
+            raise
@@ -1,34 +1,127 @@
 """Machine futures"""
 
+from itertools import chain
+
 from . import types as mt
 
 # Alias
 _SerialisedFuture = dict
 
 
+class LazyValue:
+    """A future's value that hasn't been loaded from a value store yet
+
+    Futures are often loaded just to check or update e.g. their continuations,
+    so the (possibly large) value is only loaded if Future.value is used.
+    """
+
+    __slots__ = ("store", "key")
+
+    def __init__(self, store, key: str):
+        self.store = store
+        self.key = key
+
+    def load(self):
+        return self.store.get(self.key)
+
+    def __repr__(self):
+        return f"<LazyValue {self.key}>"
+
+
 class Future:
-    """A future - holds results of function calls"""
+    """A future - holds results of function calls
+
+    A future can also gather the results of other futures (see
+    Controller.gather). It then has PENDING results left to wait for, and
+    PARTS holds the results so far (None for those still pending). Each of
+    those futures lists [gather future, part index] in its GATHERS.
+
+    A future that failed (e.g. a foreign call made in the process pool) has
+    ERROR set to [message, traceback], which is raised by anything waiting on
+    it.
+    """
+
+    __slots__ = (
+        "continuations",
+        "chain",
+        "resolved",
+        "_value",
+        "gathers",
+        "parts",
+        "pending",
+        "splice",
+        "error",
+    )
 
-    def __init__(self, *, continuations=None, chain=None, resolved=False, value=None):
+    def __init__(
+        self,
+        *,
+        continuations=None,
+        chain=None,
+        resolved=False,
+        value=None,
+        gathers=None,
+        parts=None,
+        pending=None,
+        splice=False,
+        error=None,
+    ):
         self.continuations = [] if not continuations else continuations
         self.chain = chain
         self.resolved = resolved
         self.value = value
+        self.gathers = [] if not gathers else gathers
+        self.parts = parts
+        self.pending = pending
+        self.splice = splice
+        self.error = error
+
+    @property
+    def value(self):
+        value = self._value
+        if type(value) is LazyValue:
+            value = self._value = value.load()
+        return value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+
+    def gathered_value(self) -> mt.TlList:
+        """The value of a gather future, once all the parts have resolved"""
+        if self.splice:
+            # Each part is a list, and the value is all of them concatenated
+            return mt.TlList(chain.from_iterable(self.parts))
+        return mt.TlList(self.parts)
 
     def serialise(self) -> _SerialisedFuture:
         value = self.value.serialise() if self.value else None
+        parts = (
+            None
+            if self.parts is None
+            else [None if p is None else p.serialise() for p in self.parts]
+        )
         return dict(
             continuations=self.continuations,
             chain=self.chain,
             resolved=self.resolved,
             value=value,
+            gathers=self.gathers,
+            parts=parts,
+            pending=self.pending,
+            splice=self.splice,
+            error=self.error,
         )
 
     @classmethod
     def deserialise(cls, data: _SerialisedFuture):
         if data.get("value", None):
             data["value"] = mt.TlType.deserialise(data["value"])
+        if data.get("parts", None) is not None:
+            data["parts"] = [
+                None if p is None else mt.TlType.deserialise(p) for p in data["parts"]
+            ]
         return cls(**data)
 
     def __repr__(self):
-        return f"<Future {id(self)} {self.resolved} ({self.value})>"
+        return f"<Future {id(self)} {self.resolved} ({self._value})>"
@@ -0,0 +1,156 @@
+"""A persistent hash map (Hash Array Mapped Trie)
+
+Setting a key returns a new map, sharing all but O(log n) nodes with the
+original, which is unchanged. Based on Bagwell, "Ideal Hash Trees" (2001).
+
+Each level of the trie consumes 5 bits of the (64 bit) key hash. Nodes only
+store the children that exist, using a bitmap to find a child's position.
+"""
+
+# Hash bits consumed per level, and the resulting branching factor
+BITS = 5
+MASK = (1 << BITS) - 1
+HASH_MASK = (1 << 64) - 1
+
+_MISSING = object()
+
+
+def _hash(key) -> int:
+    return hash(key) & HASH_MASK
+
+
+def _popcount(x: int) -> int:
+    return bin(x).count("1")
+
+
+class _Leaf:
+    __slots__ = ("hash", "key", "value")
+
+    def __init__(self, h, key, value):
+        self.hash = h
+        self.key = key
+        self.value = value
+
+    def matches(self, h, key) -> bool:
+        return self.hash == h and (self.key is key or self.key == key)
+
+
+class _Collision:
+    """Leaves with exactly the same hash"""
+
+    __slots__ = ("hash", "leaves")
+
+    def __init__(self, h, leaves):
+        self.hash = h
+        self.leaves = leaves
+
+    def get(self, h, shift, key, default):
+        for leaf in self.leaves:
+            if leaf.matches(h, key):
+                return leaf.value
+        return default
+
+    def set(self, h, shift, key, value):
+        if h != self.hash:
+            # Push this node down a level, next to the new key
+            node = _Bitmap(1 << ((self.hash >> shift) & MASK), [self])
+            return node.set(h, shift, key, value)
+        for idx, leaf in enumerate(self.leaves):
+            if leaf.matches(h, key):
+                leaves = list(self.leaves)
+                leaves[idx] = _Leaf(h, key, value)
+                return _Collision(h, leaves), False
+        return _Collision(h, self.leaves + [_Leaf(h, key, value)]), True
+
+    def items(self):
+        for leaf in self.leaves:
+            yield leaf.key, leaf.value
+
+
+class _Bitmap:
+    __slots__ = ("bitmap", "children")
+
+    def __init__(self, bitmap, children):
+        self.bitmap = bitmap
+        self.children = children
+
+    def get(self, h, shift, key, default):
+        bit = 1 << ((h >> shift) & MASK)
+        if not self.bitmap & bit:
+            return default
+        child = self.children[_popcount(self.bitmap & (bit - 1))]
+        if type(child) is _Leaf:
+            return child.value if child.matches(h, key) else default
+        return child.get(h, shift + BITS, key, default)
+
+    def set(self, h, shift, key, value):
+        """Set KEY (with hash H) to VALUE, returning (new node, whether added)"""
+        bit = 1 << ((h >> shift) & MASK)
+        idx = _popcount(self.bitmap & (bit - 1))
+        leaf = _Leaf(h, key, value)
+
+        if not self.bitmap & bit:
+            children = self.children[:idx] + [leaf] + self.children[idx:]
+            return _Bitmap(self.bitmap | bit, children), True
+
+        child = self.children[idx]
+        if type(child) is _Leaf:
+            if child.matches(h, key):
+                new_child, added = leaf, False
+            else:
+                new_child, added = _merge(child, leaf, shift + BITS), True
+        else:
+            new_child, added = child.set(h, shift + BITS, key, value)
+
+        children = list(self.children)
+        children[idx] = new_child
+        return _Bitmap(self.bitmap, children), added
+
+    def items(self):
+        for child in self.children:
+            if type(child) is _Leaf:
+                yield child.key, child.value
+            else:
+                yield from child.items()
+
+
+def _merge(a: _Leaf, b: _Leaf, shift: int):
+    """Make a node containing two leaves with different keys"""
+    if a.hash == b.hash:
+        return _Collision(a.hash, [a, b])
+    a_idx = (a.hash >> shift) & MASK
+    b_idx = (b.hash >> shift) & MASK
+    if a_idx == b_idx:
+        return _Bitmap(1 << a_idx, [_merge(a, b, shift + BITS)])
+    children = [a, b] if a_idx < b_idx else [b, a]
+    return _Bitmap((1 << a_idx) | (1 << b_idx), children)
+
+
+_EMPTY = _Bitmap(0, [])
+
+
+class HAMT:
+    """An immutable hash map. Iteration order is arbitrary."""
+
+    __slots__ = ("_root", "_len")
+
+    def __init__(self, root=_EMPTY, length=0):
+        self._root = root
+        self._len = length
+
+    def __len__(self):
+        return self._len
+
+    def get(self, key, default=None):
+        return self._root.get(_hash(key), 0, key, default)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def set(self, key, value) -> "HAMT":
+        """Get a new map with KEY set to VALUE"""
+        root, added = self._root.set(_hash(key), 0, key, value)
+        return HAMT(root, self._len + added)
+
+    def items(self):
+        return self._root.items()
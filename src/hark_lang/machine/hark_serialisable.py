@@ -1,9 +1,21 @@
 """HarkSerialisable class"""
 import datetime
-from dataclasses import asdict, dataclass
+from dataclasses import asdict
+
+from ..exceptions import UserResolvableError
+
+
+class IncompatibleDataError(UserResolvableError):
+    """Data saved by an older version of Hark"""
+
+    def __init__(self, what):
+        super().__init__(
+            f"This {what} was saved before local variables were stored in slots, "
+            "and can't be loaded.",
+            "Run the program again in a new session.",
+        )
 
 
-@dataclass
 class HarkSerialisable:
     """A basic serialisation mixin.
 
@@ -20,5 +32,11 @@ class HarkSerialisable:
         return cls(**item)
 
 
+def check_slots(data: dict, what: str):
+    """Check that DATA (a serialised State or ActivationRecord) has slots"""
+    if "slots" not in data and "bindings" in data:
+        raise IncompatibleDataError(what)
+
+
 def now_str() -> str:
     return datetime.datetime.now().isoformat()
@@ -26,6 +26,10 @@ class BadOperandsType(UnexpectedError):
         super().__init__(msg)
 
 
+# All Instruction types, indexed by opcode
+OPCODES = []
+
+
 class Instruction:
     """A Hark Machine bytecode instruction"""
 
@@ -33,6 +37,18 @@ class Instruction:
     op_types = None
     check_op_types = True
 
+    # Whether the (first) operand is a relative jump distance
+    is_jump = False
+
+    # Unique integer opcode, assigned when the Instruction type is defined. This
+    # is the index of the type in OPCODES.
+    opcode = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.opcode = len(OPCODES)
+        OPCODES.append(cls)
+
     @classmethod
     def from_node(cls, ast_node, *operands):
         source = [
@@ -10,12 +10,35 @@ class Jump(I):
     """Move execution to a different point, relative to the current point"""
 
     op_types = [int]
+    is_jump = True
 
 
 class JumpIf(I):
     """Relative jump, only if top element on the stack is True-ish"""
 
     op_types = [int]
+    is_jump = True
+
+
+class AndJump(I):
+    """Relative jump, only if the top element on the stack is False
+
+    The element is left on the stack, as the result of the && expression.
+    Otherwise, the right-hand side is evaluated. The element must be a boolean.
+    """
+
+    op_types = [int]
+    is_jump = True
+
+
+class OrJump(I):
+    """Relative jump, only if the top element on the stack is True
+
+    Like AndJump, but for ||.
+    """
+
+    op_types = [int]
+    is_jump = True
 
 
 # TODO class JumpLong ?
@@ -54,6 +77,19 @@ class Wait(I):
     op_types = [int]
 
 
+class WaitAll(I):
+    """Require every future in the list on top of the stack to be resolved
+
+    Like Wait, but waits for all of the futures at once (see Controller.gather),
+    so the machine is continued at most once. The list is replaced with the
+    list of resolved values. Elements that aren't futures are left as they are.
+
+    Like Wait, this must be an explicit instruction in the bytecode.
+    """
+
+    num_ops = 1
+
+
 class MFCall(I):
     """Call a *foreign* function"""
 
@@ -90,6 +126,24 @@ class ACall(I):
     op_types = [int]
 
 
+class PMap(I):
+    """Map a function over a list in parallel (async)
+
+    Arguments: function, list, and optionally the chunk size. The list is split
+    into chunks, and a new thread maps the function over each one (in order).
+    Pushes a future that resolves to the list of all results.
+
+    The chunk threads run PMAP_CHUNK, a Hark function compiled into every
+    executable that uses this instruction.
+    """
+
+    num_ops = 1
+
+
+# The name that the function run by each PMap thread is bound to
+PMAP_CHUNK = "#pmap_chunk"
+
+
 ##± Conditions ±################################################################
 
 # Like Exceptions, but a bit more powerful
@@ -140,24 +194,42 @@ class PushV(I):
     op_types = [mt.TlType]
 
 
-class Bind(I):
-    """Take the top value off the stack and bind it to a register
-
-    Maybe - if the given binding doesn't exist in the current binding stack,
-    each parent stack will be searched until a matching binding is found. That'd
-    make this machine far more dynamic! And make compilation harder.
+class BindSlot(I):
+    """Bind the top value on the stack (without removing it) to a local slot
 
+    Each function parameter and local variable is assigned a slot index in the
+    current frame by the compiler.
     """
 
-    op_types = [mt.TlSymbol]
+    op_types = [int]
+
+
+class PushSlot(I):
+    """Push the value in a local slot onto the stack"""
+
+    op_types = [int]
 
 
 class PushB(I):
-    """Push a bound value onto the stack"""
+    """Push a global (or builtin) value onto the stack, by name
+
+    The name is resolved when the executable is linked, if possible.
+    """
 
     op_types = [mt.TlSymbol]
 
 
+class PushSlotOrB(I):
+    """Push the value in a local slot, or if it's unset, a global by name
+
+    Used for locals with the same name as a global (or builtin), which refers
+    to the global until the local is assigned.
+    """
+
+    num_ops = 2
+    op_types = [int, mt.TlSymbol]
+
+
 class Pop(I):
     """Remove top value from the stack and discard it"""
 
@@ -308,3 +380,46 @@ class GetSessionId(I):
 
 class GetThreadId(I):
     """Get the current thread ID"""
+
+
+##± Builtins ±##################################################################
+
+# Instructions that can be called like functions, by name. The compiler emits
+# these directly when the name isn't shadowed by a local or global binding.
+BUILTINS = {
+    "future": Future,
+    "print": Print,
+    "sleep": Sleep,
+    "atomp": Atomp,
+    "nullp": Nullp,
+    "list": List,
+    "conc": Conc,
+    "append": Append,
+    "first": First,
+    "rest": Rest,
+    "length": Length,
+    "hash": Hash,
+    "get": HGet,
+    "set": HSet,
+    "nth": Nth,
+    "pmap": PMap,
+    "await_all": WaitAll,
+    "==": Eq,
+    "!=": NEq,
+    "+": Plus,
+    "-": Minus,
+    "*": Multiply,
+    "%": Modulo,
+    "/": Divide,
+    ">": GreaterThan,
+    ">=": GreaterThanOrEqual,
+    "<": LessThan,
+    "<=": LessThanOrEqual,
+    "&&": OpAnd,
+    "||": OpOr,
+    "!": BooloeanNeg,
+    "parse_float": ParseFloat,
+    "signal": Signal,
+    "sid": GetSessionId,
+    "tid": GetThreadId,
+}
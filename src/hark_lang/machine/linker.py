@@ -0,0 +1,147 @@
+"""Link an Executable into compact, pre-decoded bytecode
+
+The Executable produced by the compiler is a list of Instruction objects, each
+holding boxed (TlType) operands and source information. That's convenient for
+serialisation and listings, but not for execution. Linking turns it into
+parallel arrays:
+
+- ops: the integer opcode of each instruction
+- args: the pre-decoded operand of each instruction (or None)
+- source: a side table of (de-duplicated) source information
+
+Operands are decoded as follows:
+- Jumps: the relative distance becomes an absolute target IP
+- int operands (see Instruction.op_types): unboxed to int
+- TlSymbol: converted to a plain str (used as a binding name)
+- anything else: the operand value itself
+
+PushSlotOrB has two operands, which are decoded to a (slot, name) tuple.
+
+Global names (PushB) are resolved too. The compiler only emits PushB for names
+that aren't local, and globals and builtins can't change at run time, so PushB
+of a known name becomes PushV of its value. Unknown names are left for the
+machine to report.
+
+Call targets are resolved where possible. The function called is pushed by the
+instruction just before Call, so if that's a PushV of a function, the entry IP
+of the function is stored in call_targets (otherwise, it's -1).
+
+The linked code has everything needed to rebuild the Instructions (see
+instruction), so the Executable doesn't keep them once it's linked.
+"""
+
+from array import array
+from typing import Any, Dict, List, Tuple
+
+from . import types as mt
+from .instruction import OPCODES, Instruction
+from .instructionset import BUILTINS, Call, PushB, PushSlotOrB, PushV
+
+SourceInfo = Tuple[str, int, str, int]
+
+
+def decode_operand(instr: Instruction, next_ip: int) -> Any:
+    """Decode the operand of INSTR, which is followed by NEXT_IP"""
+    if not instr.operands:
+        return None
+    op = instr.operands[0]
+    if type(instr) is PushSlotOrB:
+        return (int(op), str(instr.operands[1]))
+    if instr.is_jump:
+        # + next_ip because the IP is advanced before the instruction is
+        # evaluated.
+        return next_ip + int(op)
+    if instr.op_types and instr.op_types[0] is int:
+        return int(op)
+    if type(op) is mt.TlSymbol:
+        return str(op)
+    return op
+
+
+def resolve_global(name: str, bindings: Dict[str, mt.TlType]) -> mt.TlType:
+    """Find the value of global NAME, or None if it isn't defined"""
+    if name in bindings:
+        return bindings[name]
+    if name in BUILTINS:
+        return mt.TlInstruction(name)
+    return None
+
+
+class LinkedCode:
+    """Pre-decoded bytecode, ready to be executed by the machine"""
+
+    def __init__(
+        self,
+        code: List[Instruction],
+        locations: Dict[str, int],
+        bindings: Dict[str, mt.TlType],
+    ):
+        # Opcodes fit in a byte for now - array will complain if they don't.
+        self.ops = array("B", (instr.opcode for instr in code))
+        self.args = [decode_operand(instr, ip + 1) for ip, instr in enumerate(code)]
+        self.locations = dict(locations)
+        self.call_targets = array("i", [-1]) * len(code)
+        # What's needed to rebuild instructions, that isn't in ops and args: the
+        # names of resolved globals, and the operands of instructions with more
+        # than one.
+        self._global_names = {}
+        self._operands = {}
+
+        for ip, instr in enumerate(code):
+            if len(instr.operands) > 1:
+                self._operands[ip] = instr.operands
+            if type(instr) is PushB:
+                value = resolve_global(self.args[ip], bindings)
+                if value is not None:
+                    self.ops[ip] = PushV.opcode
+                    self.args[ip] = value
+                    self._global_names[ip] = str(instr.operands[0])
+            elif type(instr) is Call and ip > 0 and self.ops[ip - 1] == PushV.opcode:
+                fn = self.args[ip - 1]
+                if type(fn) is mt.TlFunctionPtr and fn.identifier in locations:
+                    self.call_targets[ip] = locations[fn.identifier]
+
+        # Many instructions share a source line, so only keep unique entries
+        sources = {}
+        self._source_idx = array(
+            "I",
+            (sources.setdefault(tuple(instr.source), len(sources)) for instr in code),
+        )
+        self._sources = list(sources.keys())
+
+    def __len__(self):
+        return len(self.ops)
+
+    def source(self, ip: int) -> SourceInfo:
+        """Get the source information for the instruction at IP"""
+        return self._sources[self._source_idx[ip]]
+
+    def instruction(self, ip: int) -> Instruction:
+        """Rebuild the (unlinked) instruction at IP"""
+        instr_type = OPCODES[self.ops[ip]]
+        arg = self.args[ip]
+        if ip in self._global_names:
+            instr_type = PushB
+            operands = [mt.TlSymbol(self._global_names[ip])]
+        elif ip in self._operands:
+            operands = self._operands[ip]
+        elif arg is None:
+            operands = []
+        elif instr_type.is_jump:
+            operands = [mt.TlInt(arg - ip - 1)]
+        elif instr_type.op_types and instr_type.op_types[0] is int:
+            operands = [mt.TlInt(arg)]
+        elif type(arg) is str:
+            operands = [mt.TlSymbol(arg)]
+        else:
+            operands = [arg]
+        return instr_type(*operands, source=list(self.source(ip)))
+
+    def instructions(self) -> List[Instruction]:
+        """Rebuild all of the (unlinked) instructions"""
+        return [self.instruction(ip) for ip in range(len(self))]
+
+
+def link(exe) -> LinkedCode:
+    """Link an Executable"""
+    return LinkedCode(exe.code, exe.locations, exe.bindings)
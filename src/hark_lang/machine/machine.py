@@ -12,8 +12,7 @@ import os
 import sys
 import time
 import traceback
-from functools import singledispatchmethod
-from io import StringIO
+from functools import partial, singledispatchmethod
 from typing import Any, Dict, List
 
 from ..exceptions import HarkError, UserResolvableError, UnexpectedError
@@ -21,15 +20,46 @@ from . import types as mt
 from .arec import ActivationRecord
 from .controller import Controller
 from .executable import Executable
-from .instruction import Instruction
+from .instruction import OPCODES, Instruction
 from .instructionset import *
+from .linker import decode_operand
 from .probe import Probe
 from .state import State
 from .stdout_item import StdoutItem
-from .foreign import import_python_function
+from . import foreign
+from .foreign import captured_stdout, import_python_function
 
 LOG = logging.getLogger(__name__)
 
+# Instruction handlers, by Instruction type
+_HANDLERS = {}
+
+
+def _handles(instr_type):
+    """Register a TlMachine method as the handler for INSTR_TYPE"""
+
+    def _register(fn):
+        _HANDLERS[instr_type] = fn
+        return fn
+
+    return _register
+
+
+# Available execution engines:
+# - table: dispatch through a precomputed, opcode-indexed handler table
+# - singledispatch: dispatch on the instruction type (the original engine)
+ENGINES = ("table", "singledispatch")
+
+# The engine to use if one isn't given explicitly
+DEFAULT_ENGINE = "table"
+
+# Standard output is buffered by each machine, and written when it stops, or
+# when there's at least this much (characters)
+STDOUT_FLUSH_SIZE = int(os.getenv("HARK_STDOUT_FLUSH_SIZE", 4096))
+
+# The number of list elements mapped by each PMap thread, by default
+PMAP_CHUNK_SIZE = int(os.getenv("HARK_PMAP_CHUNK_SIZE", 16))
+
 
 class UnhandledError(UserResolvableError):
     """Unhandled Hark error()"""
@@ -41,12 +71,67 @@ class UnhandledError(UserResolvableError):
 class ForeignError(UserResolvableError):
     """Python code error"""
 
-    def __init__(self, exc):
-        info = sys.exc_info()
-        tb = "".join(traceback.format_exception(*info))
+    def __init__(self, exc, tb=None):
+        if tb is None:
+            info = sys.exc_info()
+            tb = "".join(traceback.format_exception(*info))
         super().__init__(str(exc), tb)
 
 
+class UnknownInstruction(UnexpectedError):
+    """Instruction not implemented by the machine"""
+
+    def __init__(self, instr_type):
+        super().__init__(f"{instr_type.__name__} (opcode {instr_type.opcode})")
+
+
+def record_failure(dc, vmid):
+    """Record the exception being handled as the failure of thread VMID
+
+    For errors outside of the instructions (which the machine records itself),
+    so that the thread is stopped and nothing waits for it forever.
+    """
+    state = dc.get_state(vmid)
+    state.error_msg = "Unexpected Exception:\n\n" + traceback.format_exc()
+    dc.set_state(vmid, state)
+    dc.stop(vmid, finished_ok=False)
+
+
+def _foreign_call_done(dc, invoker, vmid, future_id, call):
+    """Resolve the future of a foreign call made in the pool by machine VMID
+
+    Runs in this process (not the pool process) when the call has finished.
+    Errors in the call are stored in the future, and raised by the machine
+    that waits for it.
+    """
+    try:
+        error = None
+        try:
+            py_result, out = call.result()
+            value = mt.to_hark_type(py_result)
+        except Exception as exc:
+            out = getattr(exc, "hark_stdout", "")
+            error = [str(exc), "".join(traceback.format_exception(*sys.exc_info()))]
+            value = mt.TlNull()
+
+        if out:
+            dc.write_stdout(StdoutItem(vmid, out))
+        continuations = dc.resolve_future(future_id, value, error)
+        for machine in continuations:
+            dc.set_stopped(machine, False)
+        # Stop the future's thread after the waiting machines have "started", so
+        # that all_stopped can't be briefly True.
+        dc.set_stopped(future_id, True)
+        for machine in continuations:
+            invoker.invoke(machine)
+    except Exception:
+        # Exceptions in done-callbacks are only logged by concurrent.futures,
+        # so record it as the failure of the future's thread (which also stops
+        # it, so the run doesn't wait for it forever).
+        LOG.exception("Failed to resolve foreign call future %s", future_id)
+        record_failure(dc, future_id)
+
+
 def traverse(o, tree_types=(list, tuple)):
     """Traverse an arbitrarily nested list"""
     if isinstance(o, tree_types):
@@ -77,49 +162,21 @@ class TlMachine:
 
     """
 
-    builtins = {
-        "future": Future,
-        "print": Print,
-        "sleep": Sleep,
-        "atomp": Atomp,
-        "nullp": Nullp,
-        "list": List,
-        "conc": Conc,
-        "append": Append,
-        "first": First,
-        "rest": Rest,
-        "length": Length,
-        "hash": Hash,
-        "get": HGet,
-        "set": HSet,
-        "nth": Nth,
-        "==": Eq,
-        "!=": NEq,
-        "+": Plus,
-        "-": Minus,
-        "*": Multiply,
-        "%": Modulo,
-        "/": Divide,
-        ">": GreaterThan,
-        ">=": GreaterThanOrEqual,
-        "<": LessThan,
-        "<=": LessThanOrEqual,
-        "&&": OpAnd,
-        "||": OpOr,
-        "!": BooloeanNeg,
-        "parse_float": ParseFloat,
-        "signal": Signal,
-        "sid": GetSessionId,
-        "tid": GetThreadId,
-    }
-
-    def __init__(self, vmid, invoker):
+    # Instructions that can be called like functions, by name
+    builtins = BUILTINS
+
+    def __init__(self, vmid, invoker, engine=None, probe_level=None):
         self._steps = 0
+        self._yielded = False  # Whether run returned early (see max_steps)
+        self._handoff = None  # A continuation to run in this context next
+        self._probe_level = probe_level
+        self._stdout = []  # Buffered standard output (see _write_stdout)
+        self._stdout_size = 0
         self.vmid = vmid
         self.invoker = invoker
         self.dc = invoker.data_controller
         self.state = self.dc.get_state(self.vmid)
-        self.probe = Probe(self.vmid)
+        self.probe = Probe(self.vmid, probe_level)
         self.exe = self.dc.executable
         if not self.exe:
             raise UnexpectedError("No executable, can't start thread.")
@@ -128,6 +185,27 @@ class TlMachine:
             for name, val in self.exe.bindings.items()
             if isinstance(val, mt.TlForeignPtr)
         }
+        # Foreign calls can only be made in the pool if this process will be
+        # around to handle the result.
+        self._foreign_in_pool = foreign.FOREIGN_PROCESSES > 0 and invoker.persistent
+        self._code = self.exe.link()
+        self._ops = self._code.ops
+        self._args = self._code.args
+        self._call_targets = self._code.call_targets
+        engine = engine or os.getenv("HARK_VM_ENGINE", DEFAULT_ENGINE)
+        if engine == "table":
+            self._eval_current = self._eval_table
+        elif engine == "singledispatch":
+            self._eval_current = self._eval_singledispatch
+            self._instructions = self._code.instructions()
+        else:
+            raise UserResolvableError(
+                f"Unknown execution engine `{engine}'.", f"Choose one of {ENGINES}."
+            )
+        self.engine = engine
+        if self.probe.steps:
+            # Only pay for step tracing when it's enabled
+            self.step = self._step_traced
         LOG.debug("locations %s", self.exe.locations.keys())
         LOG.debug("foreign %s", self._foreign.keys())
         # No entrypoint argument - just set the IP in the state
@@ -138,27 +216,69 @@ class TlMachine:
 
     @property
     def instruction(self):
-        return self.exe.code[self.state.ip]
+        return self._code.instruction(self.state.ip)
 
     def step(self):
         """Execute the current instruction and increment the IP"""
-        if self.state.ip >= len(self.exe.code):
+        if self.state.ip >= len(self._ops):
             raise UnexpectedError("Instruction Pointer out of bounds")
-        instr = self.exe.code[self.state.ip]
-        self.probe.event(
-            "step",
-            ip=self.state.ip,
-            instr=str(instr),
-            ops=str(instr.operands),
-            top_of_stack=shortstr(self.state._ds[-3:]),
-        )
-        self.state.ip += 1  # NOTE - IP incremented before evaluation
-        self.evali(instr)
+        self._eval_current()
         self._steps += 1  # Counts successfully completed steps
 
-    def run(self):
+    def _step_traced(self):
+        """Like step, but record a probe event every probe.sample_every steps"""
+        ip = self.state.ip
+        if self._steps % self.probe.sample_every == 0 and ip < len(self._ops):
+            instr = self._code.instruction(ip)
+            self.probe.event(
+                "step",
+                ip=ip,
+                instr=str(instr),
+                ops=str(instr.operands),
+                top_of_stack=shortstr(self.state._ds[-3:]),
+            )
+        TlMachine.step(self)
+
+    def run(self, max_steps=None) -> "TlMachine":
+        """Run this machine, and then any continuation handed off to it
+
+        See _run for details. When this machine finishes, it can run one of the
+        machines waiting for it (see Return) in a new TlMachine, instead of
+        invoking it. This saves an invocation (e.g. a Lambda cold start).
+
+        Returns the machine that ran last - this one, or the last continuation
+        (which must be run again if it returned early, see MAX_STEPS).
+
+        Unexpected exceptions are recorded as the failure of the machine that
+        raised them (see record_failure) before being re-raised.
+        """
+        machine = self
+        machine._run_or_fail(max_steps)
+        while machine._handoff is not None and not machine._yielded:
+            vmid, machine._handoff = machine._handoff, None
+            LOG.info(f"Continuing {vmid} in the context of {machine.vmid}")
+            try:
+                machine = TlMachine(vmid, self.invoker, self.engine, self._probe_level)
+            except Exception:
+                record_failure(self.dc, vmid)
+                raise
+            machine._run_or_fail(max_steps)
+        return machine
+
+    def _run_or_fail(self, max_steps):
+        with self.dc.lock_thread(self.vmid):
+            try:
+                self._run(max_steps)
+            except Exception:
+                record_failure(self.dc, self.vmid)
+                raise
+
+    def _run(self, max_steps=None):
         """Step through instructions until stopped, or an error occurs
 
+        If MAX_STEPS is given, return after that many steps even if the machine
+        hasn't stopped (without saving anything). Call run again to continue.
+
         ERRORS: If one occurs, then:
         - store it in the data controller for analysis later
         - stop execution
@@ -167,11 +287,17 @@ class TlMachine:
         There are two "expected" kinds of errors - a Foreign function error, and
         a Rust "panic!" style error (general error).
         """
-        self.probe.event("run")
+        if not self._yielded:
+            self.probe.event("run")
+        self._yielded = False
         broken = False
+        last_step = self._steps + max_steps if max_steps else None
 
         self.state.stopped = False
         while not self.state.stopped:
+            if last_step is not None and self._steps >= last_step:
+                self._yielded = True
+                return
             try:
                 self.step()
             except HarkError as exc:
@@ -192,21 +318,60 @@ class TlMachine:
                 break
 
         self.probe.event("stop", steps=self._steps)
+        self._flush_stdout()
         self.dc.set_state(self.vmid, self.state)
         self.dc.set_probe_data(self.vmid, self.probe)
         # This order is important. dc.stop must come last to avoid race
         # conditions in us setting/the user reading the state and probe data
         self.dc.stop(self.vmid, finished_ok=not broken)
 
+    def _write_stdout(self, text: str):
+        """Buffer standard output, writing it if there's enough"""
+        if not text:
+            return
+        self._stdout.append(text)
+        self._stdout_size += len(text)
+        if self._stdout_size >= STDOUT_FLUSH_SIZE:
+            self._flush_stdout()
+
+    def _flush_stdout(self):
+        """Write any buffered standard output"""
+        if self._stdout:
+            self.dc.write_stdout(StdoutItem(self.vmid, "".join(self._stdout)))
+            self._stdout = []
+            self._stdout_size = 0
+
+    def _eval_table(self):
+        """Evaluate the current (linked) instruction, dispatching on the opcode"""
+        ip = self.state.ip
+        self.state.ip = ip + 1  # NOTE - IP incremented before evaluation
+        _DISPATCH_TABLE[self._ops[ip]](self, self._args[ip])
+
+    def _eval_singledispatch(self):
+        """Evaluate the current instruction, dispatching on its type"""
+        instr = self._instructions[self.state.ip]
+        self.state.ip += 1  # NOTE - IP incremented before evaluation
+        self.evali(instr)
+
+    def _eval_builtin(self, instr_type, num_args: int):
+        """Evaluate a builtin instruction that was called like a function"""
+        if self.engine == "table":
+            _DISPATCH_TABLE[instr_type.opcode](self, num_args)
+        else:
+            self.evali(instr_type(mt.TlInt(num_args)))
+
     @singledispatchmethod
     def evali(self, i: Instruction):
         """Evaluate instruction"""
         raise NotImplementedError(i)
 
-    @evali.register
-    def _(self, i: Bind):
-        """Bind the top value on the data stack to a name"""
-        ptr = str(i.operands[0])
+    # Instruction handlers follow. Each one takes the decoded operand of the
+    # instruction (see linker.decode_operand), or None if it has no operands.
+
+    @_handles(BindSlot)
+    def _(self, arg):
+        """Bind the top value on the data stack to a local slot"""
+        slots = self.state.slots
         try:
             val = self.state.ds_peek(0)
         except IndexError as exc:
@@ -218,23 +383,32 @@ class TlMachine:
             )
         if not isinstance(val, mt.TlType):
             raise UnexpectedError(f"Bad value to Bind: {val} ({type(val)})")
-        self.state.bindings[ptr] = val
+        if arg >= len(slots):
+            slots.extend([None] * (arg + 1 - len(slots)))
+        slots[arg] = val
+
+    @_handles(PushSlot)
+    def _(self, arg):
+        """Push the value in a local slot onto the data stack"""
+        slots = self.state.slots
+        val = slots[arg] if arg < len(slots) else None
+        if val is None:
+            raise UserResolvableError(
+                "Local variable used before it was assigned.", ""
+            )
+        self.state.ds_push(val)
 
-    @evali.register
-    def _(self, i: PushB):
-        """Push the value bound to a name onto the data stack"""
-        # The value on the stack must be a Symbol, which is used to find a
-        # function to call. Binding precedence:
+    @_handles(PushB)
+    def _(self, arg):
+        """Push the global value bound to a name onto the data stack"""
+        # Locals are in slots (see PushSlot), and names that can be resolved
+        # when linking are replaced with PushV. Binding precedence:
         #
-        # local binding -> exe global bindings -> builtins
-        sym = i.operands[0]
-        if not isinstance(sym, mt.TlSymbol):
-            raise UnexpectedError(str(ValueError(sym, type(sym))))
-
-        ptr = str(sym)
-        if ptr in self.state.bindings:
-            val = self.state.bindings[ptr]
-        elif ptr in self.exe.bindings:
+        # exe global bindings -> builtins
+        self._push_global(arg)
+
+    def _push_global(self, ptr):
+        if ptr in self.exe.bindings:
             val = self.exe.bindings[ptr]
         elif ptr in TlMachine.builtins:
             val = mt.TlInstruction(ptr)
@@ -244,116 +418,161 @@ class TlMachine:
 
         self.state.ds_push(val)
 
-    @evali.register
-    def _(self, i: PushV):
-        val = i.operands[0]
-        self.state.ds_push(val)
+    @_handles(PushSlotOrB)
+    def _(self, arg):
+        """Push a local slot, or the global of the same name if it's unset"""
+        idx, name = arg
+        slots = self.state.slots
+        val = slots[idx] if idx < len(slots) else None
+        if val is None:
+            self._push_global(name)
+        else:
+            self.state.ds_push(val)
+
+    @_handles(PushV)
+    def _(self, arg):
+        self.state.ds_push(arg)
 
-    @evali.register
-    def _(self, i: Pop):
+    @_handles(Pop)
+    def _(self, arg):
         self.state.ds_pop()
 
-    @evali.register
-    def _(self, i: Jump):
-        distance = i.operands[0]
-        self.state.ip += distance
+    @_handles(Jump)
+    def _(self, arg):
+        self.state.ip = arg
 
-    @evali.register
-    def _(self, i: JumpIf):
-        distance = i.operands[0]
+    @_handles(JumpIf)
+    def _(self, arg):
         a = self.state.ds_pop()
         # "true" means anything that's not False or Null
         if not isinstance(a, (mt.TlNull, mt.TlFalse)):
-            self.state.ip += distance
-
-    @evali.register
-    def _(self, i: Return):
+            self.state.ip = arg
+
+    @_handles(AndJump)
+    def _(self, arg):
+        a = self.state.ds_peek(0)
+        self._check_bool("&&", a)
+        if isinstance(a, mt.TlFalse):
+            self.state.ip = arg
+
+    @_handles(OrJump)
+    def _(self, arg):
+        a = self.state.ds_peek(0)
+        self._check_bool("||", a)
+        if isinstance(a, mt.TlTrue):
+            self.state.ip = arg
+
+    @_handles(Return)
+    def _(self, arg):
         # Only return if there's somewhere to go to, and it's in the same thread
         current_arec = self.dc.pop_arec(self.state.current_arec_ptr)
         if current_arec.dynamic_chain is not None:
             new_arec = self.dc.get_arec(current_arec.dynamic_chain)
             if new_arec.vmid == self.vmid:
-                self.probe.event("return")
+                if self.probe.calls:
+                    self.probe.event("return")
                 self.state.current_arec_ptr = current_arec.dynamic_chain  # the new AR
                 self.state.ip = current_arec.call_site + 1
-                self.state.bindings = new_arec.bindings
+                # Copied, as frames aren't changed once they're pushed
+                self.state.slots = list(self.state.frames.pop())
                 return
 
         # Otherwise, this thread has finished!
         self.state.stopped = True
         value = self.state.ds_peek(0)
-        self.probe.log(f"Returning value: {shortstr(value)}")
+        if self.probe.calls:
+            self.probe.log(f"Returning value: {shortstr(value)}")
         value, continuations = self.dc.finish(self.vmid, value)
         for machine in continuations:
             self.dc.set_stopped(machine, False)
-            # FIXME - invoke all of the machines except the last one. That
-            # one, just run in this context. Save one invocation. Caution:
-            # tricky with Lambda timeouts.
+        if continuations and self.invoker.can_run_inline():
+            # Run the last one in this context once this machine has stopped,
+            # and invoke the rest.
+            *continuations, self._handoff = continuations
+        for machine in continuations:
             self.invoker.invoke(machine)
 
-    @evali.register
-    def _(self, i: Call):
+    @_handles(Call)
+    def _(self, arg):
         # Arguments for the function must already be on the stack
-        num_args = i.operands[0]
+        num_args = arg
         # The value to call will have been retrieved earlier by PushB.
         fn = self.state.ds_pop()
 
         if isinstance(fn, mt.TlFunctionPtr):
-            self.probe.event("call", function=str(fn))
-            self.state.bindings = {}
+            if self.probe.calls:
+                self.probe.event("call", function=str(fn))
+            self.state.frames.append(self.state.slots)
+            self.state.slots = []
             arec = ActivationRecord(
                 function=fn,
                 vmid=self.vmid,
                 dynamic_chain=self.state.current_arec_ptr,
                 call_site=self.state.ip - 1,
-                bindings=self.state.bindings,
                 ref_count=1,
             )
             self.state.current_arec_ptr = self.dc.push_arec(self.vmid, arec)
-            self.state.ip = self.exe.locations[fn.identifier]
+            # Resolved when linking, unless the function is only known now
+            target = self._call_targets[self.state.ip - 1]
+            if target < 0:
+                target = self._code.locations[fn.identifier]
+            self.state.ip = target
 
         elif isinstance(fn, mt.TlForeignPtr):
-            self.probe.event("call_foreign", function=str(fn))
+            if self.probe.calls:
+                self.probe.event("call_foreign", function=str(fn))
             foreign_f = self._foreign[fn.identifier]
             args = tuple(reversed([self.state.ds_pop() for _ in range(num_args)]))
             # TODO automatically wait for the args? Somehow mark which one we're
             # waiting for in the continuation
 
-            py_args = list(map(mt.to_py_type, args))
+            if self._foreign_in_pool and self._ops[self.state.ip] == Wait.opcode:
+                # The result is waited for next, so this machine can stop until
+                # it's ready (the compiler emits Wait after foreign calls).
+                self._call_foreign_in_pool(fn, list(map(mt.to_py_type, args)))
+                return
 
-            # capture Python's standard output
-            sys.stdout = capstdout = StringIO()
-            try:
-                py_result = foreign_f(*py_args)
-            except Exception as e:
-                out = capstdout.getvalue()
-                self.dc.write_stdout(StdoutItem(self.vmid, out))
-                raise ForeignError(e) from e
-            finally:
-                sys.stdout = sys.__stdout__
-
-            # These aren't included in the finally clause because that really
-            # slows down the cleanup
-            out = capstdout.getvalue()
-            self.dc.write_stdout(StdoutItem(self.vmid, out))
+            to_py = mt.to_py_view if foreign.FOREIGN_VIEWS else mt.to_py_type
+            py_args = list(map(to_py, args))
+
+            with captured_stdout() as out:
+                try:
+                    py_result = foreign_f(*py_args)
+                except Exception as e:
+                    self._write_stdout(out.getvalue())
+                    raise ForeignError(e) from e
+            self._write_stdout(out.getvalue())
 
             result = mt.to_hark_type(py_result)
             self.state.ds_push(result)
 
         elif isinstance(fn, mt.TlInstruction):
-            self.probe.event("call_builtin", function=str(fn))
-            instr = TlMachine.builtins[fn](num_args)
-            self.evali(instr)
+            if self.probe.calls:
+                self.probe.event("call_builtin", function=str(fn))
+            self._eval_builtin(TlMachine.builtins[fn], num_args)
 
         else:
             # FIXME this should be a compile time check
             raise UnexpectedError(f"Don't know how to call `{fn}' of type {type(fn)}.")
 
-    @evali.register
-    def _(self, i: ACall):
+    def _call_foreign_in_pool(self, fn: mt.TlForeignPtr, py_args: list):
+        """Start a foreign call in the process pool, and push a future for it"""
+        call = foreign.get_foreign_pool().submit(
+            foreign.call_foreign, fn.identifier, fn.module, py_args
+        )
+        future_id = self.dc.new_future(stopped=False)
+        call.add_done_callback(
+            partial(_foreign_call_done, self.dc, self.invoker, self.vmid, future_id)
+        )
+        if self.probe.calls:
+            self.probe.log(f"Calling {fn} in the process pool ({future_id})")
+        self.state.ds_push(mt.TlFuturePtr(future_id))
+
+    @_handles(ACall)
+    def _(self, arg):
         # Arguments for the function must already be on the stack
         # ACall can *only* call functions in self.locations (unlike Call)
-        num_args = i.operands[0]
+        num_args = arg
         fn_ptr = self.state.ds_pop()
 
         # FIXME ugh.
@@ -362,7 +581,7 @@ class TlMachine:
         elif not isinstance(fn_ptr, mt.TlFunctionPtr):
             raise UnexpectedError(str(ValueError(fn_ptr)))
 
-        if fn_ptr.identifier not in self.exe.locations:
+        if fn_ptr.identifier not in self._code.locations:
             # FIXME this should be a compile time check
             raise UserResolvableError(
                 f"Can't find function `{fn_ptr}'.", "Does it really exist?"
@@ -375,26 +594,86 @@ class TlMachine:
         self.invoker.invoke(machine)
         future = mt.TlFuturePtr(machine)
 
-        self.probe.event("fork", to_function=fn_ptr.identifier, to_thread=machine)
+        if self.probe.calls:
+            self.probe.event("fork", to_function=fn_ptr.identifier, to_thread=machine)
         self.state.ds_push(future)
 
-    @evali.register
-    def _(self, i: Wait):
-        val = self.state.ds_peek(0)
+    @_handles(PMap)
+    def _(self, arg):
+        num_args = arg
+        if num_args not in (2, 3):
+            raise UserResolvableError(
+                f"pmap takes 2 or 3 arguments, not {num_args}",
+                "Usage: pmap(function, list, [chunk_size])",
+            )
+        args = [self.state.ds_pop() for _ in range(num_args)][::-1]
+        fn, items = args[:2]
+        chunk_size = args[2] if num_args == 3 else mt.TlInt(PMAP_CHUNK_SIZE)
+
+        items = mt.TlList([]) if isinstance(items, mt.TlNull) else items
+        if not isinstance(items, mt.TlList):
+            raise UserResolvableError(f"{items} ({type(items)}) is not a list", "")
+        if (
+            not isinstance(chunk_size, (mt.TlInt, mt.TlFloat))
+            or chunk_size < 1
+            or chunk_size != int(chunk_size)
+        ):
+            raise UserResolvableError(
+                f"Bad pmap chunk size: {chunk_size} ({type(chunk_size)})",
+                "The chunk size must be a whole number, at least 1",
+            )
+        chunk_size = int(chunk_size)
+
+        chunk_fn = self.exe.bindings.get(PMAP_CHUNK)
+        if chunk_fn is None:
+            raise UnexpectedError("The executable has no pmap helper function")
+
+        machines = [
+            self.dc.thread_machine(
+                self.state.current_arec_ptr,
+                self.state.ip,
+                chunk_fn,
+                [fn, items[start : start + chunk_size], mt.TlList([])],
+            )
+            for start in range(0, len(items), chunk_size)
+        ]
+        gather = self.dc.gather([mt.TlFuturePtr(m) for m in machines], splice=True)
+        for machine in machines:
+            self.invoker.invoke(machine)
 
-        if isinstance(val, mt.TlFuturePtr):
-            resolved, result = self.dc.get_or_wait(self.vmid, val)
-            if resolved:
+        if self.probe.calls:
+            self.probe.event("pmap", function=str(fn), to_threads=machines)
+        self.state.ds_push(mt.TlFuturePtr(gather))
+
+    def _wait_for(self, val: mt.TlFuturePtr):
+        """Replace the future VAL on top of the stack with its value
+
+        If it hasn't resolved, stop, and repeat the current instruction when
+        this machine is continued.
+        """
+        resolved, result, error = self.dc.get_or_wait(self.vmid, val)
+        if resolved:
+            if error is not None:
+                raise ForeignError(*error)
+            if self.probe.calls:
                 self.probe.log(f"{val} resolved, got {shortstr(result)}")
-                self.state.ds_set(0, result)
-            else:
+            self.state.ds_set(0, result)
+        else:
+            if self.probe.calls:
                 self.probe.log(f"Waiting for {val}")
-                # repeat the Wait instruction again:
-                #
-                # NOTE: Wait cannot be a builtin for this to work! It must be an
-                # explicit instruction in the bytecode.
-                self.state.ip -= 1
-                self.state.stopped = True
+            # repeat the Wait instruction again:
+            #
+            # NOTE: Wait cannot be a builtin for this to work! It must be an
+            # explicit instruction in the bytecode.
+            self.state.ip -= 1
+            self.state.stopped = True
+
+    @_handles(Wait)
+    def _(self, arg):
+        val = self.state.ds_peek(0)
+
+        if isinstance(val, mt.TlFuturePtr):
+            self._wait_for(val)
 
         elif isinstance(val, list) and any(
             isinstance(elt, mt.TlFuturePtr) for elt in traverse(val)
@@ -406,7 +685,7 @@ class TlMachine:
             raise UserResolvableError(
                 "Waiting on a list that contains futures!",
                 "For now, you (the programmer) are responsible for waiting on all "
-                "elements of structured data. For example, use map and await.",
+                "elements of structured data. For example, use await_all.",
             )
 
         else:
@@ -414,10 +693,36 @@ class TlMachine:
             # normal function call. ie the value already exists.
             pass
 
+    @_handles(WaitAll)
+    def _(self, arg):
+        if arg != 1:
+            raise UserResolvableError(
+                f"await_all takes 1 argument, not {arg}", "Usage: await_all(list)"
+            )
+        val = self.state.ds_peek(0)
+        val = mt.TlList([]) if isinstance(val, mt.TlNull) else val
+
+        if isinstance(val, mt.TlList):
+            if not any(isinstance(elt, mt.TlFuturePtr) for elt in val):
+                return  # Nothing to wait for
+            if self._ops[self.state.ip - 1] != WaitAll.opcode:
+                # It was called indirectly (see _wait_for)
+                raise UserResolvableError(
+                    "await_all must be called directly, by name", ""
+                )
+            # Wait on a single future for all of them. If this machine has to
+            # stop, it continues by waiting on this future (below).
+            val = mt.TlFuturePtr(self.dc.gather(list(val)))
+            self.state.ds_set(0, val)
+
+        if not isinstance(val, mt.TlFuturePtr):
+            raise UserResolvableError(f"{val} ({type(val)}) is not a list", "")
+        self._wait_for(val)
+
     ## "builtins":
 
-    @evali.register
-    def _(self, i: Future):
+    @_handles(Future)
+    def _(self, arg):
         wrapped = str(self.state.ds_pop())
         plugin_name = str(self.state.ds_pop())
 
@@ -432,25 +737,25 @@ class TlMachine:
             self.probe.log("Skipping call to plugin - controller doesn't support it")
             self.state.ds_push(wrapped)
 
-    @evali.register
-    def _(self, i: Atomp):
+    @_handles(Atomp)
+    def _(self, arg):
         val = self.state.ds_pop()
         self.state.ds_push(tl_bool(not isinstance(val, list)))
 
-    @evali.register
-    def _(self, i: Nullp):
+    @_handles(Nullp)
+    def _(self, arg):
         val = self.state.ds_pop()
         isnull = isinstance(val, mt.TlNull) or len(val) == 0
         self.state.ds_push(tl_bool(isnull))
 
-    @evali.register
-    def _(self, i: List):
-        num_args = i.operands[0]
+    @_handles(List)
+    def _(self, arg):
+        num_args = arg
         elts = [self.state.ds_pop() for _ in range(num_args)]
         self.state.ds_push(mt.TlList(reversed(elts)))
 
-    @evali.register
-    def _(self, i: Conc):
+    @_handles(Conc)
+    def _(self, arg):
         b = self.state.ds_pop()
         a = self.state.ds_pop()
 
@@ -462,12 +767,12 @@ class TlMachine:
             raise UserResolvableError(f"b ({b}, {type(b)}) is not a list", "")
 
         if isinstance(a, mt.TlList):
-            self.state.ds_push(mt.TlList(a + b))
+            self.state.ds_push(a.extended(b))
         else:
-            self.state.ds_push(mt.TlList([a] + b))
+            self.state.ds_push(mt.TlList([a]).extended(b))
 
-    @evali.register
-    def _(self, i: Append):
+    @_handles(Append)
+    def _(self, arg):
         b = self.state.ds_pop()
         a = self.state.ds_pop()
 
@@ -477,47 +782,47 @@ class TlMachine:
             # TODO compile time checks...
             raise UserResolvableError(f"{a} ({type(a)}) is not a list", "")
 
-        self.state.ds_push(mt.TlList(a + [b]))
+        self.state.ds_push(a.appended(b))
 
-    @evali.register
-    def _(self, i: First):
+    @_handles(First)
+    def _(self, arg):
         lst = self.state.ds_pop()
         if not isinstance(lst, mt.TlList):
             raise UserResolvableError(f"{lst} ({type(lst)}) is not a list", "")
         self.state.ds_push(lst[0])
 
-    @evali.register
-    def _(self, i: Rest):
+    @_handles(Rest)
+    def _(self, arg):
         lst = self.state.ds_pop()
         if not isinstance(lst, mt.TlList):
             raise UserResolvableError(f"{lst} ({type(lst)}) is not a list", "")
-        self.state.ds_push(lst[1:])
+        self.state.ds_push(lst[1:])  # A view - doesn't copy
 
-    @evali.register
-    def _(self, i: Nth):
+    @_handles(Nth)
+    def _(self, arg):
         n = self.state.ds_pop()
         lst = self.state.ds_pop()
         if not isinstance(lst, mt.TlList):
             raise UserResolvableError(f"{lst} ({type(lst)}) is not a list", "")
         self.state.ds_push(lst[n])
 
-    @evali.register
-    def _(self, i: Length):
+    @_handles(Length)
+    def _(self, arg):
         lst = self.state.ds_pop()
         if not isinstance(lst, mt.TlList):
             raise UserResolvableError(f"{lst} ({type(lst)}) is not a list", "")
         self.state.ds_push(mt.TlInt(len(lst)))
 
-    @evali.register
-    def _(self, i: Hash):
-        num_args = i.operands[0]
+    @_handles(Hash)
+    def _(self, arg):
+        num_args = arg
         # convert list [a, b, c, d] (reversed) -> dict {a: b, c: d}
         elts = [self.state.ds_pop() for _ in range(num_args)][::-1]
         pairs = zip(elts[::2], elts[1::2])
         self.state.ds_push(mt.TlHash(pairs))
 
-    @evali.register
-    def _(self, i: HGet):
+    @_handles(HGet)
+    def _(self, arg):
         key = self.state.ds_pop()
         obj = self.state.ds_pop()
         if not isinstance(obj, mt.TlHash):
@@ -528,68 +833,74 @@ class TlMachine:
             res = mt.TlNull()
         self.state.ds_push(res)
 
-    @evali.register
-    def _(self, i: HSet):
+    @_handles(HSet)
+    def _(self, arg):
         value = self.state.ds_pop()
         key = self.state.ds_pop()
         obj = self.state.ds_pop()
         if not isinstance(obj, mt.TlHash):
             raise UserResolvableError(f"{obj} ({type(obj)}) is not a hash", "")
-        # Create a new object, overwriting the old key
-        self.state.ds_push(mt.TlHash({**obj, key: value}))
+        # Create a new object (sharing structure with the old one)
+        self.state.ds_push(obj.set(key, value))
 
-    @evali.register
-    def _(self, i: Plus):
+    @_handles(Plus)
+    def _(self, arg):
         a = self.state.ds_pop()
         b = self.state.ds_pop()
         cls = new_number_type(a, b)
         self.state.ds_push(cls(a + b))
 
-    @evali.register
-    def _(self, i: Minus):
+    @_handles(Minus)
+    def _(self, arg):
         a = self.state.ds_pop()
         b = self.state.ds_pop()
         cls = new_number_type(a, b)
         self.state.ds_push(cls(a - b))
 
-    @evali.register
-    def _(self, i: Multiply):
+    @_handles(Multiply)
+    def _(self, arg):
         a = self.state.ds_pop()
         b = self.state.ds_pop()
         cls = new_number_type(a, b)
         self.state.ds_push(cls(a * b))
 
-    @evali.register
-    def _(self, i: Divide):
+    @_handles(Divide)
+    def _(self, arg):
         a = self.state.ds_pop()
         b = self.state.ds_pop()
         cls = new_number_type(a, b)
         self.state.ds_push(cls(a / b))
 
-    @evali.register
-    def _(self, i: Modulo):
+    @_handles(Modulo)
+    def _(self, arg):
         a = self.state.ds_pop()
         b = self.state.ds_pop()
         self.state.ds_push(mt.TlInt(a % b))
 
-    @evali.register
-    def _(self, i: Eq):
+    @_handles(Eq)
+    def _(self, arg):
         a = self.state.ds_pop()
         b = self.state.ds_pop()
         self.state.ds_push(tl_bool(a == b))
 
-    @evali.register
-    def _(self, i: GreaterThan):
+    @_handles(GreaterThan)
+    def _(self, arg):
         a = self.state.ds_pop()
         b = self.state.ds_pop()
         self.state.ds_push(tl_bool(a > b))
 
-    @evali.register
-    def _(self, i: LessThan):
+    @_handles(LessThan)
+    def _(self, arg):
         a = self.state.ds_pop()
         b = self.state.ds_pop()
         self.state.ds_push(tl_bool(a < b))
 
+    def _check_bool(self, op, a):
+        if not isinstance(a, mt.BOOLEANS):
+            raise UserResolvableError(
+                f"Operands to {op} must both be booleans", f"Got {a.__tlname__}"
+            )
+
     def _check_bools(self, op, a, b):
         if not isinstance(a, mt.BOOLEANS) or not isinstance(b, mt.BOOLEANS):
             raise UserResolvableError(
@@ -597,9 +908,10 @@ class TlMachine:
                 f"Got {a.__tlname__} and {b.__tlname__}",
             )
 
-    @evali.register
-    def _(self, i: OpAnd):
-        # FIXME no short-circuit behaviour
+    @_handles(OpAnd)
+    def _(self, arg):
+        # NOTE: Only evaluated if the left-hand side didn't decide the result
+        # (see AndJump)
         a = self.state.ds_pop()
         b = self.state.ds_pop()
         self._check_bools("&&", a, b)
@@ -607,9 +919,10 @@ class TlMachine:
             tl_bool(isinstance(a, mt.TlTrue) and isinstance(b, mt.TlTrue))
         )
 
-    @evali.register
-    def _(self, i: OpOr):
-        # FIXME no short-circuit behaviour
+    @_handles(OpOr)
+    def _(self, arg):
+        # NOTE: Only evaluated if the left-hand side didn't decide the result
+        # (see OrJump)
         a = self.state.ds_pop()
         b = self.state.ds_pop()
         self._check_bools("||", a, b)
@@ -617,13 +930,13 @@ class TlMachine:
             tl_bool(isinstance(a, mt.TlTrue) or isinstance(b, mt.TlTrue))
         )
 
-    @evali.register
-    def _(self, i: BooloeanNeg):
+    @_handles(BooloeanNeg)
+    def _(self, arg):
         a = self.state.ds_pop()
         self.state.ds_push(tl_bool(not mt.to_py_type(a)))
 
-    @evali.register
-    def _(self, i: UnaryMinus):
+    @_handles(UnaryMinus)
+    def _(self, arg):
         a = self.state.ds_pop()
         if isinstance(a, float):
             self.state.ds_push(mt.TlFloat(-a))
@@ -632,63 +945,95 @@ class TlMachine:
         else:
             raise UnexpectedError("cannot negate non-numeric types")
 
-    @evali.register
-    def _(self, i: NEq):
+    @_handles(NEq)
+    def _(self, arg):
         a = self.state.ds_pop()
         b = self.state.ds_pop()
         self.state.ds_push(tl_bool(a != b))
 
-    @evali.register
-    def _(self, i: GreaterThanOrEqual):
+    @_handles(GreaterThanOrEqual)
+    def _(self, arg):
         a = self.state.ds_pop()
         b = self.state.ds_pop()
         self.state.ds_push(tl_bool(a >= b))
 
-    @evali.register
-    def _(self, i: LessThanOrEqual):
+    @_handles(LessThanOrEqual)
+    def _(self, arg):
         a = self.state.ds_pop()
         b = self.state.ds_pop()
         self.state.ds_push(tl_bool(a <= b))
 
-    @evali.register
-    def _(self, i: ParseFloat):
+    @_handles(ParseFloat)
+    def _(self, arg):
         x = self.state.ds_pop()
         self.state.ds_push(mt.TlFloat(float(x)))
 
-    @evali.register
-    def _(self, i: Sleep):
+    @_handles(Sleep)
+    def _(self, arg):
         t = self.state.ds_peek(0)
         time.sleep(t)
 
-    @evali.register
-    def _(self, i: Print):
+    @_handles(Print)
+    def _(self, arg):
         # Leave the value in the stack - print() 'returns' the value printed
         val = self.state.ds_peek(0)
-        # This should take a vmid - data stored is a tuple (vmid, str)
-        # Could also store a timestamp...
-        self.dc.write_stdout(StdoutItem(self.vmid, str(val) + "\n"))
+        # Written straight away, with anything already buffered
+        self._write_stdout(str(val) + "\n")
+        self._flush_stdout()
 
-    @evali.register
-    def _(self, i: Signal):
+    @_handles(Signal)
+    def _(self, arg):
         msg = self.state.ds_peek(0)
         val = self.state.ds_peek(1)
-        self.dc.write_stdout(StdoutItem(self.vmid, f"\n[signal {val}]: {msg}\n"))
+        self._write_stdout(f"\n[signal {val}]: {msg}\n")
+        self._flush_stdout()
         if str(val) == "error":
             raise UnhandledError(msg)
         # other kinds of signals don't need special handling
 
-    @evali.register
-    def _(self, i: GetSessionId):
+    @_handles(GetSessionId)
+    def _(self, arg):
         self.state.ds_push(mt.TlString(self.dc.session_id))
 
-    @evali.register
-    def _(self, i: GetThreadId):
+    @_handles(GetThreadId)
+    def _(self, arg):
         self.state.ds_push(mt.TlInt(self.vmid))
 
     def __repr__(self):
         return f"<Machine {id(self)}>"
 
 
+def _not_implemented(instr_type):
+    """Make a handler for INSTR_TYPE, which the machine can't evaluate"""
+
+    def _unknown(self, arg):
+        raise UnknownInstruction(instr_type)
+
+    return _unknown
+
+
+# The handler for every opcode, so that the table engine only needs a list index
+# per step.
+_DISPATCH_TABLE = [
+    _HANDLERS.get(instr_type) or _not_implemented(instr_type)
+    for instr_type in OPCODES
+]
+
+
+def _decoding(handler):
+    """Wrap HANDLER so it can be called with an (undecoded) Instruction"""
+
+    def _evali(self, i: Instruction):
+        # self.state.ip has already been advanced past i
+        return handler(self, decode_operand(i, self.state.ip))
+
+    return _evali
+
+
+for _instr_type, _handler in _HANDLERS.items():
+    TlMachine.__dict__["evali"].register(_instr_type, _decoding(_handler))
+
+
 def tl_bool(val):
     """Make a Hark bool-ish from val"""
     if val not in (True, False):
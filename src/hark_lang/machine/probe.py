@@ -1,10 +1,36 @@
 """Machine Probe"""
 
+import os
 from dataclasses import dataclass
 
+from ..exceptions import UserResolvableError
 from .types import TlType
 from .hark_serialisable import HarkSerialisable, now_str
 
+# Probe levels, in increasing order of detail (and cost):
+# - off: record nothing
+# - calls: record function calls, forks, returns and logs
+# - sampled: calls, plus every Nth step
+# - full: calls, plus every step
+PROBE_LEVELS = ("off", "calls", "sampled", "full")
+OFF, CALLS, SAMPLED, FULL = range(len(PROBE_LEVELS))
+
+DEFAULT_PROBE_LEVEL = "calls"
+
+# Record one in this many steps at the "sampled" level
+DEFAULT_SAMPLE_EVERY = 100
+
+
+def get_probe_level(name=None) -> int:
+    """Get the probe level called NAME, or the one set in the environment"""
+    name = name or os.getenv("HARK_PROBE_LEVEL", DEFAULT_PROBE_LEVEL)
+    try:
+        return PROBE_LEVELS.index(name)
+    except ValueError:
+        raise UserResolvableError(
+            f"Unknown probe level `{name}'.", f"Choose one of {PROBE_LEVELS}."
+        )
+
 
 @dataclass(frozen=True)
 class ProbeLog(HarkSerialisable):
@@ -23,18 +49,45 @@ class ProbeEvent(HarkSerialisable):
     # TODO deserialise?
 
 
+def get_sample_every() -> int:
+    """Get the number of steps per sample set in the environment"""
+    value = os.getenv("HARK_PROBE_SAMPLE_EVERY", str(DEFAULT_SAMPLE_EVERY))
+    try:
+        every = int(value)
+    except ValueError:
+        every = 0
+    if every < 1:
+        raise UserResolvableError(
+            f"Bad HARK_PROBE_SAMPLE_EVERY `{value}'.",
+            "Set it to a whole number of steps, at least 1.",
+        )
+    return every
+
+
 class Probe:
-    """A small interface for storing machine logs and events"""
+    """A small interface for storing machine logs and events
+
+    Callers should check `calls` and `steps` before building event data, so
+    that nothing is allocated for levels that don't record it.
+    """
 
-    def __init__(self, vmid):
+    def __init__(self, vmid, level=None):
         self.vmid = vmid
+        self.level = get_probe_level(level)
+        self.calls = self.level >= CALLS
+        self.steps = self.level >= SAMPLED
+        self.sample_every = get_sample_every() if self.level == SAMPLED else 1
         self.logs = []
         self.events = []
 
     def event(self, etype: str, **data):
+        if not self.calls:
+            return
         e = ProbeEvent(thread=self.vmid, time=now_str(), event=etype, data=data)
         self.events.append(e)
 
     def log(self, text):
+        if not self.calls:
+            return
         l = ProbeLog(thread=self.vmid, time=now_str(), text=text)
         self.logs.append(l)
@@ -0,0 +1,155 @@
+"""A persistent vector
+
+Appending (or truncating) returns a new vector, sharing all but O(log n) nodes
+with the original, which is unchanged. Based on Clojure's PersistentVector,
+which applies Bagwell's "Ideal Hash Trees" to indexed sequences.
+
+Elements are stored in leaves of up to BRANCH elements, in a trie where each
+level consumes BITS bits of the index. The last leaf is kept outside the trie,
+in the "tail", so most appends only copy the tail.
+"""
+
+# Index bits consumed per level, and the resulting branching factor
+BITS = 5
+BRANCH = 1 << BITS
+MASK = BRANCH - 1
+
+
+def _tailoff(count: int) -> int:
+    """The index of the first element in the tail of a COUNT-element vector"""
+    return 0 if count < BRANCH else ((count - 1) >> BITS) << BITS
+
+
+def _new_path(level: int, node: list) -> list:
+    while level > 0:
+        node = [node]
+        level -= BITS
+    return node
+
+
+def _chunks(items: list) -> list:
+    return [items[i : i + BRANCH] for i in range(0, len(items), BRANCH)]
+
+
+class PVector:
+    """A persistent vector"""
+
+    __slots__ = ("_count", "_shift", "_root", "_tail")
+
+    def __init__(self, items=()):
+        items = list(items)
+        tailoff = _tailoff(len(items))
+        nodes = _chunks(items[:tailoff])
+        shift = BITS
+        while len(nodes) > BRANCH:
+            nodes = _chunks(nodes)
+            shift += BITS
+        self._count = len(items)
+        self._shift = shift
+        self._root = nodes
+        self._tail = items[tailoff:]
+
+    @classmethod
+    def _make(cls, count, shift, root, tail) -> "PVector":
+        vec = cls.__new__(cls)
+        vec._count = count
+        vec._shift = shift
+        vec._root = root
+        vec._tail = tail
+        return vec
+
+    def __len__(self):
+        return self._count
+
+    def _leaf(self, idx: int) -> list:
+        """Get the leaf (or tail) holding element IDX"""
+        if idx >= _tailoff(self._count):
+            return self._tail
+        node = self._root
+        level = self._shift
+        while level > 0:
+            node = node[(idx >> level) & MASK]
+            level -= BITS
+        return node
+
+    def get(self, idx: int):
+        """Get element IDX (which must be in range)"""
+        return self._leaf(idx)[idx & MASK]
+
+    def iter_from(self, start: int = 0):
+        """Iterate over the elements from index START"""
+        tailoff = _tailoff(self._count)
+        idx = start
+        while idx < tailoff:
+            yield from self._leaf(idx)[idx & MASK :]
+            idx = (idx | MASK) + 1
+        yield from self._tail[idx - tailoff :]
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def append(self, item) -> "PVector":
+        """Get a new vector with ITEM appended"""
+        count = self._count
+        if count - _tailoff(count) < BRANCH:
+            return self._make(count + 1, self._shift, self._root, self._tail + [item])
+        # The tail is full - push it into the trie
+        shift = self._shift
+        if (count >> BITS) > (1 << shift):
+            root = [self._root, _new_path(shift, self._tail)]
+            shift += BITS
+        else:
+            root = self._push_tail(shift, self._root, self._tail)
+        return self._make(count + 1, shift, root, [item])
+
+    def _push_tail(self, level: int, parent: list, tail: list) -> list:
+        idx = ((self._count - 1) >> level) & MASK
+        node = list(parent)
+        if level == BITS:
+            child = tail
+        elif idx < len(parent):
+            child = self._push_tail(level - BITS, parent[idx], tail)
+        else:
+            child = _new_path(level - BITS, tail)
+        if idx < len(node):
+            node[idx] = child
+        else:
+            node.append(child)
+        return node
+
+    def extend(self, items) -> "PVector":
+        """Get a new vector with ITEMS appended"""
+        vec = self
+        for item in items:
+            vec = vec.append(item)
+        return vec
+
+    def take(self, count: int) -> "PVector":
+        """Get a new vector with only the first COUNT elements"""
+        if count >= self._count:
+            return self
+        if count <= 0:
+            return PVector()
+        tailoff = _tailoff(self._count)
+        if count > tailoff:
+            return self._make(count, self._shift, self._root, self._tail[: count - tailoff])
+        tail = self._leaf(count - 1)[: ((count - 1) & MASK) + 1]
+        num_leaves = _tailoff(count) >> BITS
+        root = _trim(self._root, self._shift, num_leaves)
+        shift = self._shift if root else BITS
+        while shift > BITS and len(root) == 1:
+            root = root[0]
+            shift -= BITS
+        return self._make(count, shift, root, tail)
+
+
+def _trim(node: list, level: int, num_leaves: int) -> list:
+    """Get a copy of NODE (at LEVEL) holding only its first NUM_LEAVES leaves"""
+    if level == BITS:
+        return node[:num_leaves]
+    per_child = 1 << (level - BITS)
+    full, rem = divmod(num_leaves, per_child)
+    trimmed = node[:full]
+    if rem:
+        trimmed.append(_trim(node[full], level - BITS, rem))
+    return trimmed
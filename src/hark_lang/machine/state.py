@@ -1,19 +1,43 @@
 """Machine state representation"""
 
+from .hark_serialisable import check_slots
 from .types import TlType
 
 # TODO convert this class to HarkSerialisable, there's duplicated logic. Sorry -
 # it came earlier in the design, and is slightly non-trivial to change.
 
 
+def serialise_slots(slots: list) -> list:
+    return [None if value is None else value.serialise() for value in slots]
+
+
+def deserialise_slots(data: list) -> list:
+    return [None if obj is None else TlType.deserialise(obj) for obj in data]
+
+
 class State:
     """Data local/specific to a particular thread"""
 
+    __slots__ = (
+        "ip",
+        "_ds",
+        "stopped",
+        "slots",
+        "frames",
+        "error_msg",
+        "current_arec_ptr",
+    )
+
     def __init__(self, data):
         self.ip = 0
         self._ds = list(data)
         self.stopped = False
-        self.bindings = {}
+        # Local variables of the current frame, indexed by slot (see BindSlot).
+        # Slots that haven't been bound yet are None.
+        self.slots = []
+        # Slots of the calling frames in this thread, innermost last. They're
+        # not changed until they're restored (copied) on Return.
+        self.frames = []
         self.error_msg = None
         self.current_arec_ptr = None
 
@@ -35,13 +59,24 @@ class State:
             raise TypeError(val)
         self._ds[-(offset + 1)] = val
 
+    def copy(self) -> "State":
+        """Get a copy, which won't change when this one does"""
+        s = State(self._ds)
+        s.ip = self.ip
+        s.stopped = self.stopped
+        s.slots = list(self.slots)
+        s.frames = list(self.frames)
+        s.error_msg = self.error_msg
+        s.current_arec_ptr = self.current_arec_ptr
+        return s
+
     def show(self):
         print(self.to_table())
 
     def to_table(self):
         return (
-            "Bind: "
-            + ", ".join(f"{k}->{v}" for k, v in self.bindings.items())
+            "Slots: "
+            + ", ".join(f"{k}->{v}" for k, v in enumerate(self.slots))
             + f"\nData: {self._ds}"
         )
 
@@ -56,20 +91,103 @@ class State:
             ip=self.ip,
             stopped=self.stopped,
             ds=[value.serialise() for value in self._ds],
-            bindings={name: value.serialise() for name, value in self.bindings.items()},
+            slots=serialise_slots(self.slots),
+            frames=[serialise_slots(slots) for slots in self.frames],
             error_msg=self.error_msg,
             current_arec_ptr=self.current_arec_ptr,
         )
 
     @classmethod
     def deserialise(cls, data: dict):
+        check_slots(data, "thread state")
         s = cls([])
         s.ip = data["ip"]
         s.stopped = data["stopped"]
         s._ds = [TlType.deserialise(obj) for obj in data["ds"]]
-        s.bindings = {
-            name: TlType.deserialise(val) for name, val in data["bindings"].items()
-        }
+        s.slots = deserialise_slots(data["slots"])
+        s.frames = [deserialise_slots(slots) for slots in data["frames"]]
         s.error_msg = data["error_msg"]
         s.current_arec_ptr = data["current_arec_ptr"]
         return s
+
+
+## Deltas
+#
+# A delta holds the changes between two states of a thread: the new scalar
+# fields, the new top of the data stack (above the part that's unchanged), the
+# changed slots, and the new calling frames (likewise). Values are compared by
+# identity - Hark values aren't modified in-place once they're on the stack or
+# in a slot, and frames aren't modified once they're pushed.
+
+
+def _common_prefix(old: list, new: list) -> int:
+    keep = 0
+    for a, b in zip(old, new):
+        if a is not b:
+            break
+        keep += 1
+    return keep
+
+
+def state_delta(old: State, new: State) -> dict:
+    """Get the changes from OLD to NEW (see apply_delta)"""
+    keep = _common_prefix(old._ds, new._ds)
+    keep_frames = _common_prefix(old.frames, new.frames)
+    num_old_slots = len(old.slots)
+    slots = [
+        [idx, value]
+        for idx, value in enumerate(new.slots)
+        if idx >= num_old_slots or old.slots[idx] is not value
+    ]
+    return dict(
+        ip=new.ip,
+        stopped=new.stopped,
+        error_msg=new.error_msg,
+        current_arec_ptr=new.current_arec_ptr,
+        keep=keep,
+        push=new._ds[keep:],
+        num_slots=len(new.slots),
+        slots=slots,
+        keep_frames=keep_frames,
+        push_frames=new.frames[keep_frames:],
+    )
+
+
+def apply_delta(state: State, delta: dict):
+    """Apply the changes in DELTA (from state_delta) to STATE"""
+    state.ip = delta["ip"]
+    state.stopped = delta["stopped"]
+    state.error_msg = delta["error_msg"]
+    state.current_arec_ptr = delta["current_arec_ptr"]
+    state._ds = state._ds[: delta["keep"]] + list(delta["push"])
+    num_slots = delta["num_slots"]
+    slots = state.slots[:num_slots]
+    slots += [None] * (num_slots - len(slots))
+    for idx, value in delta["slots"]:
+        slots[idx] = value
+    state.slots = slots
+    state.frames = state.frames[: delta["keep_frames"]] + list(delta["push_frames"])
+
+
+def serialise_delta(delta: dict) -> dict:
+    return dict(
+        delta,
+        push=[value.serialise() for value in delta["push"]],
+        slots=[
+            [idx, None if value is None else value.serialise()]
+            for idx, value in delta["slots"]
+        ],
+        push_frames=[serialise_slots(slots) for slots in delta["push_frames"]],
+    )
+
+
+def deserialise_delta(data: dict) -> dict:
+    return dict(
+        data,
+        push=[TlType.deserialise(obj) for obj in data["push"]],
+        slots=[
+            [idx, None if obj is None else TlType.deserialise(obj)]
+            for idx, obj in data["slots"]
+        ],
+        push_frames=[deserialise_slots(slots) for slots in data["push_frames"]],
+    )
@@ -5,15 +5,21 @@ Requirement: all types must be trivially JSON serialisable.
 See https://docs.python.org/3/library/json.html#py-to-json-table
 """
 
-from typing import Optional
-from collections import UserList, UserDict
+from typing import Iterable, Optional
+from collections.abc import Mapping, Sequence
 
-# TODO Convert these to dataclasses
+from .hamt import HAMT
+from .pvector import PVector
+
+# NOTE: Every type has __slots__ (empty for the subclasses of Python
+# primitives), so that values don't each carry an instance __dict__.
 
 
 class TlType:
     """Base class"""
 
+    __slots__ = ()
+
     @property
     def __tlname__(self):
         return type(self).__name__
@@ -40,6 +46,8 @@ class TlType:
 class TlAtomic(TlType):
     """Atomic (singleton) types"""
 
+    __slots__ = ()
+
     def serialise_data(self):
         return None
 
@@ -51,10 +59,14 @@ class TlAtomic(TlType):
 class TlTrue(TlAtomic):
     """Represent True"""
 
+    __slots__ = ()
+
 
 class TlFalse(TlAtomic):
     """Represent False"""
 
+    __slots__ = ()
+
 
 BOOLEANS = (TlTrue, TlFalse)
 
@@ -62,18 +74,25 @@ BOOLEANS = (TlTrue, TlFalse)
 class TlNull(TlAtomic):
     """Represent Null (None)"""
 
+    __slots__ = ()
+
 
 ### Literals
 
 
 class TlLiteral(TlType):
-    """A literal data which has an underlying Python type"""
+    """A literal data which has an underlying Python type
+
+    Subclasses of Python primitives are their own value (see the value
+    property). Others must store it in a "value" slot.
+    """
+
+    __slots__ = ()
 
     def __init__(self, value):
         # Restrict to JSON literals (and disallow subclasses of them)
         if type(value) not in (str, float, int):
             raise ValueError(value, type(value))
-        self.value = value
 
     def serialise_data(self):
         return self.value
@@ -88,32 +107,42 @@ class TlLiteral(TlType):
 
 
 class TlSymbol(str, TlLiteral):
-    pass
+    __slots__ = ()
+    value = property(str)
 
 
 class TlFloat(float, TlLiteral):
-    pass
+    __slots__ = ()
+    value = property(float)
 
 
 class TlInt(int, TlLiteral):
-    pass
+    __slots__ = ()
+    value = property(int)
 
 
 class TlString(str, TlLiteral):
-    pass
+    __slots__ = ()
+    value = property(str)
 
 
 class TlInstruction(str, TlLiteral):
     """A Hark machine instruction"""
 
+    __slots__ = ()
+    value = property(str)
+
 
 class TlFuturePtr(TlLiteral):
     """Pointer to a TlFuture"""
 
+    __slots__ = ("value", "vmid")
+
     def __init__(self, future_id):
         if type(future_id) not in (int, str):
             raise TypeError(future_id)
         super().__init__(future_id)
+        self.value = future_id
         self.vmid = future_id
 
 
@@ -123,6 +152,8 @@ class TlFuturePtr(TlLiteral):
 class TlQuote(TlType):
     """A quoted value"""
 
+    __slots__ = ("data",)
+
     def __init__(self, data):
         self.data = data
 
@@ -135,27 +166,170 @@ class TlQuote(TlType):
         return cls(TlType.deserialise(data))
 
 
-class TlList(UserList, TlType):
+class TlList(TlType, Sequence):
+    """A persistent list
+
+    Lists are views (a start position) into a persistent vector (see pvector),
+    so `rest' doesn't copy anything, and `append' copies O(log n) elements,
+    whichever version of the list is appended to. Existing lists never change.
+
+    So the idiomatic tail-recursive loop -- take the `first' of a list, recurse
+    on the `rest', and `append' to an accumulator -- is O(n log n) instead of
+    O(n^2), and so is appending to older (shared) versions of a list. `conc'
+    copies O(m log n) elements, for m elements on the right.
+
+    NOTE: A view keeps the elements before its start alive.
+    """
+
+    __slots__ = ("_vec", "_start")
+
+    def __init__(self, items: Iterable = ()):
+        self._vec = PVector(items)
+        self._start = 0
+
+    @classmethod
+    def _view(cls, vec: PVector, start: int) -> "TlList":
+        lst = cls.__new__(cls)
+        lst._vec = vec
+        lst._start = start
+        return lst
+
+    def __len__(self):
+        return len(self._vec) - self._start
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self))
+            if step != 1:
+                return TlList(list(self)[idx])
+            stop = max(start, stop)
+            return self._view(self._vec.take(self._start + stop), self._start + start)
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("list index out of range")
+        return self._vec.get(self._start + idx)
+
+    def __iter__(self):
+        return self._vec.iter_from(self._start)
+
+    def __eq__(self, other):
+        if isinstance(other, TlList):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __add__(self, other: Iterable) -> "TlList":
+        return self.extended(other)
+
+    def __radd__(self, other: Iterable) -> "TlList":
+        return TlList(other).extended(self)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def extended(self, items: Iterable) -> "TlList":
+        """Get a new list with ITEMS appended to this one"""
+        if not len(self) and isinstance(items, TlList):
+            return items
+        return self._view(self._vec.extend(items), self._start)
+
+    def appended(self, item) -> "TlList":
+        """Get a new list with ITEM appended to this one"""
+        return self._view(self._vec.append(item), self._start)
+
     def serialise_data(self):
-        return [a.serialise() for a in self.data]
+        return [a.serialise() for a in self]
 
     @classmethod
     def from_data(cls, data):
         return cls([TlType.deserialise(a) for a in data])
 
 
-class TlHash(UserDict, TlType):
+class TlHash(TlType, Mapping):
+    """A persistent hash (backed by a HAMT)
+
+    Use `set' to get a new hash with a key set. The original is unchanged, and
+    shares most of its structure with the new one.
+
+    Keys are kept in insertion order (like dict) for iteration and serialisation,
+    by storing a sequence number with each value.
+    """
+
+    __slots__ = ("_map", "_next_seq")
+
+    def __init__(self, items=()):
+        self._map = HAMT()
+        self._next_seq = 0
+        if isinstance(items, Mapping):
+            items = items.items()
+        for key, value in items:
+            self._map, self._next_seq = self._set(key, value)
+
+    def _set(self, key, value):
+        """Set KEY to VALUE, returning the new (map, next sequence number)"""
+        existing = self._map.get(key)
+        if existing is not None:
+            # Overwriting keeps the original position
+            return self._map.set(key, (existing[0], value)), self._next_seq
+        return self._map.set(key, (self._next_seq, value)), self._next_seq + 1
+
+    def set(self, key, value) -> "TlHash":
+        """Get a new hash with KEY set to VALUE"""
+        hsh = TlHash.__new__(TlHash)
+        hsh._map, hsh._next_seq = self._set(key, value)
+        return hsh
+
+    def __getitem__(self, key):
+        entry = self._map.get(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry[1]
+
+    def __contains__(self, key):
+        return key in self._map
+
+    def __len__(self):
+        return len(self._map)
+
+    def __iter__(self):
+        for _, key, _ in self._ordered():
+            yield key
+
+    def items(self):
+        return [(key, value) for _, key, value in self._ordered()]
+
+    def _ordered(self):
+        return sorted((seq, key, value) for key, (seq, value) in self._map.items())
+
+    def __eq__(self, other):
+        if not isinstance(other, (TlHash, dict)):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            key in other and other[key] == value for key, value in self.items()
+        )
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
     def serialise_data(self):
-        return [[k.serialise(), v.serialise()] for k, v in self.data.items()]
+        return [[k.serialise(), v.serialise()] for k, v in self.items()]
 
     @classmethod
     def from_data(cls, data):
-        return cls({TlType.deserialise(k): TlType.deserialise(v) for k, v in data})
+        return cls((TlType.deserialise(k), TlType.deserialise(v)) for k, v in data)
 
 
 class TlFunctionPtr(TlType):
     """Pointer to a function or closure defined in Tl"""
 
+    __slots__ = ("identifier", "stack_ptr")
+
     def __init__(self, identifier: str, stack_ptr: Optional[int] = None):
         if not isinstance(identifier, str):
             raise ValueError(identifier)
@@ -180,6 +354,8 @@ class TlFunctionPtr(TlType):
 class TlForeignPtr(TlType):
     """Pointer to an imported python function"""
 
+    __slots__ = ("identifier", "module", "qualified_name")
+
     def __init__(self, identifier: str, module: str, qualified_name: str):
         if not isinstance(identifier, str):
             raise ValueError(identifier)
@@ -207,13 +383,34 @@ class TlForeignPtr(TlType):
 # NOTE - no conversion to/from Symbols
 
 
+# Element conversions for lists of a single primitive type, which can be done
+# without looking at each element's type
+PRIMITIVE_TO_TL = {}  # filled in below
+PRIMITIVE_TO_PY = {}
+
+
+def _primitive_type(lst):
+    """The type of all of the elements in LST, if they're all the same, or None"""
+    types = set(map(type, lst))
+    if len(types) == 1:
+        (elt_type,) = types
+        return elt_type
+    return None
+
+
 def py_list_to_tl(lst: list) -> TlList:
     """Recursively convert list to TlList"""
+    convert = PRIMITIVE_TO_TL.get(_primitive_type(lst))
+    if convert:
+        return TlList(map(convert, lst))
     return TlList([to_hark_type(x) for x in lst])
 
 
 def tl_list_to_py(lst: TlList) -> list:
     """Recursively convert TlList to list"""
+    convert = PRIMITIVE_TO_PY.get(_primitive_type(lst))
+    if convert:
+        return list(map(convert, lst))
     return [to_py_type(v) for v in lst]
 
 
@@ -227,14 +424,79 @@ def tl_hash_to_py(hsh: TlHash) -> dict:
     return {to_py_type(k): to_py_type(v) for k, v in hsh.items()}
 
 
+class ListView(Sequence):
+    """A read-only Python view of a TlList
+
+    Elements are converted (see to_py_view) when they're accessed, instead of
+    copying the whole list up-front. Converting a view back to a Hark type just
+    gives the original list.
+    """
+
+    __slots__ = ("_tl",)
+
+    def __init__(self, lst: TlList):
+        self._tl = lst
+
+    def __len__(self):
+        return len(self._tl)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return ListView(self._tl[idx])
+        return to_py_view(self._tl[idx])
+
+    def __iter__(self):
+        return map(to_py_view, self._tl)
+
+    def __eq__(self, other):
+        if isinstance(other, (ListView, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class HashView(Mapping):
+    """A read-only Python view of a TlHash (see ListView)"""
+
+    __slots__ = ("_tl",)
+
+    def __init__(self, hsh: TlHash):
+        self._tl = hsh
+
+    def __getitem__(self, key):
+        try:
+            key = to_hark_type(key)
+        except TypeError:
+            raise KeyError(key)
+        return to_py_view(self._tl[key])
+
+    def __len__(self):
+        return len(self._tl)
+
+    def __iter__(self):
+        return map(to_py_view, self._tl)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
 PY_TO_TL = {
     int: TlInt,
     float: TlFloat,
     str: TlString,
     list: py_list_to_tl,
     dict: py_dict_to_tl,
+    # Views are unwrapped without copying (Hark types are immutable)
+    ListView: lambda view: view._tl,
+    HashView: lambda view: view._tl,
 }
 
+PRIMITIVE_TO_TL.update({int: TlInt, float: TlFloat, str: TlString})
+
 
 Tl_TO_PY = {
     TlNull: lambda _: None,
@@ -247,6 +509,8 @@ Tl_TO_PY = {
     TlHash: tl_hash_to_py,
 }
 
+PRIMITIVE_TO_PY.update({TlInt: int, TlFloat: float, TlString: str})
+
 
 def to_hark_type(py_val):
     if py_val is None:
@@ -267,3 +531,12 @@ def to_py_type(hark_val: TlType):
         return Tl_TO_PY[type(hark_val)](hark_val)
     except KeyError:
         raise TypeError(f"Can't convert {type(hark_val)} to a Python type")
+
+
+def to_py_view(hark_val: TlType):
+    """Like to_py_type, but wrap lists and hashes in views instead of copying"""
+    if type(hark_val) is TlList:
+        return ListView(hark_val)
+    if type(hark_val) is TlHash:
+        return HashView(hark_val)
+    return to_py_type(hark_val)
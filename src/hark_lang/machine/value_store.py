@@ -0,0 +1,113 @@
+"""Content-addressed storage of large Hark values
+
+When data is encoded with a value store (see codec.encode), values that are big
+enough are stored in it once, keyed by a hash of their encoding, and the data
+only holds that key. So e.g. a large function argument, copied into the new
+thread's State, the result Future, and any chained futures, is only stored once.
+
+Stored values are never modified (Hark values are immutable), so decoded values
+are cached and shared.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from . import codec
+from .future import LazyValue
+
+# Values that encode to at least this many bytes are stored separately. 0 means
+# don't use a value store.
+THRESHOLD = int(os.getenv("HARK_VALUE_STORE_THRESHOLD", 4096))
+
+# How many decoded values to keep, per store
+CACHE_SIZE = int(os.getenv("HARK_VALUE_CACHE_SIZE", 64))
+
+
+class ValueStore:
+    """Base class - subclasses implement put_data and get_data"""
+
+    # Store values again (or refresh them) when they're referred to, if this
+    # process stored or refreshed them this many seconds ago (e.g. if they
+    # might expire). None means never.
+    rewrite_after = None
+
+    def __init__(self, threshold: int = THRESHOLD, cache_size: int = CACHE_SIZE):
+        self.threshold = threshold
+        self.cache_size = cache_size
+        self._stored = {}  # time each key was put by this process
+        self._values = OrderedDict()  # decoded values, least recently used first
+        self._lock = threading.Lock()
+
+    def put_data(self, key: str, data: bytes):
+        raise NotImplementedError
+
+    def get_data(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    def refresh_data(self, key: str):
+        """Keep the data stored with KEY for longer (see rewrite_after)"""
+
+    def put(self, data: bytes, value=None) -> str:
+        """Store encoded DATA (of VALUE), returning its key"""
+        key = hashlib.sha256(data).hexdigest()
+        if key not in self._stored or self._is_stale(key):
+            self.put_data(key, bytes(data))
+            self._stored[key] = time.time()
+        if value is not None:
+            self._cache(key, value)
+        return key
+
+    def reference(self, key: str):
+        """Note that KEY, already stored, is referred to by new data"""
+        if self._is_stale(key, default=True):
+            self.refresh_data(key)
+            self._stored[key] = time.time()
+
+    def _is_stale(self, key, default=False) -> bool:
+        if self.rewrite_after is None:
+            return False
+        stored = self._stored.get(key)
+        if stored is None:
+            return default
+        return time.time() - stored > self.rewrite_after
+
+    def get(self, key: str):
+        """Get the (decoded) value stored with KEY"""
+        with self._lock:
+            value = self._values.get(key)
+            if value is not None:
+                self._values.move_to_end(key)
+                return value
+        value = codec.decode(self.get_data(key), store=self)
+        self._cache(key, value)
+        return value
+
+    def lazy(self, key: str):
+        """The value stored with KEY if it's cached, or a LazyValue"""
+        with self._lock:
+            value = self._values.get(key)
+        return LazyValue(self, key) if value is None else value
+
+    def _cache(self, key, value):
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self.cache_size:
+                self._values.popitem(last=False)
+
+
+class MemoryValueStore(ValueStore):
+    """Values stored in memory (e.g. for testing)"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.data = {}
+
+    def put_data(self, key, data):
+        self.data[key] = data
+
+    def get_data(self, key):
+        return self.data[key]
@@ -13,7 +13,7 @@ from ..controllers import ddb_model as db
 from ..exceptions import UserResolvableError
 from ..executors.awslambda import Invoker
 from ..machine.controller import ControllerError
-from ..machine.machine import TlMachine
+from ..machine.machine import TlMachine, record_failure
 from ..hark_compiler.compiler import HarkCompileError
 from ..hark_parser.parser import HarkParseError
 from . import lambda_handlers
@@ -44,24 +44,22 @@ def resume(event, context):
     # a result to. So all exceptions must appear in the AWS console.
     #
     # However, any waiting machines need to find out about this.
-    _run_machine(controller, vmid)
+    _run_machine(controller, vmid, context)
 
 
-def _run_machine(controller, vmid):
+def _run_machine(controller, vmid, context=None):
     try:
-        invoker = Invoker(controller)
+        invoker = Invoker(controller, context)
         machine = TlMachine(vmid, invoker)
-        machine.run()
 
     # One of those rare times when we really do want to catch and record any
-    # possible exception.
-    except Exception as exc:
-        state = controller.get_state(vmid)
-        state.error_msg = "".join(traceback.format_exception(*sys.exc_info()))
-        controller.set_state(vmid, state)
-        controller.stop(vmid, finished_ok=False)
+    # possible exception. (TlMachine.run records its own.)
+    except Exception:
+        record_failure(controller, vmid)
         raise
 
+    machine.run()
+
 
 def event_handler(event, context):
     """Handle all 'events'.
@@ -166,8 +164,8 @@ def _new_session(
     # TODO reduce duplication - this is all similar to common.py
     if wait_for_finish:
         start_time = time.time()
-        while not controller.all_stopped():
-            time.sleep(check_period)
+        periods = controller.check_periods(check_period)
+        while not controller.wait_until_stopped(next(periods)):
             if time.time() - start_time > timeout:
                 raise UserResolvableError(
                     f"Timeout waiting for Hark program to finish ({controller.session_id})",
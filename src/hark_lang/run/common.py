@@ -19,15 +19,19 @@ class ThreadDied(UnexpectedError):
 
 
 def wait_for_finish(check_period, timeout, data_controller, invoker):
-    """Wait for a machine to finish, checking every CHECK_PERIOD
+    """Wait for a machine to finish, checking at least every CHECK_PERIOD
+
+    The controller wakes us as soon as the machines have stopped (if it can).
+    Otherwise, the controller decides the time between checks, up to
+    CHECK_PERIOD (see Controller.check_periods).
 
     If timeout is None, wait indefinitely.
 
     """
     start_time = time.time()
+    periods = data_controller.check_periods(check_period)
     try:
-        while not data_controller.all_stopped():
-            time.sleep(check_period)
+        while not data_controller.wait_until_stopped(next(periods)):
             if timeout and time.time() - start_time > timeout:
                 raise Exception("Timeout waiting for finish")
 
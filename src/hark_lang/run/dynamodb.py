@@ -6,6 +6,7 @@ from ..controllers import ddb as ddb_controller
 from ..executors import multiprocess as mp
 from ..executors import thread as hark_thread
 from .common import run_and_wait, wait_for_finish
+from .local import SHUTDOWN_TIMEOUT_S
 
 import pynamodb
 
@@ -13,12 +14,14 @@ import pynamodb
 def run_ddb_local(filename, function, args, timeout=10):
     """Run with dynamodb and python threading"""
     controller = ddb_controller.DataController.with_new_session()
-    invoker = hark_thread.Invoker(controller)
+    invoker = hark_thread.PoolInvoker(controller)
     waiter = partial(wait_for_finish, 1, timeout)
     try:
         return run_and_wait(controller, invoker, waiter, filename, function, args)
     except pynamodb.exceptions.PynamoDBException as exc:
         raise ControllerError("Database error: {exc}") from exc
+    finally:
+        invoker.shutdown(timeout=SHUTDOWN_TIMEOUT_S)
 
 
 def run_ddb_processes(filename, function, args, timeout=10):
@@ -3,15 +3,30 @@ import os
 from functools import partial
 
 from ..controllers import local as local
+from ..executors import coop as hark_coop
 from ..executors import thread as hark_thread
 from ..machine.types import to_py_type
 from .common import LOG, run_and_wait, wait_for_finish
 
+# How long to wait for worker threads to finish after a run
+SHUTDOWN_TIMEOUT_S = 5
 
-def run_local(filename, function, args, timeout_s=10):
+# Invokers that can be used with in-memory storage, by concurrency mode
+INVOKERS = {
+    "threads": hark_thread.PoolInvoker,
+    "coop": hark_coop.Invoker,
+}
+
+
+def run_local(filename, function, args, timeout_s=10, concurrency="threads"):
     LOG.debug(f"PYTHONPATH: {os.getenv('PYTHONPATH')}")
     controller = local.DataController()
-    invoker = hark_thread.Invoker(controller)
+    invoker = INVOKERS[concurrency](controller)
     check_period = 0.1
     waiter = partial(wait_for_finish, check_period, timeout_s)
-    return run_and_wait(controller, invoker, waiter, filename, function, args)
+    try:
+        return run_and_wait(controller, invoker, waiter, filename, function, args)
+    finally:
+        if isinstance(invoker, hark_thread.PoolInvoker):
+            invoker.shutdown(timeout=SHUTDOWN_TIMEOUT_S)
+            LOG.info(f"Worker pool: {invoker.metrics}")
@@ -6,6 +6,11 @@ from typing import Dict, Tuple
 
 import pytest
 
+from hark_lang import load
+from hark_lang.controllers.local import DataController
+from hark_lang.executors import coop, thread
+from hark_lang.run.common import wait_for_finish
+
 
 def pytest_addoption(parser):
     parser.addoption(
@@ -29,6 +34,70 @@ def pytest_collection_modifyitems(config, items):
                 item.add_marker(skip)
 
 
+@pytest.fixture(autouse=True)
+def no_bytecode_cache(monkeypatch):
+    """Don't write compiled examples into the source tree (see load.USE_CACHE)"""
+    monkeypatch.setattr(load, "USE_CACHE", False)
+
+
+def _new_session(src: str, fn_name: str = "main", args=()):
+    exe = load.compile_text(src)
+    controller = DataController()
+    controller.set_executable(exe)
+    vmid = controller.toplevel_machine(exe.bindings[fn_name], list(args))
+    return controller, vmid
+
+
+@pytest.fixture
+def new_session():
+    """Compile Hark source, and create the top-level thread (but don't run it)
+
+    Call it with the source, and optionally the function name and arguments.
+    Returns (controller, vmid).
+    """
+    return _new_session
+
+
+@pytest.fixture
+def run_hark():
+    """Run Hark source to completion, with an executor (coop by default)
+
+    Call it with the source, and optionally the function name, arguments,
+    executor (Invoker class), check_period and timeout (see wait_for_finish),
+    and keyword arguments for the executor. Returns (controller, invoker).
+    Pool workers are stopped after the test.
+    """
+    invokers = []
+
+    def run(
+        src,
+        fn_name="main",
+        args=(),
+        executor=coop.Invoker,
+        check_period=0.01,
+        timeout=10,
+        **kwargs,
+    ):
+        controller, vmid = _new_session(src, fn_name, args)
+        invoker = executor(controller, **kwargs)
+        invokers.append(invoker)
+        invoker.invoke(vmid, run_async=False)
+        wait_for_finish(check_period, timeout, controller, invoker)
+        return controller, invoker
+
+    yield run
+
+    for invoker in invokers:
+        if isinstance(invoker, thread.PoolInvoker):
+            invoker.shutdown()
+
+
+@pytest.fixture(params=[coop.Invoker, thread.PoolInvoker], ids=["coop", "pool"])
+def executor(request):
+    """Each executor that can run a whole program in this process"""
+    return request.param
+
+
 # store history of failures per test class name and per index in parametrize (if
 # parametrize used)
 _test_failed_incremental: Dict[str, Dict[Tuple[int, ...], str]] = {}
@@ -1,3 +1,4 @@
+import os
 import time
 import random
 
@@ -26,3 +27,9 @@ def coin():
 
 def bad_fn():
     raise Exception("Something broke!")
+
+
+def pid():
+    """The ID of the process this is called in"""
+    print("getting pid")
+    return os.getpid()
@@ -0,0 +1,109 @@
+"""Test offloading large data to blob stores"""
+import pytest
+
+import hark_lang.controllers.ddb_model as db
+from hark_lang.controllers.blob_store import (
+    BlobNotFound,
+    LocalBlobStore,
+    S3BlobStore,
+    get_blob_store,
+)
+from hark_lang.machine.arec import ActivationRecord
+from hark_lang.machine.state import State
+from hark_lang.machine.types import TlFunctionPtr, TlInt, TlString
+
+
+def test_local_blob_store(tmp_path):
+    store = LocalBlobStore(tmp_path / "blobs")
+    store.put("abc", b"some data")
+    assert store.get("abc") == b"some data"
+    assert [p.name for p in (tmp_path / "blobs").iterdir()] == ["abc"]
+    with pytest.raises(BlobNotFound):
+        store.get("def")
+
+
+def test_get_blob_store(tmp_path):
+    assert get_blob_store(None) is None
+    assert get_blob_store(str(tmp_path)).root == tmp_path
+    assert get_blob_store(f"file://{tmp_path}").root == tmp_path
+    store = get_blob_store("s3://bucket/some/prefix/")
+    assert isinstance(store, S3BlobStore)
+    assert store.bucket == "bucket"
+    assert store._key("abc") == "some/prefix/abc"
+    with pytest.raises(ValueError):
+        get_blob_store("ftp://foo")
+
+
+@pytest.fixture
+def blob_store(monkeypatch, tmp_path):
+    store = LocalBlobStore(tmp_path)
+    monkeypatch.setattr(db, "BLOB_STORE", store)
+    monkeypatch.setattr(db, "MAX_DATA_SIZE", 1000)
+    return store
+
+
+@pytest.mark.parametrize("binary", [True, False])
+def test_large_state_offloaded(monkeypatch, blob_store, binary):
+    monkeypatch.setattr(db, "BINARY", binary)
+    attr = db.StateAttribute()
+    small = State([TlInt(1)])
+    assert attr.serialize(small) == db.offload(attr.serialize(small))
+
+    large = State([TlString(f"item {i}") for i in range(500)])
+    text = attr.serialize(large)
+    assert text.startswith(db.BLOB_PREFIX)
+    assert len(text) < 100
+    assert db.loaded(attr.deserialize(text)) == large
+
+
+def test_offload_needs_blob_store(monkeypatch, blob_store):
+    text = db.offload("x" * 2000)
+    assert db.reload(text) == "x" * 2000
+    monkeypatch.setattr(db, "BLOB_STORE", None)
+    assert db.offload("x" * 2000) == "x" * 2000
+    with pytest.raises(BlobNotFound):
+        db.reload(text)
+
+
+class CountingBlobStore(LocalBlobStore):
+    def __init__(self, root):
+        super().__init__(root)
+        self.gets = 0
+
+    def get(self, key):
+        self.gets += 1
+        return super().get(key)
+
+
+def test_blobs_loaded_lazily(monkeypatch, tmp_path):
+    """Offloaded data isn't read from the blob store until it's used"""
+    store = CountingBlobStore(tmp_path)
+    monkeypatch.setattr(db, "BLOB_STORE", store)
+    monkeypatch.setattr(db, "MAX_DATA_SIZE", 1000)
+    big = [TlString(f"item {i}") for i in range(500)]
+
+    attr = db.StateAttribute()
+    text = attr.serialize(State(big))
+    state = attr.deserialize(text)
+    # Saved again without being used, e.g. when the item is overwritten
+    assert attr.serialize(state) == text
+    assert store.gets == 0
+    assert db.loaded(state) == State(big)
+    assert db.loaded(state) == State(big)
+    assert store.gets == 1
+
+    attr = db.ARecAttribute()
+    rec = ActivationRecord(
+        function=TlFunctionPtr("f" * 2000, None),
+        dynamic_chain=None,
+        vmid=0,
+        ref_count=2,
+        call_site=None,
+    )
+    data = attr.serialize(rec)
+    data["ref_count"] = {"N": "3"}  # updated in-place
+    loaded = attr.deserialize(data)
+    assert store.gets == 1
+    assert db.loaded(loaded).function == rec.function
+    assert db.loaded(loaded).ref_count == 3
+    assert store.gets == 2
@@ -1,17 +1,19 @@
 """Test the Hark command line tool"""
+import os
 from pathlib import Path
 from subprocess import PIPE, Popen
 
 EXAMPLES_SUBDIR = Path(__file__).parent / "examples"
 
 
-def hark_cli(*args):
+def hark_cli(*args, cache=False):
     """Run Hark cli command line and return (decoded) outputs"""
     p = Popen(
         ["python", "-m", "hark_lang.cli.main", *args],
         stdout=PIPE,
         stderr=PIPE,
         stdin=PIPE,
+        env=dict(os.environ, HARK_BYTECODE_CACHE="1" if cache else "0"),
     )
     stdout, stderr = p.communicate()
     return stdout.decode(), stderr.decode(), p.returncode
@@ -33,3 +35,22 @@ def test_run():
     stdout, stderr, code = hark_cli(path)
     assert not code
     assert stdout == "Hello World!\nHello World!\n"
+
+
+def test_asm_bytecode_cache(tmp_path):
+    """The second asm of a file loads it from the bytecode cache"""
+    path = tmp_path / "hello_world.hk"
+    path.write_text((EXAMPLES_SUBDIR / "hello_world.hk").read_text())
+    stdout, _, code = hark_cli("asm", path, cache=True)
+    assert not code
+    assert "LOADED FROM" in stdout
+    assert "__harkcache__" not in stdout
+    # The optimised and unoptimised (for the instruction count) code
+    cached = sorted((tmp_path / "__harkcache__").glob("*.hkc"))
+    assert len(cached) == 2
+    mtimes = [p.stat().st_mtime_ns for p in cached]
+    stdout, _, code = hark_cli("asm", path, cache=True)
+    assert not code
+    assert "__harkcache__" in stdout
+    # Neither was compiled again
+    assert [p.stat().st_mtime_ns for p in cached] == mtimes
@@ -0,0 +1,213 @@
+"""Test the binary serialisation format"""
+import pytest
+
+import hark_lang.controllers.ddb_model as db
+from hark_lang.load import compile_file
+from hark_lang.machine import codec, value_store
+from hark_lang.machine.arec import ActivationRecord
+from hark_lang.machine.future import Future
+from hark_lang.machine.state import State
+from hark_lang.machine.types import *
+from hark_lang.machine.value_store import MemoryValueStore
+
+VALUES = [
+    TlNull(),
+    TlTrue(),
+    TlFalse(),
+    TlInt(0),
+    TlInt(-1),
+    TlInt(2 ** 100),
+    TlFloat(-2.5),
+    TlString(""),
+    TlString("héllo"),
+    TlSymbol("sym"),
+    TlInstruction("push"),
+    TlFuturePtr(3),
+    TlFuturePtr("abc"),
+    TlQuote(TlSymbol("x")),
+    TlList([TlInt(1), TlList([TlString("a"), TlString("a")]), TlNull()]),
+    TlHash({TlString("a"): TlInt(1), TlInt(2): TlHash({})}),
+    TlFunctionPtr("foo", None),
+    TlFunctionPtr("#0:lambda", 4),
+    TlForeignPtr("foo", "bar", "bar.foo"),
+]
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_values(value):
+    data = codec.encode(value)
+    assert data.startswith(codec.MAGIC)
+    decoded = codec.decode(data)
+    assert type(decoded) is type(value)
+    assert decoded == value
+    assert codec.loads(codec.dumps(value)) == value
+
+
+def test_repeated_strings_stored_once():
+    one = codec.encode(TlList([TlString("a long repeated string")]))
+    many = codec.encode(TlList([TlString("a long repeated string")] * 10))
+    assert len(many) < len(one) + 20
+
+
+def test_records():
+    state = State([TlInt(1), TlString("x")])
+    state.ip = 12
+    state.slots = [None, TlFloat(1.5)]
+    state.frames = [[TlInt(3)], [], [None, TlString("y")]]
+    state.error_msg = "oops"
+    state.current_arec_ptr = 2
+    assert codec.decode(codec.encode(state)) == state
+
+    rec = ActivationRecord(
+        function=TlFunctionPtr("foo", None),
+        vmid=1,
+        ref_count=2,
+        dynamic_chain=0,
+        call_site=7,
+    )
+    assert codec.decode(codec.encode(rec)) == rec
+
+    future = Future(
+        continuations=[1, 2], resolved=True, value=TlInt(0), gathers=[[3, 0]]
+    )
+    decoded = codec.decode(codec.encode(future))
+    assert decoded.serialise() == future.serialise()
+    assert decoded.value == TlInt(0)
+
+
+def test_executable():
+    exe = compile_file("test/examples/parallel.hk")
+    data = codec.encode(exe)
+    assert codec.decode(data).serialise() == exe.serialise()
+
+
+def test_bad_data():
+    assert not codec.is_encoded('{"ip": 0}')
+    with pytest.raises(codec.CodecError):
+        codec.decode(b"[1, 2]")
+    newer = bytearray(codec.encode(TlNull()))
+    newer[len(codec.MAGIC)] = codec.VERSION + 1
+    with pytest.raises(codec.CodecError):
+        codec.decode(bytes(newer))
+    with pytest.raises(codec.CodecError):
+        codec.encode(object())
+    with pytest.raises(codec.CodecError):
+        codec.decode(codec.encode(TlString("truncated"))[:-2])
+    with pytest.raises(codec.CodecError):
+        codec.decode(codec.MAGIC)
+
+
+@pytest.mark.parametrize("binary", [True, False])
+def test_ddb_attributes(monkeypatch, binary):
+    """Data in either format can be loaded, whichever format is being written"""
+    rec = ActivationRecord(
+        function=TlFunctionPtr("foo", None),
+        vmid=0,
+        ref_count=1,
+    )
+    future = Future(continuations=[1], chain=2, resolved=True, value=TlString("v"))
+    state = State([TlInt(1)])
+    attrs = [
+        (db.ARecAttribute(), rec),
+        (db.FutureAttribute(), future),
+        (db.StateAttribute(), state),
+    ]
+    monkeypatch.setattr(db, "BINARY", binary)
+    stored = [attr.serialize(obj) for attr, obj in attrs]
+    monkeypatch.setattr(db, "BINARY", not binary)
+    for (attr, obj), value in zip(attrs, stored):
+        assert attr.deserialize(value).serialise() == obj.serialise()
+
+
+def test_value_store():
+    """Large values are stored once, and shared when decoded"""
+    store = MemoryValueStore(threshold=100)
+    big = TlList([TlString(f"item {i}") for i in range(100)])
+    state = State([TlInt(1)])
+    state.slots = [big, TlString("small")]
+    future = Future(resolved=True, value=big)
+    data = codec.encode(state, store=store)
+    assert len(data) < 100
+    assert len(codec.encode(future, store=store)) < 100
+    assert len(store.data) == 1
+
+    store.get_data = lambda key: pytest.fail("value should be cached")
+    decoded = codec.decode(data, store=store)
+    assert decoded == state
+    assert decoded.slots[0] is codec.decode(codec.encode(future, store), store).value
+
+    with pytest.raises(codec.CodecError):
+        codec.decode(data)
+
+
+def test_value_store_embeds_small_values():
+    store = MemoryValueStore(threshold=10_000)
+    value = TlHash({TlInt(i): TlString("x") for i in range(20)})
+    data = codec.encode(value, store=store)
+    assert not store.data
+    assert codec.decode(data) == value
+
+
+def test_future_values_loaded_lazily():
+    store = MemoryValueStore(threshold=100)
+    big = TlString("x" * 1000)
+    data = codec.encode(Future(resolved=True, value=big), store=store)
+
+    # A new process, with nothing cached
+    other = MemoryValueStore(threshold=100)
+    other.data = store.data
+    fetched = []
+    get_data = other.get_data
+    other.get_data = lambda key: fetched.append(key) or get_data(key)
+
+    future = codec.decode(data, store=other)
+    future.continuations.append(1)
+    assert codec.decode(codec.encode(future, store=other), store=other).resolved
+    assert not fetched
+    # Without the store, the value has to be loaded and encoded in full
+    assert codec.decode(codec.encode(future)).value == big
+    assert len(fetched) == 1
+    assert future.value == big
+    assert len(fetched) == 1
+
+
+def test_value_store_nested_values():
+    """Big values inside embedded ones are stored, and embedded values share
+    nothing with the enclosing string table"""
+    store = MemoryValueStore(threshold=200)
+    big = TlList([TlString(f"item {i}") for i in range(50)])
+    small = TlList([TlString("item 0")] * 10)
+    value = TlList([TlString("item 0"), small, TlHash({TlInt(1): big}), small])
+    data = codec.encode(value, store=store)
+    assert len(store.data) == 1
+    assert codec.decode(data, store=store) == value
+    store._values.clear()
+    assert codec.decode(data, store=store) == value
+
+
+def test_value_store_references_refreshed(monkeypatch):
+    """Values are refreshed when they're referred to again, if they might expire"""
+    store = MemoryValueStore(threshold=100)
+    store.rewrite_after = 60
+    refreshed = []
+    store.refresh_data = refreshed.append
+    now = 1000
+    monkeypatch.setattr(value_store.time, "time", lambda: now)
+    data = codec.encode(Future(resolved=True, value=TlString("x" * 1000)), store)
+    (key,) = store.data
+
+    # A new process, referring to the value without loading it
+    other = MemoryValueStore(threshold=100)
+    other.rewrite_after = 60
+    other.data = store.data
+    other.refresh_data = refreshed.append
+    future = codec.decode(data, store=other)
+    codec.encode(future, store=other)
+    codec.encode(future, store=other)
+    assert refreshed == [key]
+    now += 100
+    codec.encode(future, store=other)
+    assert refreshed == [key, key]
+    # Stored again (not just refreshed) when it's re-encoded in full
+    codec.encode(Future(resolved=True, value=future.value), store)
+    assert refreshed == [key, key]
@@ -0,0 +1,166 @@
+"""Test compiler output"""
+from hark_lang.load import compile_text
+from hark_lang.machine import instructionset as mi
+from hark_lang.machine import types as mt
+
+
+def instructions(exe, fn_name):
+    """Get the instructions of function FN_NAME"""
+    start = exe.locations[exe.bindings[fn_name].identifier]
+    ends = [i for i in exe.locations.values() if i > start]
+    end = min(ends) if ends else len(exe.code)
+    return exe.code[start:end]
+
+
+def test_builtins_compiled_directly():
+    exe = compile_text(
+        """
+fn main(a, b) {
+  x = a + b * 2;
+  print(list(x, a < b))
+}
+"""
+    )
+    code = instructions(exe, "main")
+    types = [type(i) for i in code]
+    assert mi.Call not in types
+    assert mi.PushSlot in types  # a, b, x
+    for instr_type in (mi.Plus, mi.Multiply, mi.LessThan, mi.Print, mi.List):
+        assert instr_type in types
+    assert not any(isinstance(i, mi.PushB) and i.operands[0] == "+" for i in code)
+
+
+def test_shadowed_builtins_called():
+    exe = compile_text(
+        """
+fn print(x) {
+  x
+}
+
+fn main(a, list) {
+  first = 1;
+  print(first(list(a)))
+}
+"""
+    )
+    code = instructions(exe, "main")
+    called = [
+        (type(i), i.operands[0])
+        for i, j in zip(code, code[1:])
+        if isinstance(j, mi.Call)
+    ]
+    # Locals are in slots: a=0, list=1, first=2. first is the builtin until
+    # it's assigned.
+    assert called == [(mi.PushSlot, 1), (mi.PushSlotOrB, 2), (mi.PushB, "print")]
+
+
+def test_constants_folded():
+    src = """
+fn main(x) {
+  if 2 * 3 > 5 && !(1 == 1.0) {
+    x
+  } else {
+    1 + 2 * (7 / 2) - 8 % 3
+  }
+}
+"""
+    exe = compile_text(src)
+    code = instructions(exe, "main")
+    types = [type(i) for i in code]
+    assert types == [mi.BindSlot, mi.Pop, mi.PushV, mi.Return]
+    assert code[2].operands[0] == 5
+    assert len(compile_text(src, optimise=False).code) > len(exe.code)
+
+
+def test_not_folded():
+    # These can't (or shouldn't) be evaluated at compile time
+    src = """
+fn main(x) {
+  [1 / 0, 1 + "a", 1 && true, x + 1]
+}
+"""
+    exe = compile_text(src)
+    code = instructions(exe, "main")
+    assert [type(i) for i in code].count(mi.PushV) == 7
+
+
+def test_local_slots():
+    exe = compile_text(
+        """
+fn main(a, b) {
+  c = a;
+  b = c;
+  f = lambda(a) { a + c };
+  b
+}
+"""
+    )
+    code = instructions(exe, "main")
+    slots = [(type(i), i.operands[0]) for i in code if isinstance(i, (mi.BindSlot, mi.PushSlot))]
+    assert slots == [
+        (mi.BindSlot, 1),  # b
+        (mi.BindSlot, 0),  # a
+        (mi.PushSlot, 0),  # c = a
+        (mi.BindSlot, 2),
+        (mi.PushSlot, 2),  # b = c
+        (mi.BindSlot, 1),
+        (mi.BindSlot, 3),  # f = ...
+        (mi.PushSlot, 1),  # b
+    ]
+    # The lambda has its own frame, and c isn't local to it
+    lam = exe.code[exe.locations["#0:lambda"] :][:5]
+    assert [type(i) for i in lam] == [mi.BindSlot, mi.Pop, mi.PushB, mi.PushSlot, mi.Plus]
+
+
+def test_local_shadows_global(run_hark):
+    """A local refers to the global of the same name until it's assigned"""
+    src = """
+fn foo() {
+  1
+}
+
+fn main() {
+  a = foo();
+  foo = 10;
+  b = foo;
+  first = 100;
+  [a, b, first]
+}
+
+fn branch(x) {
+  if x {
+    foo = lambda() { 2 }
+  };
+  foo()
+}
+"""
+    exe = compile_text(src)
+    code = instructions(exe, "main")
+    types = [type(i) for i in code]
+    assert types.count(mi.PushSlotOrB) == 3  # foo (twice) and first
+    assert mi.First not in types
+
+    controller, _ = run_hark(src)
+    assert controller.result == [1, 10, 100]
+    controller, _ = run_hark(src, "branch", [mt.TlTrue()])
+    assert controller.result == 2
+    controller, _ = run_hark(src, "branch", [mt.TlFalse()])
+    assert controller.result == 1
+
+
+def test_short_circuit():
+    exe = compile_text("fn main(a, b) { a && b || false && b }")
+    code = instructions(exe, "main")
+    types = [type(i) for i in code[4:-1]]  # without argument binding
+    # ((a && b) || false) -- "false && b" is folded away
+    assert types == [
+        mi.PushSlot,
+        mi.AndJump,
+        mi.PushSlot,
+        mi.OpAnd,
+        mi.OrJump,
+        mi.PushV,
+        mi.OpOr,
+    ]
+    assert code[5].operands[0] == 2
+    assert code[8].operands[0] == 2
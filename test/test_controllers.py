@@ -1,7 +1,12 @@
 """Test Controller features"""
+import time
+from itertools import islice
+
 import pytest
 import hark_lang.controllers.ddb_model as db
 import hark_lang.machine.types as mt
+from hark_lang.executors import coop
+from hark_lang.load import compile_text
 from hark_lang.controllers.ddb import DataController as DdbController
 from hark_lang.controllers.local import DataController as LocalController
 from hark_lang.machine.arec import ActivationRecord
@@ -59,7 +64,6 @@ def test_arec(Controller):
         vmid=0,
         ref_count=0,
         call_site=0,
-        bindings={"foo": mt.TlString("hello")},
     )
     ctrl.set_arec(r, rec)
     rec2 = ctrl.get_arec(r)
@@ -73,6 +77,31 @@ def test_arec(Controller):
     ctrl.decrement_ref(r)
     rec2 = ctrl.get_arec(r)
     assert rec2.ref_count == previous
+    assert ActivationRecord.deserialise(rec2.serialise()) == rec2
+
+
+@pytest.mark.parametrize("Controller", CONTROLLERS)
+def test_locals_kept_over_calls(Controller):
+    """Local variables bound before a call are still set after it returns"""
+    exe = compile_text(
+        """
+fn inc(x) {
+  x + 1
+}
+
+fn main() {
+  a = 1;
+  b = inc(a);
+  a + b
+}
+"""
+    )
+    ctrl = Controller()
+    ctrl.set_executable(exe)
+    vmid = ctrl.toplevel_machine(exe.bindings["main"], [])
+    coop.Invoker(ctrl).invoke(vmid, run_async=False)
+    assert not ctrl.broken
+    assert ctrl.result == 3
 
 
 @pytest.mark.parametrize("Controller", CONTROLLERS)
@@ -90,6 +119,43 @@ def test_state(Controller):
     assert state == ctrl.get_state(t)
 
 
+def test_state_deltas(monkeypatch):
+    """States saved many times (as deltas, and compacted) load correctly"""
+    monkeypatch.setattr(db, "STATE_COMPACT_EVERY", 3)
+    ctrl = NewDdbSession()
+    t = ctrl.new_thread()
+    state = State([mt.TlString("foo")])
+    ctrl.set_state(t, state)
+    for i in range(8):
+        if i % 2:
+            # As if continued by another process
+            state = DdbController.with_session_id(ctrl.session_id).get_state(t)
+        state.ip = i
+        state.ds_push(mt.TlInt(i))
+        if i % 3 == 0:
+            state.ds_pop()
+            state.ds_pop()
+        state.slots = state.slots + [mt.TlInt(i)]
+        state.slots[0] = mt.TlString(str(i))
+        ctrl.set_state(t, state)
+        assert DdbController.with_session_id(ctrl.session_id).get_state(t) == state
+
+
+def test_saved_states_dropped():
+    """The controller doesn't keep the states of stopped threads"""
+    ctrl = NewDdbSession()
+    t = ctrl.new_thread()
+    state = State([mt.TlString("foo")])
+    ctrl.set_state(t, state)
+    ctrl.set_stopped(t, True)
+    assert ctrl._saved_states == {}
+    # Continued later
+    state = ctrl.get_state(t)
+    state.ds_push(mt.TlInt(1))
+    ctrl.set_state(t, state)
+    assert DdbController.with_session_id(ctrl.session_id).get_state(t) == state
+
+
 @pytest.mark.parametrize("Controller", CONTROLLERS)
 def test_probe(Controller):
     ctrl = Controller()
@@ -122,3 +188,25 @@ def test_future(Controller):
     ctrl.add_continuation(t, 5)
     f2 = ctrl.get_future(t)
     assert f2.continuations == [5]
+
+
+def test_check_periods():
+    local = list(islice(LocalController().check_periods(1), 12))
+    assert local[0] < 0.1 and local[-1] == 1
+    # Each DynamoDB check reads META, so it never checks more often than asked
+    assert list(islice(NewDdbSession().check_periods(1), 12)) == [1] * 12
+
+
+def test_stored_values_refreshed(monkeypatch):
+    """Values in the value store outlive the items that refer to them"""
+    monkeypatch.setattr(db, "ITEM_TTL", 100)
+    store = db.DdbValueStore(threshold=100)
+    store.rewrite_after = 50
+    key = store.put(b"some data")
+    expires_on = db.SessionItem.get(db.VALUES_HASH_KEY, key).expires_on
+    assert expires_on >= time.time() + 150 - 1
+    monkeypatch.setattr(time, "time", lambda: expires_on)
+    store.refresh_data(key)
+    assert db.SessionItem.get(db.VALUES_HASH_KEY, key).expires_on >= expires_on + 150
+    with pytest.raises(db.codec.CodecError):
+        store.refresh_data("no such key")
@@ -0,0 +1,87 @@
+"""Test the cooperative executor"""
+import threading
+
+from hark_lang.executors import coop
+from hark_lang.machine.machine import TlMachine
+
+SRC = """
+fn work(n, acc) {
+  if n == 0 {
+    acc
+  } else {
+    work(n - 1, acc + 1)
+  }
+}
+
+fn fan(n, acc) {
+  if n == 0 {
+    acc
+  } else {
+    fan(n - 1, append(acc, async work(50, n)))
+  }
+}
+
+fn sum(futures, acc) {
+  if nullp(futures) {
+    acc
+  } else {
+    sum(rest(futures), acc + await first(futures))
+  }
+}
+
+fn main() {
+  sum(fan(200, []), 0)
+}
+
+fn wait() {
+  await async work(100, 0)
+}
+"""
+
+
+def test_fan_out(run_hark):
+    threads_before = threading.active_count()
+    controller, _ = run_hark(SRC, step_budget=10)
+
+    assert threading.active_count() == threads_before
+    assert controller.all_stopped()
+    assert not controller.broken
+    assert controller.result == sum(range(1, 201)) + 200 * 50
+
+
+class CountingInvoker(coop.Invoker):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.invocations = 0
+
+    def invoke(self, vmid, run_async=True):
+        self.invocations += 1
+        super().invoke(vmid, run_async)
+
+
+def test_continuations_run_inline(run_hark):
+    controller, invoker = run_hark(SRC, executor=CountingInvoker, step_budget=10)
+
+    assert not controller.broken
+    assert controller.result == sum(range(1, 201)) + 200 * 50
+    # main and the 200 forks - main is continued inline, never re-invoked
+    assert invoker.invocations == 201
+
+
+def test_continuations_run_in_new_machines(monkeypatch, run_hark):
+    runs = []
+    run = TlMachine.run
+
+    def recording_run(self, max_steps=None):
+        vmid = self.vmid
+        last = run(self, max_steps)
+        runs.append((self, vmid, last))
+        return last
+
+    monkeypatch.setattr(TlMachine, "run", recording_run)
+    # wait waits for work, which then continues wait itself
+    controller, _ = run_hark(SRC, "wait", step_budget=10)
+
+    assert controller.result == 100
+    assert all(machine.vmid == vmid for machine, vmid, _ in runs)
+    assert any(last is not machine for machine, _, last in runs)
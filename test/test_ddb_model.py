@@ -0,0 +1,57 @@
+"""Test DynamoDB model helpers (that don't need a database)"""
+import pytest
+
+import hark_lang.controllers.ddb_model as db
+from hark_lang.load import compile_text
+
+
+@pytest.fixture
+def exe_cache(monkeypatch):
+    cache = db.OrderedDict()
+    monkeypatch.setattr(db, "_EXE_CACHE", cache)
+    return cache
+
+
+def new_exe(n):
+    return compile_text(f"fn main() {{ {n} }}")
+
+
+@pytest.mark.parametrize("binary", [True, False])
+def test_exe_cached(monkeypatch, exe_cache, binary):
+    monkeypatch.setattr(db, "BINARY", binary)
+    exe = new_exe(1)
+    meta = db.MetaAttribute()
+    db.set_meta_exe(meta, exe)
+    assert meta.exe_hash
+    assert db.get_meta_exe(meta) is exe
+
+    # Same content, same hash
+    other = db.MetaAttribute()
+    db.set_meta_exe(other, new_exe(1))
+    assert other.exe_hash == meta.exe_hash
+
+    # Not cached (e.g. a new process) - deserialised and then cached
+    exe_cache.clear()
+    loaded = db.get_meta_exe(meta)
+    assert loaded is not exe
+    assert loaded.serialise() == exe.serialise()
+    assert db.get_meta_exe(meta) is loaded
+
+
+def test_exe_cache_lru(monkeypatch, exe_cache):
+    monkeypatch.setattr(db, "EXE_CACHE_SIZE", 2)
+    metas = [db.MetaAttribute() for _ in range(3)]
+    for n, meta in enumerate(metas[:2]):
+        db.set_meta_exe(meta, new_exe(n))
+    db.get_meta_exe(metas[0])  # now most recently used
+    db.set_meta_exe(metas[2], new_exe(2))
+    assert list(exe_cache) == [metas[0].exe_hash, metas[2].exe_hash]
+
+
+def test_exe_without_hash(exe_cache):
+    # Stored by an older version
+    exe = new_exe(1)
+    meta = db.MetaAttribute(exe=exe.serialise())
+    assert db.get_meta_exe(meta).serialise() == exe.serialise()
+    assert not exe_cache
+    assert db.get_meta_exe(db.MetaAttribute()) is None
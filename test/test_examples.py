@@ -1,11 +1,13 @@
 import logging
 import random
 import sys
+from functools import partial
 from pathlib import Path
 
 import pytest
 import hark_lang.controllers.ddb_model as db
 import hark_lang.examples as hark_examples
+from hark_lang.machine.machine import ENGINES
 from hark_lang.machine.types import TlType, to_py_type, to_hark_type
 from hark_lang.run.dynamodb import run_ddb_local, run_ddb_processes
 from hark_lang.run.local import run_local
@@ -14,6 +16,7 @@ LOG = logging.getLogger(__name__)
 
 CALL_METHODS = [
     run_local,
+    pytest.param(partial(run_local, concurrency="coop"), id="run_local_coop"),
     pytest.param(run_ddb_local, marks=[pytest.mark.slow, pytest.mark.ddblocal]),
     pytest.param(run_ddb_processes, marks=[pytest.mark.slow, pytest.mark.ddblocal]),
 ]
@@ -57,3 +60,12 @@ def test_example(filename, function, args, expected, call_method):
     assert not isinstance(result, TlType)
 
     assert result == expected
+
+
+@pytest.mark.parametrize("filename,function,args,expected", TESTS, ids=IDS)
+@pytest.mark.parametrize("engine", ENGINES)
+def test_engines(filename, function, args, expected, engine, monkeypatch):
+    """Every execution engine should give the same results"""
+    monkeypatch.setenv("HARK_VM_ENGINE", engine)
+    result = run_local(filename, function, args)
+    assert result == expected
@@ -0,0 +1,74 @@
+"""Test making foreign calls in a process pool"""
+import concurrent.futures
+import os
+from pathlib import Path
+
+import pytest
+
+from hark_lang.controllers.local import DataController
+from hark_lang.machine import foreign, machine
+from hark_lang.machine.types import TlFuturePtr
+
+SRC = """
+import(pid, :python pysrc.main, 0);
+import(bad_fn, :python pysrc.main, 0);
+
+fn main() {
+  a = async pid();
+  b = pid();
+  [await a, b]
+}
+
+fn broken() {
+  bad_fn()
+}
+"""
+
+
+@pytest.fixture(autouse=True)
+def foreign_pool(monkeypatch):
+    # So that the Hark code can import pysrc
+    monkeypatch.syspath_prepend(str(Path(__file__).parent / "examples"))
+    monkeypatch.setattr(foreign, "FOREIGN_PROCESSES", 2)
+
+
+def test_calls_in_pool(run_hark):
+    controller, _ = run_hark(SRC)
+    assert not controller.broken
+    assert controller.all_stopped()
+    assert all(pid != os.getpid() for pid in controller.result)
+    assert [item.text for item in controller.stdout] == ["getting pid\n"] * 2
+
+
+def test_error_in_pool(run_hark):
+    controller, _ = run_hark(SRC, "broken")
+    assert controller.broken
+    (failure,) = controller.get_failures()
+    assert failure.thread == 0
+    assert "Something broke!" in failure.error_msg
+
+
+def test_error_kept_on_future(run_hark):
+    controller, _ = run_hark(SRC, "broken")
+    (future_id,) = [t for t in controller.get_thread_ids() if t != 0]
+    error = controller.get_future(future_id).error
+    assert "Something broke!" in error[0]
+    # Anything else waiting on it gets the error too
+    resolved, value, again = controller.get_or_wait(0, TlFuturePtr(future_id))
+    assert resolved and again == error
+
+
+def test_callback_failure_stops_thread(monkeypatch):
+    controller = DataController()
+    future_id = controller.new_future(stopped=False)
+    call = concurrent.futures.Future()
+    call.set_result(("ok", ""))
+
+    def fail(*args):
+        raise RuntimeError("database down")
+
+    monkeypatch.setattr(controller, "resolve_future", fail)
+    machine._foreign_call_done(controller, None, 0, future_id, call)
+    assert controller.all_stopped()
+    assert controller.broken
+    assert "database down" in controller.get_state(future_id).error_msg
@@ -0,0 +1,57 @@
+"""Test pmap and await_all"""
+import pytest
+
+from hark_lang.machine import types as mt
+
+SRC = """
+fn double(x) {
+  x * 2
+}
+
+fn chunked() {
+  await pmap(double, [1, 2, 3, 4, 5, 6, 7], 3)
+}
+
+fn bad_chunk(size) {
+  pmap(double, [1, 2, 3], size)
+}
+
+fn gather() {
+  futures = [async double(1), async double(2), async double(3), async double(4)];
+  await_all(futures)
+}
+"""
+
+
+def test_pmap_chunks(run_hark, executor):
+    controller, _ = run_hark(SRC, "chunked", executor=executor)
+
+    assert not controller.broken
+    assert controller.result == [2, 4, 6, 8, 10, 12, 14]
+    # chunked, 3 chunks, and the gather future
+    assert len(controller.get_thread_ids()) == 5
+
+
+@pytest.mark.parametrize(
+    "size", [mt.TlString("a"), mt.TlInt(0), mt.TlInt(-2), mt.TlFloat(1.5)]
+)
+def test_pmap_bad_chunk_size(run_hark, size):
+    controller, _ = run_hark(SRC, "bad_chunk", [size])
+
+    assert controller.broken
+    (failure,) = controller.get_failures()
+    assert "Bad pmap chunk size" in failure.error_msg
+    assert "Unexpected Exception" not in failure.error_msg
+
+
+def test_await_all_continues_once(run_hark, executor):
+    controller, _ = run_hark(SRC, "gather", executor=executor)
+
+    assert not controller.broken
+    assert controller.result == [2, 4, 6, 8]
+    runs = [
+        e for e in controller.get_probe_events() if e.thread == 0 and e.event == "run"
+    ]
+    # Run, and continued at most once (in the pool, the futures may all have
+    # resolved before await_all is reached)
+    assert len(runs) <= 2
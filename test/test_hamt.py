@@ -0,0 +1,43 @@
+"""Test the persistent hash map"""
+import random
+
+from hark_lang.machine.hamt import HAMT
+
+
+class Collides:
+    """A key with a fixed hash"""
+
+    def __init__(self, name, h):
+        self.name = name
+        self.h = h
+
+    def __hash__(self):
+        return self.h
+
+    def __eq__(self, other):
+        return isinstance(other, Collides) and self.name == other.name
+
+
+def test_against_dict():
+    rng = random.Random(1)
+    versions = [(HAMT(), {})]
+    for _ in range(2000):
+        hamt, dct = rng.choice(versions)
+        key, value = rng.randint(0, 500), rng.random()
+        versions.append((hamt.set(key, value), {**dct, key: value}))
+
+    for hamt, dct in versions:
+        assert len(hamt) == len(dct)
+        assert dict(hamt.items()) == dct
+        for key in range(0, 500, 7):
+            assert hamt.get(key) == dct.get(key)
+
+
+def test_collisions():
+    a, b, c = Collides("a", 42), Collides("b", 42), Collides("c", 42 + (1 << 40))
+    m1 = HAMT().set(a, 1).set(b, 2)
+    m2 = m1.set(c, 3).set(b, 4)
+    assert (m1.get(a), m1.get(b), m1.get(c)) == (1, 2, None)
+    assert (m2.get(a), m2.get(b), m2.get(c)) == (1, 4, 3)
+    assert len(m1) == 2 and len(m2) == 3
+    assert Collides("a", 42) in m2
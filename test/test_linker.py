@@ -0,0 +1,75 @@
+"""Test linking executables into pre-decoded bytecode"""
+from hark_lang.load import compile_text
+from hark_lang.machine import instructionset as mi
+from hark_lang.machine.instruction import OPCODES
+
+SRC = """
+fn main(x) {
+  if x {
+    "yes"
+  } else {
+    print(other(x))
+  }
+}
+
+fn other(y) {
+  y
+}
+"""
+
+
+def test_link():
+    exe = compile_text(SRC)
+    code = exe.link()
+    assert exe.link() is code  # linked once
+    assert len(code) == len(exe.code)
+
+    for ip, instr in enumerate(exe.code):
+        assert code.source(ip) == tuple(instr.source)
+        if isinstance(instr, mi.PushB):
+            # Globals are resolved to their values
+            assert OPCODES[code.ops[ip]] is mi.PushV
+            assert code.args[ip] == exe.bindings[str(instr.operands[0])]
+            continue
+        assert OPCODES[code.ops[ip]] is type(instr)
+        if isinstance(instr, (mi.Jump, mi.JumpIf)):
+            # Relative jump distances are resolved to absolute targets
+            assert code.args[ip] == ip + 1 + instr.operands[0]
+        elif isinstance(instr, (mi.BindSlot, mi.PushSlot)):
+            assert code.args[ip] == instr.operands[0]
+
+    assert code.locations == exe.locations
+
+
+def test_link_unknown_global():
+    exe = compile_text("fn main() { nope }")
+    code = exe.link()
+    ip = next(i for i, instr in enumerate(exe.code) if isinstance(instr, mi.PushB))
+    # Left for the machine to report
+    assert OPCODES[code.ops[ip]] is mi.PushB
+    assert code.args[ip] == "nope"
+
+
+def test_call_targets():
+    exe = compile_text(SRC + "\nfn indirect(f) { f(1) }\n")
+    code = exe.link()
+    calls = [ip for ip, op in enumerate(code.ops) if OPCODES[op] is mi.Call]
+    assert len(calls) == 2
+    for ip in range(len(code)):
+        if ip == calls[0]:
+            # other(x) - resolved to the entry IP of other
+            assert code.call_targets[ip] == exe.locations["#1:other"]
+        else:
+            # f(1) - only known at run time
+            assert code.call_targets[ip] == -1
+
+
+def test_instructions_rebuilt():
+    src = SRC + "\nfn shadow() { x = other; other = nope; [x, other] }\n"
+    expected = [instr.serialise() for instr in compile_text(src).code]
+    exe = compile_text(src)
+    exe.link()
+    # The instructions aren't kept once linked, but can be rebuilt
+    assert "code" not in vars(exe)
+    assert [instr.serialise() for instr in exe.code] == expected
+    assert exe.serialise() == compile_text(src).serialise()
@@ -0,0 +1,58 @@
+"""Test loading (and caching) compiled Hark files"""
+import pytest
+
+from hark_lang import load
+from hark_lang.machine import instructionset as mi
+
+
+@pytest.fixture(autouse=True)
+def use_cache(monkeypatch):
+    monkeypatch.setattr(load, "USE_CACHE", True)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "prog.hk"
+    path.write_text("fn main(x) {\n  x + 1\n}\n")
+    return path
+
+
+def test_cache_hit(source):
+    exe, cached = load.compile_file_cached(source)
+    assert not cached
+    assert load.cache_path(source).exists()
+    exe2, cached = load.compile_file_cached(source)
+    assert cached
+    assert exe2.serialise() == exe.serialise()
+    # Optimised and unoptimised code are cached separately
+    _, cached = load.compile_file_cached(source, optimise=False)
+    assert not cached
+
+
+def test_cache_invalidated(source):
+    load.compile_file(source)
+    source.write_text("fn main(x) {\n  x - 1\n}\n")
+    exe, cached = load.compile_file_cached(source)
+    assert not cached
+    assert mi.Minus in [type(i) for i in exe.code]
+
+
+@pytest.mark.parametrize("keep", [len(b"\n" + load.codec.MAGIC), 10])
+def test_bad_cache_ignored(source, keep):
+    load.compile_file(source)
+    data = load.cache_path(source).read_bytes()
+    # Truncated, keeping the key and KEEP bytes after it
+    end = data.index(b"\n") + keep
+    load.cache_path(source).write_bytes(data[:end])
+    exe, cached = load.compile_file_cached(source)
+    assert not cached
+    assert mi.Plus in [type(i) for i in exe.code]
+    # ...and replaced
+    _, cached = load.compile_file_cached(source)
+    assert cached
+
+
+def test_cache_disabled(source, monkeypatch):
+    monkeypatch.setattr(load, "USE_CACHE", False)
+    load.compile_file(source)
+    assert not load.cache_path(source).exists()
@@ -0,0 +1,69 @@
+"""Test the thread pool executor"""
+import threading
+import time
+
+from hark_lang.executors import thread
+from hark_lang.run.local import run_local
+
+SRC = """
+fn work(n) {
+  n * 2
+}
+
+fn fan(n, acc) {
+  if n == 0 {
+    acc
+  } else {
+    fan(n - 1, append(acc, async work(n)))
+  }
+}
+
+fn sum(futures, acc) {
+  if nullp(futures) {
+    acc
+  } else {
+    sum(rest(futures), acc + await first(futures))
+  }
+}
+
+fn main() {
+  sum(fan(200, []), 0)
+}
+"""
+
+RESULT = 2 * sum(range(1, 201))
+
+
+def test_bounded_workers(run_hark):
+    threads_before = threading.active_count()
+    controller, invoker = run_hark(SRC, executor=thread.PoolInvoker, max_workers=4)
+
+    assert not controller.broken
+    assert controller.result == RESULT
+    assert len(invoker._workers) <= 4
+    assert threading.active_count() <= threads_before + 4
+    # 200 forks, plus continuations of main
+    assert invoker.metrics.invocations >= 200
+    assert invoker.metrics.max_queue_depth >= 1
+    assert invoker.queue_depth == 0
+
+
+def test_finish_notified(run_hark):
+    start = time.time()
+    # Woken when the last machine stops, not after a check period
+    controller, _ = run_hark(
+        SRC, executor=thread.PoolInvoker, check_period=60, timeout=60, max_workers=4
+    )
+
+    assert time.time() - start < 30
+    assert controller.all_stopped()
+    assert controller.result == RESULT
+
+
+def test_workers_stopped(tmp_path):
+    filename = tmp_path / "fan.hk"
+    filename.write_text(SRC)
+    threads_before = threading.active_count()
+    for _ in range(5):
+        assert run_local(filename, "main", []) == RESULT
+    assert threading.active_count() == threads_before
@@ -0,0 +1,58 @@
+"""Test machine probe levels"""
+import pytest
+
+from hark_lang.exceptions import UserResolvableError
+from hark_lang.executors.thread import Invoker
+from hark_lang.machine.machine import TlMachine
+
+SRC = """
+fn add(x) {
+  x + 1
+}
+
+fn main() {
+  add(1) + add(2)
+}
+"""
+
+
+def run_with_probe(new_session, level):
+    controller, vmid = new_session(SRC)
+    machine = TlMachine(vmid, Invoker(controller), probe_level=level)
+    machine.run()
+    assert controller.result == 5
+    return [e.event for e in controller.get_probe_events()], machine._steps
+
+
+def test_off(new_session):
+    events, _ = run_with_probe(new_session, "off")
+    assert events == []
+
+
+def test_calls(new_session):
+    events, _ = run_with_probe(new_session, "calls")
+    assert "call" in events
+    assert "step" not in events
+
+
+def test_full(new_session):
+    events, steps = run_with_probe(new_session, "full")
+    assert events.count("step") == steps
+
+
+def test_sampled(monkeypatch, new_session):
+    monkeypatch.setenv("HARK_PROBE_SAMPLE_EVERY", "4")
+    events, steps = run_with_probe(new_session, "sampled")
+    assert 0 < events.count("step") < steps
+
+
+def test_bad_level(new_session):
+    with pytest.raises(UserResolvableError):
+        run_with_probe(new_session, "everything")
+
+
+@pytest.mark.parametrize("every", ["0", "-3", "ten", "2.5"])
+def test_bad_sample_every(monkeypatch, new_session, every):
+    monkeypatch.setenv("HARK_PROBE_SAMPLE_EVERY", every)
+    with pytest.raises(UserResolvableError, match="HARK_PROBE_SAMPLE_EVERY"):
+        run_with_probe(new_session, "sampled")
@@ -0,0 +1,39 @@
+"""Test the persistent vector"""
+import random
+
+from hark_lang.machine.pvector import PVector
+
+
+def test_against_list():
+    rng = random.Random(1)
+    versions = [(PVector(), [])]
+    for _ in range(3000):
+        vec, lst = rng.choice(versions)
+        op = rng.random()
+        if op < 0.6:
+            versions.append((vec.append(op), lst + [op]))
+        elif op < 0.8:
+            count = rng.randint(0, len(lst))
+            versions.append((vec.take(count), lst[:count]))
+        else:
+            items = [rng.random() for _ in range(rng.randint(0, 70))]
+            versions.append((vec.extend(items), lst + items))
+
+    for vec, lst in versions:
+        assert len(vec) == len(lst)
+        assert list(vec) == lst
+        for idx in range(0, len(lst), 7):
+            assert vec.get(idx) == lst[idx]
+            assert list(vec.iter_from(idx)) == lst[idx:]
+
+
+def test_sizes():
+    # Around the boundaries of the tail and trie levels
+    for n in [0, 1, 31, 32, 33, 64, 1024, 1055, 1056, 1057, 33 * 1024 + 1]:
+        items = list(range(n))
+        built = PVector(items)
+        appended = PVector().extend(items)
+        for vec in (built, appended):
+            assert list(vec) == items
+            assert list(vec.take(n // 2)) == items[: n // 2]
+            assert list(vec.take(n // 2).append(-1)) == items[: n // 2] + [-1]
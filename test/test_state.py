@@ -0,0 +1,106 @@
+"""Test machine State"""
+import json
+
+import pytest
+
+from hark_lang.machine import codec
+from hark_lang.machine.arec import ActivationRecord
+from hark_lang.machine.executable import Executable
+from hark_lang.machine.hark_serialisable import IncompatibleDataError
+from hark_lang.machine.state import (
+    State,
+    apply_delta,
+    deserialise_delta,
+    serialise_delta,
+    state_delta,
+)
+from hark_lang.machine.types import TlInt, TlList, TlString
+
+
+def new_state():
+    state = State([TlInt(1), TlString("a"), TlList([TlInt(2)])])
+    state.slots = [TlInt(3), None]
+    state.frames = [[TlString("caller")]]
+    state.current_arec_ptr = 1
+    return state
+
+
+def change_stack(state):
+    state.ds_pop()
+    state.ds_push(TlInt(4))
+    state.ds_push(TlInt(5))
+
+
+def change_slots(state):
+    state.slots[1] = TlString("b")
+    state.slots.append(TlInt(6))
+
+
+def new_frame(state):
+    state.frames.append(state.slots)
+    state.slots = [TlInt(7)]
+    state.current_arec_ptr = 2
+
+
+def returned(state):
+    state.slots = list(state.frames.pop())
+    state.current_arec_ptr = 0
+
+
+def stopped(state):
+    state.stopped = True
+    state.error_msg = "oops"
+    state._ds = []
+
+
+@pytest.mark.parametrize("change", [change_stack, change_slots, new_frame, returned, stopped])
+def test_delta(change):
+    old = new_state()
+    new = old.copy()
+    new.ip = 9
+    change(new)
+    assert old == new_state()  # the copy is independent
+
+    delta = state_delta(old, new)
+    restored = old.copy()
+    apply_delta(restored, delta)
+    assert restored == new
+
+    data = json.loads(json.dumps(serialise_delta(delta)))
+    restored = old.copy()
+    apply_delta(restored, deserialise_delta(data))
+    assert restored == new
+
+    restored = old.copy()
+    apply_delta(restored, codec.decode(codec.encode(delta)))
+    assert restored == new
+
+
+def test_delta_is_small():
+    old = State([TlInt(i) for i in range(100)])
+    new = old.copy()
+    new.ds_push(TlInt(100))
+    delta = state_delta(old, new)
+    assert delta["keep"] == 100
+    assert delta["push"] == [TlInt(100)]
+    assert delta["slots"] == []
+    assert delta["push_frames"] == []
+
+
+def test_old_data_rejected():
+    """Data saved with a bindings dict (before slots) is rejected clearly"""
+    old_state = dict(
+        ip=0, stopped=False, ds=[], bindings={}, error_msg=None, current_arec_ptr=0
+    )
+    with pytest.raises(IncompatibleDataError):
+        State.deserialise(old_state)
+
+    old_arec = dict(
+        function=None, vmid=0, bindings={}, ref_count=1, dynamic_chain=None
+    )
+    with pytest.raises(IncompatibleDataError):
+        ActivationRecord.deserialise(old_arec)
+
+    old_exe = dict(locations={}, bindings={}, code=[["Bind", [], None]])
+    with pytest.raises(IncompatibleDataError):
+        Executable.deserialise(old_exe)
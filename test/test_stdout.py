@@ -0,0 +1,75 @@
+"""Test standard output capture"""
+import threading
+from pathlib import Path
+
+import pytest
+
+from hark_lang.machine import machine
+from hark_lang.machine.foreign import captured_stdout
+
+SRC = """
+import(hi, :python pysrc.main, 0);
+import(pid, :python pysrc.main, 0);
+
+fn quiet() {
+  hi();
+  hi()
+}
+
+fn noisy() {
+  pid();
+  pid();
+  print("done")
+}
+"""
+
+
+@pytest.fixture(autouse=True)
+def pysrc(monkeypatch):
+    monkeypatch.syspath_prepend(str(Path(__file__).parent / "examples"))
+
+
+def test_capture_per_thread():
+    outputs = {}
+    barrier = threading.Barrier(4)
+
+    def capture(n):
+        with captured_stdout() as out:
+            barrier.wait()
+            for _ in range(100):
+                print(n)
+        outputs[n] = out.getvalue()
+
+    threads = [threading.Thread(target=capture, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert outputs == {n: f"{n}\n" * 100 for n in range(4)}
+
+
+def test_no_empty_writes(run_hark):
+    controller, _ = run_hark(SRC, "quiet")
+    assert not controller.broken
+    assert controller.stdout == []
+
+
+def test_output_buffered(run_hark):
+    controller, _ = run_hark(SRC, "noisy")
+    assert not controller.broken
+    # Foreign output is written with the next print
+    assert [item.text for item in controller.stdout] == [
+        "getting pid\ngetting pid\ndone\n"
+    ]
+
+
+def test_flush_size(monkeypatch, run_hark):
+    monkeypatch.setattr(machine, "STDOUT_FLUSH_SIZE", 1)
+    controller, _ = run_hark(SRC, "noisy")
+    assert not controller.broken
+    assert [item.text for item in controller.stdout] == [
+        "getting pid\n",
+        "getting pid\n",
+        "done\n",
+    ]
@@ -43,6 +43,19 @@ def test_hashes():
     assert h == deser
 
 
+def test_hash_persistent():
+    a = TlHash({TlString("x"): TlInt(1), TlString("y"): TlInt(2)})
+    b = a.set(TlString("x"), TlInt(3)).set(TlString("z"), TlInt(4))
+    assert a == {"x": 1, "y": 2}
+    assert b == {"x": 3, "y": 2, "z": 4}
+    # Insertion order is kept, and overwriting doesn't move a key
+    assert list(b) == ["x", "y", "z"]
+    assert b.serialise() == to_json_and_back(b).serialise()
+    assert to_py_type(b) == {"x": 3, "y": 2, "z": 4}
+    with pytest.raises(KeyError):
+        a[TlString("z")]
+
+
 def test_lists():
     inner = TlList([TlInt(1), TlInt(31)])
     l = TlList([TlInt(1), TlInt(31), TlString("bla"), inner])
@@ -53,7 +66,7 @@ def test_lists():
 def test_list():
     list_a = TlList([TlInt(1), TlInt(2), TlInt(3)])
     assert len(list_a) == 3
-    list_a.append(TlInt(789))
+    list_a = list_a.appended(TlInt(789))
     assert len(list_a) == 4
     deser = to_json_and_back(list_a)
     print(deser)
@@ -61,6 +74,28 @@ def test_list():
     assert deser[3] == TlInt(789)
 
 
+def test_list_persistent():
+    a = TlList([TlInt(1), TlInt(2)])
+    b = a.appended(TlInt(3))
+    c = a.appended(TlInt(4))  # an older version
+    rest = b[1:]
+    d = rest.appended(TlInt(5))
+    assert a == [1, 2]
+    assert b == [1, 2, 3]
+    assert c == [1, 2, 4]
+    assert rest == [2, 3]
+    assert d == [2, 3, 5]
+    assert b == [1, 2, 3]
+    assert rest[1:][1:] == TlList()
+    assert rest[-1] == 3
+    with pytest.raises(IndexError):
+        rest[2]
+    assert a.extended(rest) == [1, 2, 2, 3]
+    assert [TlInt(0)] + a == [0, 1, 2]
+    assert to_json_and_back(rest) == rest
+    assert to_py_type(d) == [2, 3, 5]
+
+
 def test_quote():
     obj = TlQuote(TlList([TlInt(1), TlString("foo")]))
     deser = to_json_and_back(obj)
@@ -78,6 +113,10 @@ CONVERSION_TEST_OBJS = [
     1,
     "foo",
     ["nested", ["big"], "list"],
+    [1, 2, 3],
+    [1.5, 2.5],
+    [1, 2.5, "mixed", True],
+    {"a": [1, 2], "b": {"c": None}},
     True,
     False,
     None,
@@ -89,3 +128,69 @@ def test_conversion(obj):
     hark_obj = to_hark_type(obj)
     back = to_py_type(hark_obj)
     assert obj == back
+
+
+def test_primitive_lists():
+    hark_obj = to_hark_type([1, 2, 3])
+    assert [type(x) for x in hark_obj] == [TlInt] * 3
+    py_obj = to_py_type(TlList([TlFloat(1.5), TlFloat(2.5)]))
+    assert [type(x) for x in py_obj] == [float, float]
+    # bool is a subclass of int, but isn't a primitive here
+    assert [type(x) for x in to_hark_type([True, False])] == [TlTrue, TlFalse]
+
+
+@pytest.mark.parametrize("obj", CONVERSION_TEST_OBJS)
+def test_views(obj):
+    hark_obj = to_hark_type(obj)
+    view = to_py_view(hark_obj)
+    assert view == obj
+    assert to_py_type(to_hark_type(view)) == obj
+
+
+def test_views_are_lazy():
+    inner = TlList([TlInt(1), TlInt(2)])
+    lst = TlList([inner, TlString("x")])
+    view = to_py_view(lst)
+    assert isinstance(view, ListView)
+    assert isinstance(view[0], ListView)
+    assert view[0][1] == 2 and type(view[0][1]) is int
+    assert view[1:] == ["x"]
+    # Converting back doesn't copy
+    assert to_hark_type(view) is lst
+    assert to_hark_type(view[0]) is inner
+
+    hsh = TlHash({TlString("a"): inner})
+    hview = to_py_view(hsh)
+    assert isinstance(hview, HashView)
+    assert hview["a"] == [1, 2]
+    assert "b" not in hview
+    assert to_hark_type(hview) is hsh
+
+
+@pytest.mark.parametrize(
+    "obj",
+    [
+        TlInt(1),
+        TlFloat(1.5),
+        TlString("a"),
+        TlSymbol("a"),
+        TlTrue(),
+        TlNull(),
+        TlFuturePtr(1),
+        TlQuote(TlInt(1)),
+        TlList([TlInt(1)]),
+        TlHash({TlString("a"): TlInt(1)}),
+        TlFunctionPtr("foo", 1),
+        TlForeignPtr("foo", "bar", "bar.foo"),
+    ],
+)
+def test_no_instance_dict(obj):
+    assert not hasattr(obj, "__dict__")
+    assert to_json_and_back(obj) == obj
+
+
+def test_literal_value():
+    assert TlInt(3).value == 3 and type(TlInt(3).value) is int
+    assert type(TlFloat(3.5).value) is float
+    assert type(TlString("x").value) is str
+    assert TlFuturePtr("x").value == "x"